@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+Throughput benchmarks for the hot paths of the protocol implementation.
+
+example commands:
+./benchmark.py encryption --size 1000000
+./benchmark.py session --size 10000000
+./benchmark.py decode
+"""
+
+import argparse
+import datetime
+import os
+import time
+
+from twisted.test import proto_helpers
+
+from gridagentserver_protocol import encryption
+from gridagentserver_protocol.client_messages import BulkMeasurements
+from gridagentserver_protocol.datatypes import Measurement
+from gridagentserver_protocol.datatypes import MeasurementSet
+from gridagentserver_protocol.datatypes import Meter
+from gridagentserver_protocol.datatypes import MeterData
+from gridagentserver_protocol.messages import BufferReader
+from gridagentserver_protocol.messages import Header
+from gridagentserver_protocol.twisted_protocol import BaseAgentProtocol
+from gridagentserver_protocol.twisted_protocol import BaseAgentProtocolFactory
+from gridagentserver_protocol.twisted_protocol import handshake_struct
+from gridagentserver_protocol.twisted_protocol import uint32
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('benchmarks', nargs='*',
+                    help='benchmarks to run (default: all)')
+parser.add_argument('-s', '--size', type=int, default=1000000,
+                    help='bytes of data per run')
+parser.add_argument('-r', '--repeat', type=int, default=3,
+                    help='number of runs; the best is reported')
+parser.add_argument('--session',
+                    help='file with decrypted data sent by an agent after '
+                    'handshake, to replay instead of generated data')
+parser.add_argument('--segment-size', type=int, default=1448,
+                    help='bytes per dataReceived() call in session replay')
+
+
+def measure(function, repeat):
+    best = None
+    for n in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def report(name, size, elapsed):
+    print '%-40s %8.3f s %10.2f MB/s' % (
+        name, elapsed, size / elapsed / 1000000)
+
+
+def benchmark_encryption(args):
+    key = os.urandom(12)
+    # data arrives in chunks; cf. Protocol.dataReceived()
+    chunk = os.urandom(4096)
+    chunks = args.size // len(chunk)
+    for name, encrypter_class in sorted(encryption.BACKENDS.items()):
+        def run():
+            encrypt = encrypter_class(key)
+            for n in xrange(chunks):
+                encrypt(chunk)
+        report('encryption (%s)' % (name,),
+               chunks * len(chunk), measure(run, args.repeat))
+
+
+class NullEncrypter(object):
+    """
+    Pass-through "encryption"; to measure buffering/parsing separately.
+    """
+    def __init__(self, key):
+        pass
+
+    def __call__(self, data):
+        return data
+
+
+class ReplayProtocol(BaseAgentProtocol):
+    encrypter_class = NullEncrypter
+
+
+class StringBufferReplayProtocol(ReplayProtocol):
+    """
+    Receive buffering by string concatenation and slicing, as done before
+    the bytearray buffer; for comparison.
+    """
+    def dataReceived(self, data):
+        if not self._handshake_done:
+            ReplayProtocol.dataReceived(self, data)
+            self._buffer = ''
+        else:
+            self._buffer += self._decrypt(data)
+            while self.receive_message():
+                pass
+
+    def receive_message(self):
+        if len(self._buffer) < uint32.size:
+            return False
+        length, = uint32.unpack_from(self._buffer)
+        if len(self._buffer) < length:
+            return False
+        message = self._buffer[:length]
+        self._buffer = self._buffer[length:]
+        self.message_received(message)
+        return True
+
+
+def make_session(size):
+    """
+    Make data as sent by an agent uploading a backlog of measurements after
+    an outage; i.e. a sequence of BulkMeasurements of about `size` bytes
+    total.
+    """
+    meters = [Meter(1, n) for n in range(8)]
+    timestamp = datetime.datetime(2014, 1, 1)
+    messages = []
+    total = 0
+    while total < size:
+        meter_data = []
+        for meter in meters:
+            measurement_sets = []
+            for n in range(1000):
+                timestamp += datetime.timedelta(seconds=10)
+                measurement_sets.append(MeasurementSet(timestamp, [
+                    Measurement(1, 1, 0, n * 1000),
+                    Measurement(1, 2, 1, n),
+                    Measurement(1, 7, 2, 230000),
+                ]))
+            meter_data.append(MeterData(meter, measurement_sets))
+        message = BulkMeasurements(meter_data).pack(2)
+        messages.append(message)
+        total += len(message)
+    return ''.join(messages)
+
+
+def benchmark_session(args):
+    if args.session:
+        with open(args.session, 'rb') as f:
+            data = f.read()
+    else:
+        data = make_session(args.size)
+    segments = [data[n:n + args.segment_size]
+                for n in xrange(0, len(data), args.segment_size)]
+    for name, protocol_class in [
+            ('session (bytearray buffer)', ReplayProtocol),
+            ('session (string buffer)', StringBufferReplayProtocol)]:
+        best = None
+        for n in range(args.repeat):
+            factory = BaseAgentProtocolFactory()
+            factory.protocol = protocol_class
+            protocol = factory.buildProtocol(('127.0.0.1', 0))
+            protocol.makeConnection(proto_helpers.StringTransport())
+            protocol.dataReceived(handshake_struct.pack(2, 0x3c970e1e8e4e))
+            start = time.time()
+            for segment in segments:
+                protocol.dataReceived(segment)
+            elapsed = time.time() - start
+            assert protocol.incoming.pending
+            if best is None or elapsed < best:
+                best = elapsed
+        report(name, len(data), best)
+
+
+def benchmark_decode(args):
+    # a single message; make_session() generates messages of about 300 kB
+    data = make_session(1)
+    payload = memoryview(bytearray(data))[Header.struct.size:]
+    count = len(BulkMeasurements.unpack_2(BufferReader(payload)).columns.value)
+    messages = max(args.size // len(data), 1)
+
+    def columns():
+        for n in xrange(messages):
+            BulkMeasurements.unpack_2(BufferReader(payload)).columns
+
+    def objects():
+        for n in xrange(messages):
+            BulkMeasurements.unpack_2(BufferReader(payload)).meter_data
+
+    for name, function in [('decode (columns)', columns),
+                           ('decode (objects)', objects)]:
+        elapsed = measure(function, args.repeat)
+        report(name, messages * len(data), elapsed)
+        print '%-40s %10.0f measurements/s' % (
+            '', messages * count / elapsed)
+
+
+benchmarks = {
+    'decode': benchmark_decode,
+    'encryption': benchmark_encryption,
+    'session': benchmark_session,
+}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for name in args.benchmarks or sorted(benchmarks):
+        benchmarks[name](args)
@@ -1,10 +1,12 @@
 """Messages to be sent from the (virtual) agent to the GridAgent server."""
 
+from itertools import izip
 from struct import Struct
 import logging
 
 from messages import Message, timestamp_to_datetime, datetime_to_timestamp
 from datatypes import Meter, MeterData, MeasurementSet, Measurement, Version
+from datatypes import MeasurementColumns
 
 
 logger = logging.getLogger(__name__)
@@ -35,15 +37,35 @@ def normalise_version(version):
 
 
 class BulkMeasurements(Message):
+    """
+    Measurements from a set of meters.
+
+    Measurement data is available both in object form, as :attr:`meter_data`
+    (see :mod:`datatypes`), and in columnar form, as :attr:`columns`.
+    Messages received with protocol version 2 or later are decoded directly
+    to the columnar form, and the object form is only constructed when
+    accessed.
+    """
     # ID, timestamp, value
     measurement1_struct = Struct('!qIq')
     # type, unit, input_number, value
     measurement2_struct = Struct('!bbbq')
     # connection_type, ID
     meter2_struct = Struct('!bq')
+    # timestamp, measurement count
+    measurement_set2_struct = Struct('!IH')
+
+    # Structs for reading all measurements of a measurement set at once, by
+    # measurement count; only cached for the common, small counts.
+    _measurements2_structs = {}
+    _MEASUREMENTS2_STRUCTS_MAX_CACHED = 256
 
     def __init__(self, meter_data):
-        self.meter_data = meter_data
+        self._meter_data = meter_data
+        self._columns = None
+        # [(meter, [(timestamp, measurement_count), ...]), ...], to construct
+        # meter_data from columns.
+        self._layout = None
 
     def __cmp__(self, other):
         return cmp(self.meter_data, other.meter_data)
@@ -51,6 +73,57 @@ class BulkMeasurements(Message):
     def __hash__(self):
         return hash(self.meter_data)
 
+    @property
+    def meter_data(self):
+        if self._meter_data is None:
+            columns = self._columns
+            measurements = map(
+                Measurement._make,
+                izip(columns.type, columns.unit, columns.input_number,
+                     columns.value))
+            meter_data = []
+            offset = 0
+            for meter, layout_sets in self._layout:
+                measurement_sets = []
+                for timestamp, count in layout_sets:
+                    measurement_sets.append(MeasurementSet(
+                        timestamp, measurements[offset:offset + count]))
+                    offset += count
+                meter_data.append(MeterData(meter, measurement_sets))
+            self._meter_data = meter_data
+        return self._meter_data
+
+    @property
+    def meters(self):
+        """
+        The meters that data is provided for; including meters without
+        measurements.
+        """
+        if self._layout is not None:
+            return [meter for meter, layout_sets in self._layout]
+        return [meter for meter, measurement_sets in self.meter_data]
+
+    @property
+    def columns(self):
+        """
+        The measurements as :class:`datatypes.MeasurementColumns`.
+        """
+        if self._columns is None:
+            columns = MeasurementColumns._make(
+                [] for field in MeasurementColumns._fields)
+            for meter, measurement_sets in self.meter_data:
+                for timestamp, measurements in measurement_sets:
+                    count = len(measurements)
+                    columns.meter.extend([meter] * count)
+                    columns.timestamp.extend([timestamp] * count)
+                    for measurement in measurements:
+                        columns.type.append(measurement.type)
+                        columns.unit.append(measurement.unit)
+                        columns.input_number.append(measurement.input_number)
+                        columns.value.append(measurement.value)
+            self._columns = columns
+        return self._columns
+
     @classmethod
     def unpack(cls, header, read, version):
         if version == 1:
@@ -88,26 +161,52 @@ class BulkMeasurements(Message):
             meter_data.append(MeterData(meter, measurement_sets))
         return cls(meter_data)
 
+    @classmethod
+    def _measurements2_struct(cls, count):
+        try:
+            return cls._measurements2_structs[count]
+        except KeyError:
+            struct = Struct('!' + 'bbbq' * count)
+            if count <= cls._MEASUREMENTS2_STRUCTS_MAX_CACHED:
+                cls._measurements2_structs[count] = struct
+            return struct
+
     @classmethod
     def unpack_2(cls, read):
+        """
+        Decode to columnar form, reading all measurements of each measurement
+        set with a single Struct and converting each distinct timestamp to
+        datetime only once.
+        """
+        columns = MeasurementColumns._make(
+            [] for field in MeasurementColumns._fields)
+        layout = []
+        datetimes = {}
         meter_data_count, = read(uint16)
-        meter_data = []
         for n in range(meter_data_count):
             meter = Meter(*read(cls.meter2_struct))
             measurement_set_count, = read(uint16)
-            measurement_sets = []
+            layout_sets = []
             for m in range(measurement_set_count):
-                timestamp, = read(timestamp_struct)
-                measurement_count, = read(uint16)
-                measurements = []
-                for l in range(measurement_count):
-                    measurements.append(
-                        Measurement(*read(cls.measurement2_struct)))
-                measurement_sets.append(
-                    MeasurementSet(timestamp_to_datetime(timestamp),
-                                   measurements))
-            meter_data.append(MeterData(meter, measurement_sets))
-        return cls(meter_data)
+                timestamp, count = read(cls.measurement_set2_struct)
+                try:
+                    timestamp = datetimes[timestamp]
+                except KeyError:
+                    timestamp = datetimes[timestamp] = \
+                        timestamp_to_datetime(timestamp)
+                layout_sets.append((timestamp, count))
+                values = read(cls._measurements2_struct(count))
+                columns.meter.extend([meter] * count)
+                columns.timestamp.extend([timestamp] * count)
+                columns.type.extend(values[0::4])
+                columns.unit.extend(values[1::4])
+                columns.input_number.extend(values[2::4])
+                columns.value.extend(values[3::4])
+            layout.append((meter, layout_sets))
+        message = cls(None)
+        message._columns = columns
+        message._layout = layout
+        return message
 
     def pack(self, version):
         if version < 2:
@@ -7,6 +7,7 @@ import random
 
 from messages import parse
 from datatypes import MeterData, Meter, MeasurementSet, Measurement
+from datatypes import MeasurementColumns
 import messages
 
 from client_messages import (
@@ -176,6 +177,36 @@ class TestRoundtripVersion2(unittest.TestCase):
         self.assertEqual(message.meter_data, data)
         self.assertEqual(message.__class__, BulkMeasurements)
 
+    def test_bulk_measurements_columns(self):
+        timestamp = messages.timestamp_to_datetime(
+            messages.datetime_to_timestamp(utcsecond()))
+        meter1 = Meter(0, 0xaabbcc)
+        meter2 = Meter(1, 0xccddee)
+        data = [MeterData(meter1,
+                          [MeasurementSet(timestamp,
+                                          [Measurement(0, 0, 5, 123456),
+                                           Measurement(0, 0, 9, 456789)]),
+                           MeasurementSet(timestamp, [])]),
+                MeterData(meter2,
+                          [MeasurementSet(timestamp,
+                                          [Measurement(1, 2, 1, -123)])]),
+                MeterData(Meter(1, 0xeeff), [])]
+        expected = MeasurementColumns(
+            meter=[meter1, meter1, meter2],
+            timestamp=[timestamp] * 3,
+            type=[0, 0, 1],
+            unit=[0, 0, 2],
+            input_number=[5, 9, 1],
+            value=[123456, 456789, -123])
+        self.assertEqual(BulkMeasurements(data).columns, expected)
+        bytes = StringIO()
+        messages.write(bytes, BulkMeasurements(data), 2)
+        bytes.seek(0)
+        message = messages.parse(bytes, 2)
+        self.assertEqual(message.columns, expected)
+        # object form, including empty measurement sets, from columns
+        self.assertEqual(message.meter_data, data)
+
     def test_notification_ga_add_mode(self):
         timestamp = utcsecond()
         in_add_mode = bool(random.randint(0, 1))
@@ -33,6 +33,13 @@ MeasurementSet = namedtuple('MeasurementSet', ['timestamp', 'measurements'])
 Measurement = namedtuple('Measurement',
                          ['type', 'unit', 'input_number', 'value'])
 
+# Columnar form of the same data: one list per field, with one element per
+# measurement.  The meter and timestamp of each measurement set are repeated
+# for each of its measurements.
+MeasurementColumns = namedtuple(
+    'MeasurementColumns',
+    ['meter', 'timestamp', 'type', 'unit', 'input_number', 'value'])
+
 Rule = namedtuple('Rule', ['relay_on', 'start_time', 'end_time'])
 RuleSet = namedtuple('RuleSet', ['override_timeout', 'rules', 'meters'])
 Price = namedtuple('Price', ['start_timestamp', 'end_timestamp', 'price'])
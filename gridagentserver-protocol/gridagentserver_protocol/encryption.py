@@ -1,7 +1,19 @@
-"""ARCFOUR encryption, implemented as partial file object interface."""
+"""
+ARCFOUR encryption, implemented as partial file object interface.
+
+:class:`Encrypter` is the pure Python reference implementation.  Where
+PyCrypto is available, :class:`PyCryptoEncrypter` provides the same cipher
+implemented in C; :data:`DefaultEncrypter` is the fastest backend available,
+and :func:`get_encrypter_class` selects a backend by name.
+"""
 
 import logging
 
+try:
+    from Crypto.Cipher import ARC4
+except ImportError:
+    ARC4 = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -74,6 +86,10 @@ class Encryption(object):
 
 
 class Encrypter(object):
+    """
+    Pure Python ARCFOUR; the reference implementation.  Unlike the other
+    backends, instances support comparison and copying of cipher state.
+    """
     def __init__(self, key):
         key = bytearray(key)
         state = bytearray(range(256))
@@ -118,9 +134,50 @@ class Encrypter(object):
         return hash((self._i, self._j))
 
 
+class PyCryptoEncrypter(object):
+    """
+    ARCFOUR from PyCrypto.  Same interface and output as :class:`Encrypter`,
+    but with the cipher implemented in C.
+    """
+    def __init__(self, key):
+        assert ARC4 is not None, 'PyCrypto not available'
+        self._cipher = ARC4.new(str(bytearray(key)))
+
+    def __call__(self, data):
+        """
+        Encrypt/decrypt data and update the state of the stream cipher.
+        """
+        return self._cipher.encrypt(data)
+
+
+BACKENDS = {
+    'python': Encrypter,
+}
+
+if ARC4 is not None:
+    BACKENDS['pycrypto'] = PyCryptoEncrypter
+    DefaultEncrypter = PyCryptoEncrypter
+else:
+    DefaultEncrypter = Encrypter
+
+
+def get_encrypter_class(backend=None):
+    """
+    Return the encrypter class for the named backend; one of the keys of
+    :data:`BACKENDS`.  Returns :data:`DefaultEncrypter` if no backend is
+    specified.
+    """
+    if backend is None:
+        return DefaultEncrypter
+    try:
+        return BACKENDS[backend]
+    except KeyError:
+        raise ValueError('Encryption backend %r not available' % (backend,))
+
+
 class StreamEncrypter(object):
     def __init__(self, key, stream):
-        self._crypt = Encrypter(key)
+        self._crypt = DefaultEncrypter(key)
         self.stream = stream
 
     def read(self, count):
@@ -1,8 +1,12 @@
+import random
 import unittest
 
 from binascii import a2b_hex
 
+from encryption import BACKENDS
+from encryption import Encrypter
 from encryption import Encryption
+from encryption import get_encrypter_class
 from StringIO import StringIO
 
 
@@ -59,3 +63,34 @@ class TestEncryption(unittest.TestCase):
             encrypt = Encryption(e['key'], estream)
             encrypt.write(e['plain'])
             self.assertEqual(stream.getvalue(), e['plain'])
+
+
+class TestBackends(unittest.TestCase):
+    def test_examples(self):
+        for name, encrypter_class in BACKENDS.items():
+            for e in examples:
+                encrypt = encrypter_class(e['key'])
+                self.assertEqual(encrypt(e['plain']), e['cipher'], name)
+
+    def test_cross_check(self):
+        # compare with reference implementation on random keys and data, fed
+        # in chunks of random size, as in use on a connection
+        rng = random.Random(0)
+        for name, encrypter_class in BACKENDS.items():
+            for n in range(20):
+                key = bytearray(rng.randint(0, 255) for i in range(12))
+                reference = Encrypter(key)
+                encrypt = encrypter_class(key)
+                for m in range(10):
+                    data = ''.join(
+                        chr(rng.randint(0, 255))
+                        for i in range(rng.randint(0, 2000)))
+                    self.assertEqual(encrypt(data), reference(data), name)
+
+    @unittest.skipUnless('pycrypto' in BACKENDS, 'PyCrypto not available')
+    def test_default_is_pycrypto(self):
+        self.assertIs(get_encrypter_class(), BACKENDS['pycrypto'])
+
+    def test_get_encrypter_class(self):
+        self.assertIs(get_encrypter_class('python'), Encrypter)
+        self.assertRaises(ValueError, get_encrypter_class, 'rot13')
@@ -119,6 +119,9 @@ class BufferReader(object):
     """
     Helper class for deserialising data with struct.Struct: Keep track of
     offset for reading, read sequence of same Struct to list.
+
+    Data may be a string or any object supporting the buffer interface, e.g.
+    a memoryview; only raw() copies data.
     """
     def __init__(self, data):
         self.offset = 0
@@ -148,6 +151,8 @@ class BufferReader(object):
             new_offset = len(self.data)
         assert new_offset <= len(self.data)
         result = self.data[self.offset:new_offset]
+        if isinstance(result, memoryview):
+            result = result.tobytes()
         self.offset = new_offset
         return result
 
@@ -6,7 +6,7 @@ from twisted.internet.protocol import Protocol, ServerFactory, connectionDone
 from twisted.internet.defer import DeferredQueue, CancelledError
 
 from . import PROTOCOL_VERSION, SECRET
-from encryption import Encrypter
+from encryption import DefaultEncrypter
 from messages import Header, BufferReader, UnknownMessageTypeError
 
 logger = logging.getLogger(__name__)
@@ -24,9 +24,20 @@ class EncryptedProtocol(Protocol):
     After handshake, messages start with a 4-byte (network byte order) length
     field, and subclasses may receive/parse only complete messages.
 
+    Decrypted data is appended to a bytearray, and complete messages are
+    passed on as memoryview slices of it, so that neither many small messages
+    nor one large message arriving in many segments leads to repeated copying
+    of the buffered data.  The consumed part is only dropped once per
+    dataReceived(), by replacing the buffer, as a bytearray cannot be resized
+    while views of it exist.
+
     (The encryption initialisation protocol is far from perfect, but should
     work...)
+
+    :cvar encrypter_class: The ARC-4 implementation to use; see
+        :func:`encryption.get_encrypter_class`.
     """
+    encrypter_class = DefaultEncrypter
 
     def __init__(self):
         self.other_id = None
@@ -51,9 +62,14 @@ class EncryptedProtocol(Protocol):
             self._buffer += data
             self.receive_handshake()
         else:
-            self._buffer += self._decrypt(data)
-            while self.receive_message():
-                pass
+            self._buffer.extend(self._decrypt(data))
+            try:
+                while self.receive_message():
+                    pass
+            finally:
+                if self._offset:
+                    self._buffer = self._buffer[self._offset:]
+                    self._offset = 0
 
     def connectionLost(self, reason=connectionDone):
         logger.debug('Connection lost, reason: %s', reason)
@@ -66,7 +82,8 @@ class EncryptedProtocol(Protocol):
         logger.debug('Handshake data received')
         handshake_data = self._buffer[0:handshake_struct.size]
         extra_data = self._buffer[handshake_struct.size:]
-        self._buffer = ''
+        self._buffer = bytearray()
+        self._offset = 0
         self.version, self.other_id = handshake_struct.unpack(handshake_data)
         logger.info('Connection from %X, protocol %d',
                      self.other_id, self.version)
@@ -88,24 +105,26 @@ class EncryptedProtocol(Protocol):
         nonce_bytes = bytearray(uint64.pack(self._nonce))
         for i in range(len(nonce_bytes)):
             key_bytes[i] = key_bytes[i] ^ id_bytes[i] ^ nonce_bytes[i]
-        self._encrypt = Encrypter(key_bytes)
-        self._decrypt = Encrypter(key_bytes)
+        self._encrypt = self.encrypter_class(key_bytes)
+        self._decrypt = self.encrypter_class(key_bytes)
 
     def receive_message(self):
-        if len(self._buffer) < uint32.size:
+        available = len(self._buffer) - self._offset
+        if available < uint32.size:
             return False
-        length, = uint32.unpack_from(self._buffer)
-        if len(self._buffer) < length:
+        length, = uint32.unpack_from(self._buffer, self._offset)
+        if available < length:
             return False
-        message = self._buffer[:length]
-        self._buffer = self._buffer[length:]
+        message = memoryview(self._buffer)[
+            self._offset:self._offset + length]
+        self._offset += length
         self.message_received(message)
         return True
 
     def write_encrypted(self, bytes):
         self.transport.write(self._encrypt(bytes))
 
-    # Override this.
+    # Override this.  Data is a memoryview of the receive buffer.
     def message_received(self, data):
         pass
 
@@ -22,6 +22,8 @@ from gridagentserver_protocol.datatypes import (
     Rule,
 )
 
+from . import db
+
 logger = logging.getLogger(__name__)
 
 
@@ -79,7 +81,7 @@ class AmqpProtocol(AMQClient):
         self.connected = True
 
         self.routes_updated()
-        # self.send()
+        self.factory.ready()
 
     def routes_updated(self):
         """
@@ -131,8 +133,11 @@ class AmqpProtocol(AMQClient):
         self.factory.received(item)
         queue.get().addCallback(self._read_item, queue)
 
-    def send(self, routing_key, msg):
-        msg = Content(msg)
+    def send(self, routing_key, msg, content_type=None):
+        if content_type is not None:
+            msg = Content(msg, properties={'content type': content_type})
+        else:
+            msg = Content(msg)
         self.chan.basic_publish(exchange=self.factory.exchange,
                                 routing_key=routing_key,
                                 content=msg)
@@ -191,9 +196,24 @@ class AmqpFactory(protocol.ReconnectingClientFactory):
         if self.p and self.p.connected:
             self.p.routes_updated()
 
-    def send(self, routing_key, msg):
+    def send(self, routing_key, msg, content_type=None):
         if self.p is not None and self.p.connected:
-            self.p.send(routing_key, msg)
+            self.p.send(routing_key, msg, content_type)
+
+    def send_json(self, routing_key, data):
+        self.send(routing_key, json.dumps(data), 'application/json')
+
+    def ready(self):
+        """
+        Called when connected, with queue and routes set up.  Presence
+        announcements sent while disconnected are lost, so re-announce local
+        agents and ask other agent servers to do the same.
+        """
+        self.agentprotocol.announce_presence()
+        self.send_json('agentserver', {
+            'command': 'presence_request',
+            'worker': self.agentprotocol.worker_id,
+        })
 
     def received(self, msg):
         try:
@@ -226,13 +246,43 @@ class AmqpFactory(protocol.ReconnectingClientFactory):
         'gridagent_rules',
         'gridagent_software',
         'gridpoint_software',
+        'inputs_changed',
+        'write_behind_stats',
+        'agent_connected',
+        'agent_disconnected',
+        'presence_request',
     }
 
     def current_agents(self, data):
-        logger.info('Connected agents: %s', [
-            'agent: %s, serial: %s, sw: %s, hw: %s' % (
-                    h.agent_mac, h.serial, h.sw_version, h.hw_revision)
-            for h in self.agentprotocol.handlers.values()])
+        logger.info('Connected agents (%s): %s',
+                    self.agentprotocol.worker_id, [
+                        'agent: %s, serial: %s, sw: %s, hw: %s' % (
+                            h.agent_mac, h.serial, h.sw_version,
+                            h.hw_revision)
+                        for h in self.agentprotocol.handlers.values()])
+        logger.info('Agents connected to other agent servers: %d',
+                    len(self.agentprotocol.presence))
+
+    # Presence of agents on agent servers sharing the AMQP broker; sent to all
+    # agent servers, including the sender.  The "agent_mac" field is used
+    # rather than "agent", as these concern agents not connected locally.
+    def agent_connected(self, data):
+        if data['worker'] != self.agentprotocol.worker_id:
+            self.agentprotocol.remote_register(
+                int(data['agent_mac'], base=16), data['worker'])
+
+    def agent_disconnected(self, data):
+        if data['worker'] != self.agentprotocol.worker_id:
+            self.agentprotocol.remote_unregister(
+                int(data['agent_mac'], base=16), data['worker'])
+
+    def presence_request(self, data):
+        if data['worker'] != self.agentprotocol.worker_id:
+            self.agentprotocol.announce_presence()
+
+    def write_behind_stats(self, data):
+        logger.info('Write-behind: %s', self.agentprotocol.writer.stats())
+        logger.info('Metadata caches: %s', db.cache_stats())
 
     def relay_state(self, agent_mac, handler, data):
         relay_on = data['relay_on']
@@ -287,3 +337,6 @@ class AmqpFactory(protocol.ReconnectingClientFactory):
 
         message = ConfigGaRulesets(rulesets)
         handler.outgoing.put(message)
+
+    def inputs_changed(self, agent_mac, handler, data):
+        db.forget_agent(agent_mac)
@@ -0,0 +1,71 @@
+import json
+
+from mock import Mock
+from mock import patch
+from twisted.trial import unittest
+
+from .amqp import AmqpFactory
+
+
+def message(data):
+    msg = Mock()
+    msg.content.body = json.dumps(data)
+    msg.content.properties = {'content type': 'application/json'}
+    return msg
+
+
+class AmqpFactoryPresenceTestCase(unittest.TestCase):
+    def setUp(self):
+        for target in ['agentserver.amqp.load_spec',
+                       'agentserver.amqp.reactor']:
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.factory = AmqpFactory()
+        self.factory.p = Mock()
+        self.factory.p.connected = True
+        self.factory.agentprotocol = Mock()
+        self.factory.agentprotocol.worker_id = 'local'
+
+    def test_ready_announces_presence(self):
+        self.factory.ready()
+        self.factory.agentprotocol.announce_presence.assert_called_once_with()
+        routing_key, body, content_type = self.factory.p.send.call_args[0]
+        self.assertEqual(routing_key, 'agentserver')
+        self.assertEqual(json.loads(body), {
+            'command': 'presence_request',
+            'worker': 'local',
+        })
+        self.assertEqual(content_type, 'application/json')
+
+    def test_presence_request(self):
+        self.factory.received(message({
+            'command': 'presence_request',
+            'worker': 'other',
+        }))
+        self.factory.agentprotocol.announce_presence.assert_called_once_with()
+
+    def test_own_presence_request_ignored(self):
+        self.factory.received(message({
+            'command': 'presence_request',
+            'worker': 'local',
+        }))
+        self.assertFalse(self.factory.agentprotocol.announce_presence.called)
+
+    def test_agent_connected(self):
+        self.factory.received(message({
+            'command': 'agent_connected',
+            'agent_mac': '00000000beef',
+            'worker': 'other',
+        }))
+        self.factory.agentprotocol.remote_register.assert_called_once_with(
+            0xbeef, 'other')
+
+    def test_agent_disconnected(self):
+        self.factory.received(message({
+            'command': 'agent_disconnected',
+            'agent_mac': '00000000beef',
+            'worker': 'other',
+        }))
+        self.factory.agentprotocol.remote_unregister.assert_called_once_with(
+            0xbeef, 'other')
@@ -5,7 +5,13 @@ Database interface exposing (limited) functionality as functions.
 import logging
 import numbers
 
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
 from legacy.devices.models import Agent, Meter, PhysicalInput, AgentEvent
+from gridplatform.datasources.cache import MetadataCache
+from gridplatform.datasources.models import insert_raw_data
 
 logger = logging.getLogger(__name__)
 
@@ -97,6 +103,170 @@ def get_physicalinput(datatype, agent_unit, input_number, meter):
         return None
 
 
+# Metadata of the meters and physical inputs of agents, shared by the agent
+# connections of this process.  Keys start with the agent MAC; see
+# forget_agent().
+#
+# Meters and physical inputs are only ever created by the agent server, but
+# the agent may be moved to another customer, or physical inputs may stop
+# storing measurements.  Such changes made in this process invalidate the
+# caches through model signals; changes made elsewhere are announced with the
+# "inputs_changed" AMQP message (see legacy.ipc.agentserver.inputs_changed()),
+# and otherwise take effect when the entries expire.
+#
+# {(agent_mac, (connection_type, manufactoring_id)): Meter}
+meter_cache = MetadataCache(ttl=600)
+# {(agent_mac, (datatype, agent_unit, input_number, meter_id)):
+#  (physicalinput_id, store_measurements) or None}
+physicalinput_cache = MetadataCache(maxsize=50000, ttl=600)
+
+
+def get_meters(meter_ids, agent_mac):
+    """
+    Return dictionary from meter id, i.e. `(connection_type,
+    manufactoring_id)`, to Meter for the given meter ids of the given agent,
+    creating meters as necessary.  Meters not cached are loaded in a single
+    query.
+    """
+    keys = set((agent_mac, meter_id) for meter_id in meter_ids)
+    cached = meter_cache.get_many(keys)
+    missing = set(meter_id for mac, meter_id in keys.difference(cached))
+    if missing:
+        agent = get_agent(agent_mac)
+        existing = Meter.objects.filter(
+            agent=agent,
+            customer_id=agent.customer_id,
+            manufactoring_id__in=set(
+                manufactoring_id
+                for connection_type, manufactoring_id in missing),
+        ).order_by('-id')
+        # ordered by descending id; the oldest of any duplicates wins
+        found = {
+            (meter.connection_type, meter.manufactoring_id): meter
+            for meter in existing}
+        loaded = {}
+        for meter_id in missing:
+            if meter_id in found:
+                loaded[(agent_mac, meter_id)] = found[meter_id]
+            else:
+                loaded[(agent_mac, meter_id)] = get_meter(meter_id, agent)
+        meter_cache.set_many(loaded)
+        cached.update(loaded)
+    return {meter_id: cached[(agent_mac, meter_id)] for meter_id in meter_ids}
+
+
+def get_physicalinputs(physicalinput_params, meters, agent_mac):
+    """
+    Return dictionary from `(datatype, agent_unit, input_number, meter_id)`
+    to `(physicalinput_id, store_measurements)` for the given parameter
+    tuples, creating physical inputs as necessary.  Tuples with units not
+    supported are omitted from the result.
+
+    :param meters: Dictionary from meter id to Meter, as returned by
+        get_meters().
+    """
+    keys = set((agent_mac, params) for params in physicalinput_params)
+    cached = physicalinput_cache.get_many(keys)
+    missing = set(params for mac, params in keys.difference(cached))
+    if missing:
+        missing_meters = [
+            meters[meter_id]
+            for meter_id in set(params[3] for params in missing)]
+        existing = PhysicalInput.objects.filter(
+            meter__in=missing_meters,
+        ).order_by('-id').values_list(
+            'id', 'customer', 'meter', 'type', 'unit', 'order',
+            'store_measurements')
+        found = {
+            (customer_id, meter_pk, datatype, unit, order):
+            (physicalinput_id, store_measurements)
+            for (physicalinput_id, customer_id, meter_pk, datatype, unit,
+                 order, store_measurements) in existing}
+        loaded = {}
+        for params in missing:
+            datatype, agent_unit, input_number, meter_id = params
+            meter = meters[meter_id]
+            if agent_unit not in BUCKINGHAM_MAP:
+                logger.warning(
+                    'Unsupported unit %s from meter %d input %d.',
+                    agent_unit, meter.manufactoring_id, input_number)
+                loaded[(agent_mac, params)] = None
+                continue
+            key = (meter.customer_id, meter.id, datatype,
+                   BUCKINGHAM_MAP[agent_unit], input_number)
+            if key in found:
+                loaded[(agent_mac, params)] = found[key]
+            else:
+                physicalinput = get_physicalinput(
+                    datatype, agent_unit, input_number, meter)
+                loaded[(agent_mac, params)] = (
+                    physicalinput.id, physicalinput.store_measurements)
+        physicalinput_cache.set_many(loaded)
+        cached.update(loaded)
+    return {
+        params: cached[(agent_mac, params)]
+        for params in physicalinput_params
+        if cached[(agent_mac, params)] is not None}
+
+
+def forget_agent(agent_mac):
+    """
+    Forget the cached meters and physical inputs of the given agent; e.g.
+    when the agent has been moved, or when the transaction they were loaded
+    or created in failed.
+    """
+    meter_cache.invalidate_if(lambda key, value: key[0] == agent_mac)
+    physicalinput_cache.invalidate_if(lambda key, value: key[0] == agent_mac)
+
+
+def cache_stats():
+    return {
+        'meters': meter_cache.stats(),
+        'physicalinputs': physicalinput_cache.stats(),
+    }
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def _agent_changed(sender, instance, update_fields=None, **kwargs):
+    # The agent server itself only updates state fields of agents.
+    if update_fields is None:
+        forget_agent(instance.mac)
+
+
+@receiver(post_save, sender=Meter)
+@receiver(post_delete, sender=Meter)
+def _meter_changed(sender, instance, update_fields=None, **kwargs):
+    # The agent server itself only updates state and version fields of
+    # meters, and meters are created through get_meters().
+    if update_fields is None and not kwargs.get('created'):
+        meter_cache.invalidate_if(
+            lambda key, value: value.id == instance.id)
+        meter_id = (instance.connection_type, instance.manufactoring_id)
+        physicalinput_cache.invalidate_if(
+            lambda key, value: key[1][3] == meter_id)
+
+
+@receiver(post_save, sender=PhysicalInput)
+@receiver(post_delete, sender=PhysicalInput)
+def _physicalinput_changed(sender, instance, **kwargs):
+    if not kwargs.get('created'):
+        physicalinput_cache.invalidate_if(
+            lambda key, value: value is not None and value[0] == instance.id)
+
+
+def store_raw_data(rows):
+    """
+    Store `(datasource_id, timestamp, value)` rows as RawData, skipping rows
+    already stored; agents reconnecting after an outage may resend
+    measurements.  See
+    :func:`gridplatform.datasources.models.insert_raw_data`.
+
+    :return: The number of rows actually inserted.
+    """
+    return insert_raw_data(rows)
+
+
 def set_meter_state(control_manual, relay_on, online, timestamp,
                     meter_id, agent_mac):
     meter = get_meter(meter_id, agent_mac)
@@ -26,7 +26,17 @@ class Base(Settings):
     TIME_SYNC_INTERVAL = datetime.timedelta(days=1)
     TIME_SYNC_TOLERANCE = 15.0
 
+    # measurements are written in batches shared by all agent connections;
+    # flushed on reaching the batch size or periodically (seconds), and
+    # connections are paused while the queue holds more than the max size
+    WRITE_BEHIND_BATCH_SIZE = 20000
+    WRITE_BEHIND_FLUSH_INTERVAL = 5.0
+    WRITE_BEHIND_MAX_QUEUE_SIZE = 200000
+
     LISTEN_PORT = 30001
+    # number of agent server processes sharing LISTEN_PORT; see
+    # agentserver.workers
+    WORKERS = 1
 
     AMQP_PORT = 5672
     AMQP_VHOST = '/'
@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 import datetime
+import itertools
 import logging
 import traceback
 
@@ -15,6 +16,7 @@ from twisted.internet import threads
 from gridagentserver_protocol import server_messages
 from gridagentserver_protocol.client_messages import AcknowledgementGaSoftware
 from gridagentserver_protocol.client_messages import AcknowledgementGpSoftware
+from gridagentserver_protocol.client_messages import BulkMeasurements
 from gridagentserver_protocol.client_messages import ErrorGaSoftware
 from gridagentserver_protocol.client_messages import ErrorGpSoftware
 from gridagentserver_protocol.server_messages import ConfigGaSoftware
@@ -22,10 +24,11 @@ from gridagentserver_protocol.server_messages import ConfigGpSoftware
 from gridagentserver_protocol.twisted_protocol import BaseAgentProtocol
 from gridagentserver_protocol.twisted_protocol import BaseAgentProtocolFactory
 from legacy.devices.models import Agent
-from legacy.devices.models import RawData
 
 from . import db
 from . import settings
+from .workers import get_worker_id
+from .writebehind import MeasurementWriter
 
 
 logger = logging.getLogger(__name__)
@@ -46,6 +49,9 @@ class AgentProtocol(BaseAgentProtocol):
         self.hw_revision = None
         self.serial = None
         self.poll_response_pending = False
+        # set when disconnected because the agent connected to another agent
+        # server process
+        self.replaced_remotely = False
 
     def pause_sending_after(self, message):
         if isinstance(message, (ConfigGpSoftware, ConfigGaSoftware)):
@@ -70,11 +76,20 @@ class AgentProtocol(BaseAgentProtocol):
 
     # Messages from the "incoming" queue should be handled in background
     # threads for the database access, but one at a time to serialise the
-    # database access per agent connection...
+    # database access per agent connection...  For bulk measurements, the
+    # meters and inputs are resolved in the background thread like for other
+    # messages, while the rows are handed to the write-behind stage shared by
+    # all connections; the next message is processed when they are written.
     def process_message(self, message):
         logger.debug('Processing message %s for %X', message, self.agent_mac)
-        background_task = threads.deferToThread(
-            self.do_process_message, message)
+        if isinstance(message, BulkMeasurements):
+            self.poll_response_pending = False
+            background_task = threads.deferToThread(
+                self.do_process_measurements, message)
+            background_task.addCallback(self.write_measurements)
+        else:
+            background_task = threads.deferToThread(
+                self.do_process_message, message)
 
         # Attach (and possibly immediately call) callback to handle next
         # incoming message as soon as the background processing of the current
@@ -93,11 +108,37 @@ class AgentProtocol(BaseAgentProtocol):
             logger.warning(traceback.format_exc())
             close_connection()
 
+    def do_process_measurements(self, message):
+        """
+        Return the rows to store for the given BulkMeasurements; see
+        measurement_rows().  Runs in a background thread.
+        """
+        try:
+            return self.measurement_rows(message)
+        except DatabaseError as e:
+            logger.warning('DatabaseError on processing measurements: %s', e)
+            logger.warning(traceback.format_exc())
+            close_connection()
+            # meters/inputs created in the failed transaction were rolled back
+            db.forget_agent(self.agent_mac)
+            return []
+
+    def write_measurements(self, rows):
+        """
+        Hand rows to the write-behind stage.  Returns a Deferred fired when
+        they are written.
+        """
+        if not rows:
+            return None
+        return self.factory.writer.put(self, rows)
+
     def register(self):
         logger.info('Agent %X connected', self.other_id)
         old_replaced = BaseAgentProtocol.register(self)
         if old_replaced:
             logger.info('Replaced old handler for %X', self.agent_mac)
+        # the agent may have been changed while disconnected
+        db.forget_agent(self.agent_mac)
         self.store_online(initial=True)
 
     def store_online(self, initial=False):
@@ -121,7 +162,8 @@ class AgentProtocol(BaseAgentProtocol):
 
     def stored_online(self, _ignored=None):
         assert self.agent_mac
-        if self.agent_mac not in self.factory.handlers:
+        if self.agent_mac not in self.factory.handlers and \
+                not self.replaced_remotely:
             # currently offline, so undo setting it online
             self.store_offline()
 
@@ -132,6 +174,9 @@ class AgentProtocol(BaseAgentProtocol):
             return
         if replaced:
             logger.info('Agent %X already reconnected', self.agent_mac)
+        elif self.replaced_remotely:
+            logger.info('Agent %X reconnected to other agent server',
+                        self.agent_mac)
         else:
             logger.info('Agent %X disconnected', self.agent_mac)
             self.store_offline()
@@ -149,6 +194,10 @@ class AgentProtocol(BaseAgentProtocol):
         if self.agent_mac and self.agent_mac in self.factory.handlers:
             # currently online, so undo setting it offline...
             self.store_online()
+        elif self.agent_mac:
+            # announced after storing, so that another agent server holding
+            # a connection for the agent may undo it
+            self.factory.announce('agent_disconnected', self.agent_mac)
 
     def start_periodic(self, _ignored=None):
         logger.debug('Starting periodic tasks for %X', self.agent_mac)
@@ -186,75 +235,47 @@ class AgentProtocol(BaseAgentProtocol):
             self.syncing.stop()
 
     @transaction.commit_on_success
-    def visit_bulk_measurements(self, message):
-        self.poll_response_pending = False
-        meter_ids = set([
-            meter
-            for meter, measurement_sets in message.meter_data])
-        meters = {
-            meter_id: db.get_meter(meter_id, self.agent_mac)
-            for meter_id in meter_ids}
-
-        physicalinput_params = set()
-
-        for meter_id, measurement_sets in message.meter_data:
-            for timestamp, measurements in measurement_sets:
-                for measurement in measurements:
-                    datatype, agent_unit, input_number, value = measurement
-                    physicalinput_params.add(
-                        (datatype, agent_unit, input_number, meter_id))
-        physicalinputs = {
-            (datatype, agent_unit, input_number, meter_id):
-            db.get_physicalinput(
-                datatype, agent_unit, input_number, meters[meter_id])
-            for (datatype, agent_unit, input_number, meter_id)
-            in physicalinput_params
-            if db.get_physicalinput(
-                datatype, agent_unit, input_number, meters[meter_id])
-        }
-
-        result_measurements = []
-
-        for meter_id, measurement_sets in message.meter_data:
-            for timestamp, measurements in measurement_sets:
-                if timestamp.tzinfo is None:
-                    aware_timestamp = timestamp.replace(tzinfo=utc)
-                else:
-                    aware_timestamp = timestamp
-                for measurement in measurements:
-                    datatype, agent_unit, input_number, value = measurement
-                    if (datatype, agent_unit, input_number, meter_id) not in \
-                            physicalinputs:
-                        # Ignore inputs with unsupported units
-                        continue
-                    physicalinput = physicalinputs[
-                        (datatype, agent_unit, input_number, meter_id)]
-                    if aware_timestamp > datetime.datetime.now(utc) + \
-                            datetime.timedelta(days=1):
-                        # FIXME: Temporary workaround for GridLink bug;
-                        # sometimes gives spurious future data.  To be removed
-                        # ASAP, after making/deploying GridLink fix.
-                        # skip storing this wrong data to the database...
-                        continue
-                    if physicalinput.store_measurements:
-                        # FIXME: Temporary work-around for GridAgents reporting
-                        # absolute temperatures in Celsius.
-                        MILLIKELVIN = 6
-                        if agent_unit == MILLIKELVIN:
-                            result_measurements.append(
-                                RawData(
-                                    datasource=physicalinput,
-                                    value=(
-                                        measurement.value +
-                                        WATER_FREEZING_POINT_MILLIKELVIN),
-                                    timestamp=aware_timestamp))
-                        else:
-                            result_measurements.append(
-                                RawData(
-                                    datasource=physicalinput,
-                                    value=measurement.value,
-                                    timestamp=aware_timestamp))
-        RawData.objects.bulk_create(result_measurements)
+    def measurement_rows(self, message):
+        """
+        Return `(physicalinput_id, timestamp, value)` rows to store for the
+        given BulkMeasurements, creating meters and physical inputs as
+        necessary.
+        """
+        columns = message.columns
+        meters = db.get_meters(set(message.meters), self.agent_mac)
+        physicalinput_params = set(itertools.izip(
+            columns.type, columns.unit, columns.input_number, columns.meter))
+        physicalinputs = db.get_physicalinputs(
+            physicalinput_params, meters, self.agent_mac)
+
+        # FIXME: Temporary workaround for GridLink bug; sometimes gives
+        # spurious future data.  To be removed ASAP, after making/deploying
+        # GridLink fix.
+        future_limit = datetime.datetime.now(utc) + datetime.timedelta(days=1)
+        # FIXME: Temporary work-around for GridAgents reporting absolute
+        # temperatures in Celsius.
+        MILLIKELVIN = 6
+
+        result_rows = []
+
+        for meter_id, timestamp, datatype, agent_unit, input_number, value in \
+                itertools.izip(*columns):
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=utc)
+            if timestamp > future_limit:
+                # skip storing this wrong data to the database...
+                continue
+            physicalinput = physicalinputs.get(
+                (datatype, agent_unit, input_number, meter_id))
+            if physicalinput is None:
+                # Ignore inputs with unsupported units
+                continue
+            physicalinput_id, store_measurements = physicalinput
+            if store_measurements:
+                if agent_unit == MILLIKELVIN:
+                    value += WATER_FREEZING_POINT_MILLIKELVIN
+                result_rows.append((physicalinput_id, timestamp, value))
+        return result_rows
 
     @transaction.commit_on_success
     def visit_notification_ga_add_mode(self, message):
@@ -318,10 +339,19 @@ class AgentProtocolFactory(BaseAgentProtocolFactory):
 
     def __init__(self):
         BaseAgentProtocolFactory.__init__(self)
+        self.worker_id = get_worker_id()
+        # {agent_mac: worker_id} for agents connected to other agent servers
+        self.presence = {}
+        self.writer = MeasurementWriter(
+            settings.WRITE_BEHIND_BATCH_SIZE,
+            settings.WRITE_BEHIND_FLUSH_INTERVAL,
+            settings.WRITE_BEHIND_MAX_QUEUE_SIZE)
 
     def register(self, handler):
         result = BaseAgentProtocolFactory.register(self, handler)
         self.amqp.add_route('agent.{:012x}'.format(handler.agent_mac))
+        self.presence.pop(handler.agent_mac, None)
+        self.announce('agent_connected', handler.agent_mac)
         return result
 
     def unregister(self, handler):
@@ -330,8 +360,44 @@ class AgentProtocolFactory(BaseAgentProtocolFactory):
             self.amqp.remove_route('agent.{:012x}'.format(handler.agent_mac))
         return replaced
 
+    def announce(self, command, agent_mac):
+        self.amqp.send_json('agentserver', {
+            'command': command,
+            'agent_mac': '{:012x}'.format(agent_mac),
+            'worker': self.worker_id,
+        })
+
+    def announce_presence(self):
+        for agent_mac in self.handlers:
+            self.announce('agent_connected', agent_mac)
+
+    def remote_register(self, agent_mac, worker_id):
+        """
+        Agent connected to another agent server; any local connection for it
+        is stale.  (With several agent server processes, a reconnect may well
+        be accepted by another process than the one holding the old
+        connection.)
+        """
+        self.presence[agent_mac] = worker_id
+        handler = self.handlers.get(agent_mac, None)
+        if handler is not None:
+            logger.info('Agent %X connected to %s; disconnecting',
+                        agent_mac, worker_id)
+            handler.replaced_remotely = True
+            handler.transport.loseConnection()
+
+    def remote_unregister(self, agent_mac, worker_id):
+        if self.presence.get(agent_mac, None) == worker_id:
+            del self.presence[agent_mac]
+        handler = self.handlers.get(agent_mac, None)
+        if handler is not None:
+            # connected here after being stored offline by the other agent
+            # server; cf. AgentProtocol.stored_offline()
+            handler.store_online()
+
     def startFactory(self):
         logger.info('Started')
+        self.writer.start()
 
     def stopFactory(self):
         logger.info('Stopping')
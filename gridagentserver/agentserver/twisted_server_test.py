@@ -0,0 +1,136 @@
+from mock import Mock
+from mock import patch
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from gridagentserver_protocol.client_messages import BulkMeasurements
+
+from .twisted_server import AgentProtocol
+from .twisted_server import AgentProtocolFactory
+
+
+def run_in_thread(f, *args, **kwargs):
+    return defer.maybeDeferred(f, *args, **kwargs)
+
+
+class AgentProtocolTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = patch(
+            'agentserver.twisted_server.threads.deferToThread',
+            run_in_thread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.proto = AgentProtocol()
+        self.proto.agent_mac = 1
+        self.proto.factory = Mock()
+        self.written = defer.Deferred()
+        self.proto.factory.writer.put.return_value = self.written
+        self.proto.measurement_rows = Mock(return_value=[(1, 2, 3)])
+        self.proto.do_process_message = Mock()
+
+    def test_measurements_written_before_next_message(self):
+        measurements = Mock(spec=BulkMeasurements)
+        state = Mock()
+        self.proto.poll_response_pending = True
+        self.proto.incoming.put(measurements)
+        self.proto.incoming.put(state)
+
+        self.proto.measurement_rows.assert_called_once_with(measurements)
+        self.proto.factory.writer.put.assert_called_once_with(
+            self.proto, [(1, 2, 3)])
+        self.assertFalse(self.proto.poll_response_pending)
+        self.assertFalse(self.proto.do_process_message.called)
+
+        self.written.callback(None)
+        self.proto.do_process_message.assert_called_once_with(state)
+
+    def test_no_measurement_rows(self):
+        self.proto.measurement_rows.return_value = []
+        state = Mock()
+        self.proto.incoming.put(Mock(spec=BulkMeasurements))
+        self.proto.incoming.put(state)
+        self.assertFalse(self.proto.factory.writer.put.called)
+        self.proto.do_process_message.assert_called_once_with(state)
+
+
+class AgentProtocolFactoryPresenceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.factory = AgentProtocolFactory()
+        self.factory.worker_id = 'local'
+        self.factory.amqp = Mock()
+        self.handler = Mock()
+        self.handler.agent_mac = 0xbeef
+        self.handler.replaced_remotely = False
+
+    def test_remote_register(self):
+        self.factory.handlers[0xbeef] = self.handler
+        self.factory.remote_register(0xbeef, 'other')
+        self.assertEqual(self.factory.presence, {0xbeef: 'other'})
+        self.assertTrue(self.handler.replaced_remotely)
+        self.handler.transport.loseConnection.assert_called_once_with()
+
+    def test_remote_register_not_connected(self):
+        self.factory.remote_register(0xbeef, 'other')
+        self.assertEqual(self.factory.presence, {0xbeef: 'other'})
+        self.assertFalse(self.handler.replaced_remotely)
+
+    def test_remote_unregister(self):
+        self.factory.remote_register(0xbeef, 'other')
+        # a stale disconnect from a third agent server
+        self.factory.remote_unregister(0xbeef, 'third')
+        self.assertEqual(self.factory.presence, {0xbeef: 'other'})
+        self.factory.remote_unregister(0xbeef, 'other')
+        self.assertEqual(self.factory.presence, {})
+
+    def test_remote_unregister_connected(self):
+        self.factory.handlers[0xbeef] = self.handler
+        self.factory.remote_unregister(0xbeef, 'other')
+        self.handler.store_online.assert_called_once_with()
+
+    def test_register_clears_presence(self):
+        self.factory.remote_register(0xbeef, 'other')
+        self.handler.transport.connected = False
+        self.factory.register(self.handler)
+        self.assertEqual(self.factory.presence, {})
+        self.factory.amqp.add_route.assert_called_once_with(
+            'agent.00000000beef')
+        self.factory.amqp.send_json.assert_called_once_with(
+            'agentserver', {
+                'command': 'agent_connected',
+                'agent_mac': '00000000beef',
+                'worker': 'local',
+            })
+
+    def test_announce_presence(self):
+        self.factory.handlers[0xbeef] = self.handler
+        self.factory.handlers[0xcafe] = Mock()
+        self.factory.announce_presence()
+        self.assertEqual(
+            sorted(args[1]['agent_mac'] for args, kwargs
+                   in self.factory.amqp.send_json.call_args_list),
+            ['00000000beef', '00000000cafe'])
+        for args, kwargs in self.factory.amqp.send_json.call_args_list:
+            self.assertEqual(args[0], 'agentserver')
+            self.assertEqual(args[1]['command'], 'agent_connected')
+            self.assertEqual(args[1]['worker'], 'local')
+
+
+class AgentProtocolReplacedRemotelyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.proto = AgentProtocol()
+        self.proto.agent_mac = 0xbeef
+        self.proto.other_id = 0xbeef
+        self.proto.factory = Mock()
+        self.proto.factory.handlers = {}
+        self.proto.factory.unregister.return_value = False
+        self.proto.store_offline = Mock()
+
+    def test_not_stored_offline(self):
+        self.proto.replaced_remotely = True
+        self.proto.unregister()
+        self.proto.stored_online()
+        self.assertFalse(self.proto.store_offline.called)
+
+    def test_stored_offline(self):
+        self.proto.unregister()
+        self.proto.store_offline.assert_called_once_with()
@@ -0,0 +1,146 @@
+"""
+Multi-process mode: a supervising process owns the listening socket and
+starts a number of worker processes, each accepting agent connections on the
+shared socket and handling them as a complete agent server of its own.
+
+Each worker binds the AMQP routing keys of the agents it holds, so commands
+for an agent reach the worker holding it.  Workers announce connected agents
+on the shared "agentserver" routing key; see AgentProtocolFactory.
+"""
+import logging
+import os
+import signal
+import socket
+import sys
+
+from twisted.application import service
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+
+logger = logging.getLogger(__name__)
+
+
+# environment variables through which the supervising process configures
+# worker processes
+LISTEN_FD_ENV = 'AGENTSERVER_LISTEN_FD'
+WORKER_ID_ENV = 'AGENTSERVER_WORKER_ID'
+
+RESPAWN_DELAY = 5.0
+
+
+def get_worker_id():
+    """
+    Identifier of this agent server process; unique among the agent servers
+    sharing an AMQP broker.
+    """
+    return os.environ.get(WORKER_ID_ENV) or \
+        '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def get_listen_fd():
+    """
+    The file descriptor of the listening socket to adopt, if this is a worker
+    process; otherwise None.
+    """
+    fd = os.environ.get(LISTEN_FD_ENV)
+    if fd is not None:
+        return int(fd)
+    return None
+
+
+class AdoptedPortService(service.Service):
+    """
+    Accept connections for `factory` on the inherited listening socket `fd`.
+    """
+    def __init__(self, fd, factory):
+        self.fd = fd
+        self.factory = factory
+        self._port = None
+
+    def startService(self):
+        service.Service.startService(self)
+        self._port = reactor.adoptStreamPort(
+            self.fd, socket.AF_INET, self.factory)
+        # the supervisor keeps the socket open; our copy is no longer needed
+        os.close(self.fd)
+
+    def stopService(self):
+        service.Service.stopService(self)
+        if self._port is not None:
+            return self._port.stopListening()
+
+
+class WorkerProcessProtocol(protocol.ProcessProtocol):
+    def __init__(self, pool, number):
+        self.pool = pool
+        self.number = number
+        self.ended = defer.Deferred()
+
+    def processEnded(self, reason):
+        self.pool.worker_ended(self.number, reason)
+        self.ended.callback(None)
+
+
+class WorkerPoolService(service.Service):
+    """
+    Listen on `port` and keep `workers` worker processes, each running
+    `tac_file` with twistd, accepting connections on the listening socket.
+    """
+    def __init__(self, port, workers, tac_file):
+        self.port = port
+        self.workers = workers
+        self.tac_file = tac_file
+        self._socket = None
+        self._processes = {}
+
+    def startService(self):
+        service.Service.startService(self)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('', self.port))
+        self._socket.listen(socket.SOMAXCONN)
+        self._socket.setblocking(False)
+        for number in range(self.workers):
+            self._spawn(number)
+
+    def _spawn(self, number):
+        if not self.running:
+            return
+        fd = self._socket.fileno()
+        env = dict(os.environ)
+        env[LISTEN_FD_ENV] = str(fd)
+        env[WORKER_ID_ENV] = '{}:{}:{}'.format(
+            socket.gethostname(), os.getpid(), number)
+        args = [
+            sys.executable, '-c',
+            'from twisted.scripts.twistd import run; run()',
+            '--nodaemon',
+            '--pidfile=',
+            '--logfile=twistd-worker-{}.log'.format(number),
+            '--python={}'.format(self.tac_file),
+        ]
+        process_protocol = WorkerProcessProtocol(self, number)
+        reactor.spawnProcess(
+            process_protocol, sys.executable, args, env=env,
+            childFDs={0: 0, 1: 1, 2: 2, fd: fd})
+        self._processes[number] = process_protocol
+        logger.info('Started worker %d', number)
+
+    def worker_ended(self, number, reason):
+        del self._processes[number]
+        if self.running:
+            logger.warning('Worker %d ended: %s; restarting',
+                           number, reason.getErrorMessage())
+            reactor.callLater(RESPAWN_DELAY, self._spawn, number)
+        else:
+            logger.info('Worker %d stopped', number)
+
+    def stopService(self):
+        service.Service.stopService(self)
+        ended = []
+        for process_protocol in self._processes.values():
+            ended.append(process_protocol.ended)
+            process_protocol.transport.signalProcess(signal.SIGTERM)
+        self._socket.close()
+        return defer.DeferredList(ended)
@@ -0,0 +1,94 @@
+import os
+import signal
+
+from mock import Mock
+from mock import patch
+from twisted.python import failure
+from twisted.trial import unittest
+
+from . import workers
+from .workers import LISTEN_FD_ENV
+from .workers import RESPAWN_DELAY
+from .workers import WORKER_ID_ENV
+from .workers import WorkerPoolService
+from .workers import get_listen_fd
+from .workers import get_worker_id
+
+
+class EnvironmentTestCase(unittest.TestCase):
+    def test_worker_id(self):
+        with patch.dict(os.environ, {WORKER_ID_ENV: 'host:1:0'}):
+            self.assertEqual(get_worker_id(), 'host:1:0')
+
+    def test_worker_id_single_process(self):
+        with patch.dict(os.environ, clear=True):
+            self.assertEqual(
+                get_worker_id().split(':')[-1], str(os.getpid()))
+
+    def test_listen_fd(self):
+        with patch.dict(os.environ, {LISTEN_FD_ENV: '7'}):
+            self.assertEqual(get_listen_fd(), 7)
+        with patch.dict(os.environ, clear=True):
+            self.assertIsNone(get_listen_fd())
+
+
+class WorkerPoolServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(workers, 'reactor')
+        self.reactor = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = WorkerPoolService(0, 2, 'agentserver.tac')
+        self.service.startService()
+        self.addCleanup(self.service._socket.close)
+
+    def spawned(self):
+        return [
+            (args[0], kwargs)
+            for args, kwargs in self.reactor.spawnProcess.call_args_list]
+
+    def test_spawn(self):
+        fd = self.service._socket.fileno()
+        spawned = self.spawned()
+        self.assertEqual(len(spawned), 2)
+        for number, (process_protocol, kwargs) in enumerate(spawned):
+            self.assertEqual(process_protocol.number, number)
+            self.assertEqual(kwargs['env'][LISTEN_FD_ENV], str(fd))
+            self.assertTrue(
+                kwargs['env'][WORKER_ID_ENV].endswith(':{}'.format(number)))
+            self.assertEqual(kwargs['childFDs'][fd], fd)
+        self.assertEqual(
+            self.service._processes,
+            dict((number, process_protocol)
+                 for number, (process_protocol, _) in enumerate(spawned)))
+
+    def test_respawn(self):
+        process_protocol, _ = self.spawned()[1]
+        process_protocol.processEnded(failure.Failure(Exception('crashed')))
+        self.assertTrue(process_protocol.ended.called)
+        self.assertNotIn(1, self.service._processes)
+        self.reactor.callLater.assert_called_once_with(
+            RESPAWN_DELAY, self.service._spawn, 1)
+
+        self.service._spawn(1)
+        process_protocol, _ = self.spawned()[2]
+        self.assertEqual(process_protocol.number, 1)
+        self.assertIs(self.service._processes[1], process_protocol)
+
+    def test_stop(self):
+        processes = [
+            process_protocol for process_protocol, _ in self.spawned()]
+        for process_protocol in processes:
+            process_protocol.transport = Mock()
+        stopped = self.service.stopService()
+        for process_protocol in processes:
+            process_protocol.transport.signalProcess.assert_called_once_with(
+                signal.SIGTERM)
+        self.assertFalse(stopped.called)
+        for process_protocol in processes:
+            process_protocol.processEnded(
+                failure.Failure(Exception('terminated')))
+        self.assertTrue(stopped.called)
+        # stopped workers are not respawned
+        self.assertFalse(self.reactor.callLater.called)
+        self.service._spawn(0)
+        self.assertEqual(self.reactor.spawnProcess.call_count, 2)
@@ -0,0 +1,198 @@
+"""
+Write-behind stage for measurements from all agent connections.
+
+Measurement rows are queued in the reactor thread and written to the database
+in large batches spanning many agents; a batch is flushed when it reaches a
+certain number of measurements or periodically.  Writing happens in a
+dedicated thread, one batch at a time, in a single transaction per batch.
+
+The rows are resolved from bulk measurements by the connection, in the
+thread processing its messages one at a time; the connection does not process
+further messages until its rows are written.  See AgentProtocol.
+
+When the queue grows beyond its bound, the connections adding to it stop
+being read from until a flush brings the queue below the bound again.
+"""
+import logging
+import time
+import traceback
+
+from django.db import close_connection
+from django.db import transaction
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.internet import threads
+from twisted.python.threadpool import ThreadPool
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+
+class MeasurementWriter(object):
+    """
+    :ivar batch_size: Number of queued measurements to trigger a flush.
+    :ivar flush_interval: Seconds between periodic flushes.
+    :ivar max_queue_size: Number of queued measurements at which connections
+        adding to the queue are paused.
+    """
+    def __init__(self, batch_size, flush_interval, max_queue_size):
+        assert batch_size <= max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        # [(handler, rows, time queued, deferred), ...]
+        self._queue = []
+        self._queued_measurements = 0
+        self._paused = set()
+        self._flushing = None
+        self._threadpool = ThreadPool(1, 1, 'writebehind')
+        self._periodic = task.LoopingCall(self.flush)
+        # statistics
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.measurements_flushed = 0
+        self.rows_inserted = 0
+        self.last_batch_size = 0
+        self.last_flush_duration = None
+        self.last_flush_latency = None
+        self.max_flush_latency = None
+
+    def start(self):
+        self._threadpool.start()
+        self._periodic.start(self.flush_interval, now=False)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+
+    @defer.inlineCallbacks
+    def stop(self):
+        """
+        Flush whatever is queued and stop.  Returns a Deferred.
+        """
+        if self._periodic.running:
+            self._periodic.stop()
+        while self._flushing is not None or self._queue:
+            if self._flushing is not None:
+                yield self._flushing
+            else:
+                yield self.flush()
+        self._threadpool.stop()
+
+    def put(self, handler, rows):
+        """
+        Queue `(physicalinput_id, timestamp, value)` rows received on the
+        connection `handler`.  Called in the reactor thread.  Returns a
+        Deferred fired when the flush including the rows is done; whether or
+        not the rows were written.
+        """
+        d = defer.Deferred()
+        self._queue.append((handler, rows, time.time(), d))
+        self._queued_measurements += len(rows)
+        if self._queued_measurements >= self.batch_size:
+            self.flush()
+        if self._queued_measurements >= self.max_queue_size and \
+                handler not in self._paused:
+            logger.info('Write-behind queue full; pausing %X',
+                        handler.agent_mac)
+            handler.transport.pauseProducing()
+            self._paused.add(handler)
+        return d
+
+    def flush(self):
+        """
+        Write currently queued measurements in the background, unless a flush
+        is already in progress.  Returns a Deferred.
+        """
+        if self._flushing is not None or not self._queue:
+            return defer.succeed(None)
+        batch = self._queue
+        count = self._queued_measurements
+        self._queue = []
+        self._queued_measurements = 0
+        started = time.time()
+        d = threads.deferToThreadPool(
+            reactor, self._threadpool, self._write, batch)
+        d.addCallback(self._written, batch, count, started)
+        d.addErrback(self._failed)
+        d.addBoth(self._flushed, batch)
+        self._flushing = d
+        return d
+
+    def stats(self):
+        return {
+            'queue_depth': self._queued_measurements,
+            'queued_messages': len(self._queue),
+            'paused_connections': len(self._paused),
+            'flushing': self._flushing is not None,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'measurements_flushed': self.measurements_flushed,
+            'rows_inserted': self.rows_inserted,
+            'last_batch_size': self.last_batch_size,
+            'last_flush_duration': self.last_flush_duration,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency,
+        }
+
+    def _write(self, batch):
+        """
+        Write batch in a single transaction; on failure, fall back to a
+        transaction per message, so that one bad message does not lose the
+        entire batch.  Runs in the write-behind thread.  Returns the number
+        of rows inserted.
+        """
+        try:
+            return self._write_transaction(batch)
+        except Exception as e:
+            logger.warning('Error writing batch; retrying per message: %s', e)
+            logger.debug(traceback.format_exc())
+            close_connection()
+        inserted = 0
+        for queued in batch:
+            try:
+                inserted += self._write_transaction([queued])
+            except Exception as e:
+                handler = queued[0]
+                logger.warning('Error writing measurements from %X: %s',
+                               handler.agent_mac, e)
+                logger.warning(traceback.format_exc())
+                close_connection()
+        return inserted
+
+    def _write_transaction(self, batch):
+        with transaction.commit_on_success():
+            return db.store_raw_data(
+                row for handler, rows, queued, d in batch for row in rows)
+
+    def _written(self, inserted, batch, count, started):
+        now = time.time()
+        latency = now - min(queued for handler, rows, queued, d in batch)
+        self.flushes += 1
+        self.measurements_flushed += count
+        self.rows_inserted += inserted
+        self.last_batch_size = count
+        self.last_flush_duration = now - started
+        self.last_flush_latency = latency
+        if self.max_flush_latency is None or \
+                latency > self.max_flush_latency:
+            self.max_flush_latency = latency
+        logger.debug('Wrote %d measurements from %d messages in %.3f s',
+                     count, len(batch), self.last_flush_duration)
+
+    def _failed(self, failure):
+        self.failed_flushes += 1
+        logger.error('Write-behind flush failed: %s', failure)
+
+    def _flushed(self, _ignored, batch):
+        self._flushing = None
+        if self._queued_measurements < self.max_queue_size:
+            for handler in self._paused:
+                if handler.transport.connected:
+                    logger.info('Resuming %X', handler.agent_mac)
+                    handler.transport.resumeProducing()
+            self._paused.clear()
+        if self._queued_measurements >= self.batch_size:
+            self.flush()
+        # last, as the connections may go on to queue more
+        for handler, rows, queued, d in batch:
+            d.callback(None)
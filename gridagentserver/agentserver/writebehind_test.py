@@ -0,0 +1,134 @@
+import threading
+
+from mock import MagicMock
+from mock import Mock
+from mock import patch
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from .writebehind import MeasurementWriter
+
+
+def make_handler(agent_mac):
+    handler = Mock()
+    handler.agent_mac = agent_mac
+    handler.transport.connected = True
+    return handler
+
+
+class MeasurementWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.writer = MeasurementWriter(
+            batch_size=4, flush_interval=60.0, max_queue_size=6)
+        self.writer._threadpool.start()
+        self.addCleanup(self.writer._threadpool.stop)
+
+        # each row is stored as inserted, unless its value is 'bad'
+        self.stored = []
+
+        def store_raw_data(rows):
+            rows = list(rows)
+            if any(value == 'bad' for _, _, value in rows):
+                raise Exception('bad row')
+            self.stored.append(rows)
+            return len(rows)
+
+        self.store_raw_data = Mock(side_effect=store_raw_data)
+        transaction = MagicMock()
+        transaction.commit_on_success.return_value.__exit__.return_value = \
+            False
+        for target, replacement in [
+                ('agentserver.writebehind.db.store_raw_data',
+                 self.store_raw_data),
+                ('agentserver.writebehind.close_connection', Mock()),
+                ('agentserver.writebehind.transaction', transaction)]:
+            patcher = patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def rows(self, count, value=1):
+        return [(1, n, value) for n in range(count)]
+
+    @defer.inlineCallbacks
+    def test_flush_on_batch_size(self):
+        handler = make_handler(1)
+        first = self.writer.put(handler, self.rows(2))
+        self.assertFalse(first.called)
+        self.assertEqual(self.writer.stats()['queue_depth'], 2)
+        second = self.writer.put(handler, self.rows(2))
+        self.assertEqual(self.writer.stats()['queue_depth'], 0)
+        self.assertTrue(self.writer.stats()['flushing'])
+        yield defer.gatherResults([first, second])
+        self.assertEqual(self.store_raw_data.call_count, 1)
+        self.assertEqual(len(self.stored[0]), 4)
+
+    @defer.inlineCallbacks
+    def test_flush(self):
+        handler = make_handler(1)
+        d = self.writer.put(handler, self.rows(1))
+        yield self.writer.flush()
+        self.assertTrue(d.called)
+        self.assertEqual(self.stored, [self.rows(1)])
+
+    @defer.inlineCallbacks
+    def test_flush_empty(self):
+        yield self.writer.flush()
+        self.assertFalse(self.store_raw_data.called)
+        self.assertEqual(self.writer.stats()['flushes'], 0)
+
+    @defer.inlineCallbacks
+    def test_retry_per_message(self):
+        good = self.writer.put(make_handler(1), self.rows(1))
+        bad = self.writer.put(make_handler(2), self.rows(1, 'bad'))
+        yield self.writer.flush()
+        # the batch, then each message on its own
+        self.assertEqual(self.store_raw_data.call_count, 3)
+        self.assertEqual(self.stored, [self.rows(1)])
+        self.assertTrue(good.called)
+        self.assertTrue(bad.called)
+        stats = self.writer.stats()
+        self.assertEqual(stats['flushes'], 1)
+        self.assertEqual(stats['failed_flushes'], 0)
+        self.assertEqual(stats['measurements_flushed'], 2)
+        self.assertEqual(stats['rows_inserted'], 1)
+
+    @defer.inlineCallbacks
+    def test_pause_producing(self):
+        release = threading.Event()
+        store_raw_data = self.store_raw_data.side_effect
+
+        def blocking_store_raw_data(rows):
+            release.wait()
+            return store_raw_data(rows)
+        self.store_raw_data.side_effect = blocking_store_raw_data
+        self.addCleanup(release.set)
+
+        first_handler = make_handler(1)
+        second_handler = make_handler(2)
+        # flushed at once, but blocked in the write-behind thread
+        first = self.writer.put(first_handler, self.rows(4))
+        second = self.writer.put(second_handler, self.rows(6))
+        self.assertFalse(first_handler.transport.pauseProducing.called)
+        second_handler.transport.pauseProducing.assert_called_once_with()
+        self.assertEqual(self.writer.stats()['paused_connections'], 1)
+
+        # let the flushes complete in the write-behind thread
+        release.set()
+        yield defer.gatherResults([first, second])
+        second_handler.transport.resumeProducing.assert_called_once_with()
+        stats = self.writer.stats()
+        self.assertEqual(stats['paused_connections'], 0)
+        self.assertEqual(stats['flushes'], 2)
+        self.assertEqual(stats['measurements_flushed'], 10)
+        self.assertEqual(stats['rows_inserted'], 10)
+        self.assertEqual(stats['last_batch_size'], 6)
+        self.assertIsNotNone(stats['max_flush_latency'])
+
+    @defer.inlineCallbacks
+    def test_stop_flushes(self):
+        handler = make_handler(1)
+        d = self.writer.put(handler, self.rows(1))
+        self.writer._threadpool.stop = Mock()
+        yield self.writer.stop()
+        self.assertTrue(d.called)
+        self.assertEqual(self.stored, [self.rows(1)])
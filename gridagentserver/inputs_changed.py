@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+# dry-run example command:
+# ./inputs_changed.py -n -v 00:24:21:0e:8f:cd
+
+import argparse
+
+from client import normalise_mac, send_message
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('agent', help='target agent (MAC address)')
+parser.add_argument('-v', '--verbose', action='store_true',
+                    help='increase output verbosity')
+parser.add_argument('-n', '--dry-run', action='store_true',
+                    help='don\'t actually send command')
+
+
+def inputs_changed(args):
+    agent_mac = normalise_mac(args.agent)
+    routing_key = 'agent.%s' % (agent_mac,)
+    message = {
+        'command': 'inputs_changed',
+        'agent': agent_mac,
+    }
+    send_message(routing_key, message, args.verbose, args.dry_run)
+
+
+if __name__ == '__main__':
+    inputs_changed(parser.parse_args())
@@ -0,0 +1,13 @@
+#!/bin/bash
+
+cd `dirname $0`
+
+export DJANGO_SETTINGS_MODULE=agentserver.settings
+export DJANGO_CONFIGURATION=${DJANGO_CONFIGURATION:-Dev}
+
+# unit test library from twisted; with the settings installed as for
+# agentserver.tac
+python -c 'import configurations.importer
+configurations.importer.install()
+from twisted.scripts.trial import run
+run()' agentserver
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+# dry-run example command:
+# ./write_behind_stats.py -n -v
+
+import argparse
+
+from client import send_message
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-v', '--verbose', action='store_true',
+                    help='increase output verbosity')
+parser.add_argument('-n', '--dry-run', action='store_true',
+                    help='don\'t actually send command')
+
+
+def write_behind_stats(args):
+    routing_key = 'agentserver'
+    message = {
+        'command': 'write_behind_stats',
+    }
+    send_message(routing_key, message, args.verbose, args.dry_run)
+
+
+if __name__ == '__main__':
+    write_behind_stats(parser.parse_args())
@@ -263,6 +263,11 @@ datasource_routes.register(
     r'raw_data',
     gridplatform.datasources.viewsets.RawDataViewSet,
     filter_by='datasource_id')
+datasource_routes.register(
+    r'bulk_raw_data',
+    gridplatform.datasources.viewsets.RawDataBulkViewSet,
+    filter_by='datasource_id',
+    base_name='datasources:rawdatabulk')
 datasource_routes.register(
     r'datasource',
     gridplatform.datasources.viewsets.DataSourceViewSet)
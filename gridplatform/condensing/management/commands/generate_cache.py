@@ -7,32 +7,109 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 
+from collections import defaultdict
 from optparse import make_option
 import datetime
+import itertools
+import multiprocessing
+import time
 
 from django.core.management.base import BaseCommand
 from django.core.management.base import CommandError
+from django.db import connection
 from django.db import transaction
 
 import pytz
 
+from gridplatform.customers.models import Customer
+from gridplatform.utils import condense
 from gridplatform.utils.relativetimedelta import RelativeTimeDelta
 
+from ...models import build_cache_incrementally
 from ...models import generate_cache
+from ...models import generate_rollup_cache
+from ...models import CacheWatermark
 from ...models import DataSource
+from ...models import HourAccumulatedData
 from ...models import CACHABLE_UNITS
+from ...models import ENGINES
+from ...models import ENGINE_FRACTION
 
 
-def _make_periods(from_timestamp, to_timestamp):
+def _make_periods(from_timestamp, to_timestamp, days=7):
     assert from_timestamp <= to_timestamp
     period_to = to_timestamp
     while period_to > from_timestamp:
         period_from = max(
-            from_timestamp, period_to - datetime.timedelta(days=7))
+            from_timestamp, period_to - datetime.timedelta(days=days))
         yield period_from, period_to
         period_to = period_from
 
 
+def _generate_cache_chunk(args):
+    """
+    Generate cache for a single data source and period, in a transaction of
+    its own.  Runs in worker processes; each opens its own database
+    connection on first use.
+
+    :return: A tuple of the data source id, the period length and the time
+        spent, in seconds.
+    """
+    datasource_id, period_from, period_to, engine = args
+    start = time.time()
+    datasource = DataSource.objects.get(id=datasource_id)
+    with transaction.atomic():
+        generate_cache(datasource, period_from, period_to, engine)
+    return (
+        datasource_id,
+        (period_to - period_from).total_seconds(),
+        time.time() - start)
+
+
+def _build_cache_incrementally_batch(args):
+    """
+    Run `build_cache_incrementally()` for a single batch of data sources in
+    a worker process.
+
+    :return: A tuple of the number of data sources and the time spent, in
+        seconds.
+    """
+    datasource_ids, to_timestamp, batch_size, engine = args
+    start = time.time()
+    datasources = list(
+        DataSource.objects.filter(id__in=datasource_ids).order_by('id'))
+    build_cache_incrementally(datasources, to_timestamp, batch_size, engine)
+    return (len(datasources), time.time() - start)
+
+
+def _map(function, arguments, workers):
+    """
+    Map `function` over `arguments` in a pool of `workers` processes, or in
+    this process if `workers` is 1.  Results are yielded as they complete.
+
+    The pool is joined once all results have been yielded, and terminated if
+    the caller stops iterating early or an error occurs.
+    """
+    if workers == 1:
+        for result in itertools.imap(function, arguments):
+            yield result
+        return
+    # Forked workers must not share the database connection of this process;
+    # closing it here makes each of them open their own.
+    connection.close()
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(function, arguments):
+            yield result
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+
 class Command(BaseCommand):
     help = "Generate condensed measurement cache data for accumulation " + \
         "data sources"
@@ -58,12 +135,94 @@ class Command(BaseCommand):
             dest='hours',
             type=int,
             default=0),
+        make_option(
+            '--incremental',
+            action='store_true',
+            dest='incremental',
+            default=False,
+            help='Only condense data newer than the cache watermark of '
+            'each data source; the period options are ignored'),
+        make_option(
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=100,
+            help='Number of data sources per transaction in incremental '
+            'mode'),
+        make_option(
+            '--rollup',
+            action='store_true',
+            dest='rollup',
+            default=False,
+            help='Also generate daily and monthly cache for the timezones '
+            'of all customers; in incremental mode, for the range each '
+            'data source was condensed in'),
+        make_option(
+            '--engine',
+            dest='engine',
+            type='choice',
+            choices=ENGINES,
+            default=ENGINE_FRACTION,
+            help='Implementation used for interpolating raw data; '
+            'one of %s' % ', '.join(ENGINES)),
+        make_option(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Number of worker processes to distribute data sources '
+            'and periods among'),
+        make_option(
+            '--chunk-days',
+            dest='chunk_days',
+            type=int,
+            default=7,
+            help='Length in days of the periods each data source is '
+            'processed in'),
     )
 
     def handle(self, *args, **options):
         verbosity = int(options.get('verbosity'))
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('Needs at least one worker.')
+        if options['chunk_days'] < 1:
+            raise CommandError('Needs chunks of at least one day.')
+        if options['batch_size'] < 1:
+            raise CommandError('Needs batches of at least one data source.')
         now = datetime.datetime.now(pytz.utc)
         to_timestamp = now.replace(minute=0, second=0, microsecond=0)
+        if options['incremental']:
+            datasource_ids = list(DataSource.objects.filter(
+                unit__in=CACHABLE_UNITS).order_by('id').values_list(
+                'id', flat=True))
+            if verbosity >= 1:
+                self.stdout.write(
+                    'Incrementally generating cache until %s for '
+                    '%s data sources' % (to_timestamp, len(datasource_ids)))
+            previous_watermarks = dict(CacheWatermark.objects.filter(
+                datasource_id__in=datasource_ids).values_list(
+                'datasource_id', 'timestamp'))
+            batch_size = options['batch_size']
+            batches = [
+                (datasource_ids[n:n + batch_size], to_timestamp, batch_size,
+                 options['engine'])
+                for n in range(0, len(datasource_ids), batch_size)
+            ]
+            start = time.time()
+            for count, seconds in _map(
+                    _build_cache_incrementally_batch, batches, workers):
+                if verbosity >= 2:
+                    self.stdout.write(
+                        '%s data sources in %.1f s' % (count, seconds))
+            if verbosity >= 1:
+                self.stdout.write('Done in %.1f s' % (time.time() - start,))
+            if options['rollup']:
+                self._rollup(
+                    self._incremented_ranges(
+                        datasource_ids, previous_watermarks),
+                    verbosity)
+            return
         delta = RelativeTimeDelta(
             years=options['years'],
             months=options['months'],
@@ -81,8 +240,94 @@ class Command(BaseCommand):
         if verbosity >= 1:
             self.stdout.write('%s data sources' % (len(datasources),))
 
-        for period_from, period_to in _make_periods(
-                from_timestamp, to_timestamp):
-            for datasource in datasources:
+        periods = list(_make_periods(
+            from_timestamp, to_timestamp, options['chunk_days']))
+        chunks = [
+            (datasource.id, period_from, period_to, options['engine'])
+            for period_from, period_to in periods
+            for datasource in datasources
+        ]
+        start = time.time()
+        completed = defaultdict(int)
+        spans = defaultdict(float)
+        timings = defaultdict(float)
+        for datasource_id, span, seconds in _map(
+                _generate_cache_chunk, chunks, workers):
+            completed[datasource_id] += 1
+            spans[datasource_id] += span
+            timings[datasource_id] += seconds
+            if verbosity >= 2 and completed[datasource_id] == len(periods):
+                self.stdout.write(
+                    'Data source %s: %.1f s, %.1f days/s' % (
+                        datasource_id, timings[datasource_id],
+                        spans[datasource_id] / (24 * 60 * 60) /
+                        max(timings[datasource_id], 0.001)))
+        if verbosity >= 1:
+            elapsed = time.time() - start
+            self.stdout.write(
+                'Done in %.1f s; %.1f data source days/s' % (
+                    elapsed,
+                    sum(spans.values()) / (24 * 60 * 60) /
+                    max(elapsed, 0.001)))
+
+        if options['rollup']:
+            self._rollup(
+                [
+                    (datasource, from_timestamp, to_timestamp)
+                    for datasource in datasources
+                ],
+                verbosity)
+
+    def _incremented_ranges(self, datasource_ids, previous_watermarks):
+        """
+        :return: A list of ``(datasource, from_timestamp, to_timestamp)``
+            for the ranges that the cache watermarks of the given data
+            sources were moved across, from ``previous_watermarks``.  Data
+            sources that had no watermark are included from their first
+            hourly cache data.
+        """
+        watermarks = dict(CacheWatermark.objects.filter(
+            datasource_id__in=datasource_ids).values_list(
+            'datasource_id', 'timestamp'))
+        ranges = []
+        for datasource in DataSource.objects.filter(
+                id__in=[
+                    datasource_id for datasource_id, timestamp
+                    in watermarks.items()
+                    if timestamp != previous_watermarks.get(datasource_id)
+                ]).order_by('id'):
+            from_timestamp = previous_watermarks.get(datasource.id)
+            if from_timestamp is None:
+                from_timestamp = HourAccumulatedData.objects.filter(
+                    datasource_id=datasource.id).order_by(
+                    'timestamp').values_list('timestamp', flat=True).first()
+            if from_timestamp is not None:
+                ranges.append(
+                    (datasource, from_timestamp, watermarks[datasource.id]))
+        return ranges
+
+    def _rollup(self, ranges, verbosity):
+        """
+        Generate daily and monthly cache for the timezones of all customers,
+        for the given ``(datasource, from_timestamp, to_timestamp)`` ranges.
+        Each range is extended back to the start of the month it starts in,
+        as days and months that were incomplete when last rolled up may be
+        complete now.
+        """
+        timezones = set(
+            pytz.timezone(timezone)
+            if isinstance(timezone, basestring) else timezone
+            for timezone in Customer.objects.values_list(
+                'timezone', flat=True).distinct())
+        if verbosity >= 1:
+            self.stdout.write(
+                'Rolling up cache of %s data sources for %s timezones' % (
+                    len(ranges), len(timezones)))
+        for datasource, from_timestamp, to_timestamp in ranges:
+            for timezone in timezones:
                 with transaction.atomic():
-                    generate_cache(datasource, period_from, period_to)
+                    generate_rollup_cache(
+                        datasource, timezone,
+                        condense.floor(
+                            from_timestamp, condense.MONTHS, timezone),
+                        to_timestamp)
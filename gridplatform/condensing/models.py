@@ -10,25 +10,47 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 from fractions import Fraction
+import bisect
 import datetime
+import itertools
+import operator
 
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db import transaction
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
+from timezones2.models import TimeZoneField
+import pytz
 
 from gridplatform.customer_datasources.models import DataSource
 from gridplatform.datasources.models import RawData
+from gridplatform.utils import condense
 from gridplatform.utils.iter_ext import pairwise
 from gridplatform.utils.unitconversion import PhysicalQuantity
 from gridplatform.utils.units import ACCUMULATION_BASE_UNITS
 from gridplatform.utils.units import IMPULSE_BASE_UNITS
 from gridplatform.utils.samples import Sample
 
+from .vectorised import period_differences
+
 
 CACHABLE_UNITS = set(ACCUMULATION_BASE_UNITS + IMPULSE_BASE_UNITS)
 
+# Implementations of generate_period_data(); see period_aligned() and
+# gridplatform.condensing.vectorised.
+ENGINE_FRACTION = 'fraction'
+ENGINE_NUMPY = 'numpy'
+ENGINES = (ENGINE_FRACTION, ENGINE_NUMPY)
+
+# Number of RawData rows read per query by iter_raw_data_for_cache(), and
+# number of cache rows inserted per query when building cache from it.
+RAW_DATA_CHUNK_SIZE = 10000
+
 
 def validate_hour(timestamp):
     """
@@ -129,6 +151,95 @@ class FiveMinuteAccumulatedData(AccumulatedData):
         super(FiveMinuteAccumulatedData, self).save(*args, **kwargs)
 
 
+class LocalAccumulatedData(AccumulatedData):
+    """
+    Abstract base model for accumulated data of periods that depend on a
+    timezone, i.e. days and months.  These are rolled up from hourly
+    accumulated data, and only stored for periods completely covered by it;
+    see :func:`.generate_rollup_cache`.
+
+    :ivar timezone: The timezone in which the period is defined.
+    """
+    timezone = TimeZoneField()
+
+    class Meta(AccumulatedData.Meta):
+        abstract = True
+        unique_together = ('datasource', 'timezone', 'timestamp')
+
+
+class DayAccumulatedData(LocalAccumulatedData):
+    """
+    Concrete specialization of :class:`.LocalAccumulatedData` for daily
+    accumulations.
+
+    :ivar timestamp: The leading timestamp of the day this accumulation data
+        belongs to; i.e. midnight in ``self.timezone``.
+    """
+    timestamp = models.DateTimeField()
+
+    class Meta(LocalAccumulatedData.Meta):
+        verbose_name = _('day accumulated data')
+        verbose_name_plural = _('day accumulated data')
+
+    def __unicode__(self):
+        return u"%s, %s" % (self.timestamp, self.value)
+
+
+class MonthAccumulatedData(LocalAccumulatedData):
+    """
+    Concrete specialization of :class:`.LocalAccumulatedData` for monthly
+    accumulations.
+
+    :ivar timestamp: The leading timestamp of the month this accumulation
+        data belongs to; i.e. midnight of the first day of the month in
+        ``self.timezone``.
+    """
+    timestamp = models.DateTimeField()
+
+    class Meta(LocalAccumulatedData.Meta):
+        verbose_name = _('month accumulated data')
+        verbose_name_plural = _('month accumulated data')
+
+    def __unicode__(self):
+        return u"%s, %s" % (self.timestamp, self.value)
+
+
+ROLLUP_MODELS = {
+    condense.DAYS: DayAccumulatedData,
+    condense.MONTHS: MonthAccumulatedData,
+}
+
+
+class CacheWatermark(models.Model):
+    """
+    High-water-mark for incremental cache generation; see
+    :func:`.build_cache_incrementally`.
+
+    :ivar datasource: The :class:`.DataSource` this watermark belongs to.
+    :ivar timestamp: :class:`.HourAccumulatedData` and
+        :class:`.FiveMinuteAccumulatedData` have been generated for all
+        periods before this timestamp that are covered by :class:`.RawData`.
+        Always on the hour.
+    """
+    datasource = models.OneToOneField(
+        DataSource, primary_key=True, related_name='cachewatermark')
+    timestamp = models.DateTimeField(validators=[validate_hour])
+
+    class Meta:
+        verbose_name = _('cache watermark')
+        verbose_name_plural = _('cache watermarks')
+
+    def __unicode__(self):
+        return u"%s, %s" % (self.datasource_id, self.timestamp)
+
+    def save(self, *args, **kwargs):
+        """
+        :precondition: ``self.timestamp`` is on the hour and has a timezone.
+        """
+        validate_hour(self.timestamp)
+        super(CacheWatermark, self).save(*args, **kwargs)
+
+
 @receiver(post_delete, sender=RawData)
 def cleanup_cache_for_rawdata_delete(sender, instance, **kwargs):
     """
@@ -162,7 +273,26 @@ def cleanup_cache_for_rawdata_delete(sender, instance, **kwargs):
             datasource_id=datasource_id).exists()
         assert not FiveMinuteAccumulatedData.objects.filter(
             datasource_id=datasource_id).exists()
+        CacheWatermark.objects.filter(datasource_id=datasource_id).delete()
         return
+    invalidate_cache_range(datasource_id, range_start, range_end)
+
+
+def invalidate_cache_range(datasource_id, range_start, range_end):
+    """
+    Delete cache data of the given data source whose time period starts or
+    ends within the tainted period from `range_start` to `range_end`, using
+    a single ranged delete per cache table, and move the cache watermark back
+    to before the deleted cache data.
+
+    Used by :func:`.cleanup_cache_for_rawdata_delete` for single deleted
+    :class:`.RawData`, and by
+    :meth:`gridplatform.datasources.managers.DataSourceManager.delete_raw_data`
+    for entire ranges of deleted/replaced :class:`.RawData`.
+
+    :return: The set of names of the timezones of the deleted daily and
+        monthly cache data; see :func:`.recompute_cache_range`.
+    """
     # Hours that start or end inside range; the first hour that ends inside
     # range may have started an hour before...
     hour_range_start = range_start - datetime.timedelta(hours=1)
@@ -175,40 +305,113 @@ def cleanup_cache_for_rawdata_delete(sender, instance, **kwargs):
         datasource_id=datasource_id,
         timestamp__gte=five_minute_range_start,
         timestamp__lte=range_end).delete()
+    # Days and months that start or end inside range; the first day/month
+    # that ends inside range may have started up to a day (of 25 hours on DST
+    # switch)/a month (of 31 days) before...
+    timezones = set()
+    for cache_model, max_period_length in [
+            (DayAccumulatedData, datetime.timedelta(days=1, hours=1)),
+            (MonthAccumulatedData, datetime.timedelta(days=31, hours=1))]:
+        tainted = cache_model.objects.filter(
+            datasource_id=datasource_id,
+            timestamp__gt=hour_range_start - max_period_length,
+            timestamp__lte=range_end)
+        timezones.update(
+            getattr(timezone, 'zone', timezone)
+            for timezone in tainted.values_list(
+                'timezone', flat=True).distinct())
+        tainted.delete()
+    # Incremental cache generation must resume from before the deleted cache
+    # data.
+    watermark_timestamp = hour_range_start.replace(
+        minute=0, second=0, microsecond=0)
+    CacheWatermark.objects.filter(
+        datasource_id=datasource_id,
+        timestamp__gt=watermark_timestamp).update(
+        timestamp=watermark_timestamp)
+    return timezones
 
 
-def get_hourly_accumulated(datasource, from_timestamp, to_timestamp):
+def recompute_cache_range(datasource, range_start, range_end, timezones=()):
+    """
+    Regenerate cache data of the given data source after
+    :func:`.invalidate_cache_range` was called for `range_start`,
+    `range_end`: hourly and five-minute cache data, and daily and monthly
+    cache data in each of `timezones`.
+
+    :param timezones: Timezone names, as returned by
+        :func:`.invalidate_cache_range`.
+    """
+    ONE_HOUR = datetime.timedelta(hours=1)
+    from_timestamp = range_start.replace(
+        minute=0, second=0, microsecond=0) - ONE_HOUR
+    to_timestamp = range_end.replace(
+        minute=0, second=0, microsecond=0) + ONE_HOUR
+    generate_cache(datasource, from_timestamp, to_timestamp)
+    for timezone in timezones:
+        timezone = pytz.timezone(timezone)
+        # Deleted days and months extend beyond the tainted range.
+        generate_rollup_cache(
+            datasource, timezone,
+            condense.floor(from_timestamp, condense.MONTHS, timezone),
+            condense.ceil(to_timestamp, condense.MONTHS, timezone))
+
+
+def get_hourly_accumulated(
+        datasource, from_timestamp, to_timestamp, engine=ENGINE_FRACTION):
     """
     Get hourly accumulated data as ranged `Sample` instances; using existing
-    cached values when possible.
+    cached values when possible.  See `get_accumulated()` for `engine`.
     """
     validate_hour(from_timestamp)
     validate_hour(to_timestamp)
     return get_accumulated(
         datasource, datasource.houraccumulateddata_set,
-        from_timestamp, to_timestamp, datetime.timedelta(hours=1))
+        from_timestamp, to_timestamp, datetime.timedelta(hours=1), engine)
 
 
-def get_five_minute_accumulated(datasource, from_timestamp, to_timestamp):
+def get_five_minute_accumulated(
+        datasource, from_timestamp, to_timestamp, engine=ENGINE_FRACTION):
     """
     Get hourly accumulated data as ranged `Sample` instances; using existing
-    cached values when possible.
+    cached values when possible.  See `get_accumulated()` for `engine`.
     """
     validate_five_minutes(from_timestamp)
     validate_five_minutes(to_timestamp)
     return get_accumulated(
         datasource, datasource.fiveminuteaccumulateddata_set,
-        from_timestamp, to_timestamp, datetime.timedelta(minutes=5))
+        from_timestamp, to_timestamp, datetime.timedelta(minutes=5), engine)
 
 
 def get_accumulated(
         datasource, cache_queryset,
-        from_timestamp, to_timestamp, period_length):
+        from_timestamp, to_timestamp, period_length,
+        engine=ENGINE_FRACTION):
     """
     Shared logic for `get_hourly_accumulated()` and
     `get_five_minute_accumulated()`.  Try to read from cache; if necessary,
     supplement by computing missing entries, return result as list of `Sample`
-    objects.
+    objects.  Missing entries are computed using the `generate_period_data()`
+    implementation selected by `engine`.
+    """
+    entries = accumulated_entries(
+        datasource, cache_queryset,
+        from_timestamp, to_timestamp, period_length, engine)
+    unit = datasource.unit
+    return [
+        Sample(timestamp, timestamp + period_length,
+               PhysicalQuantity(value, unit), False, False)
+        for timestamp, value in entries
+    ]
+
+
+def accumulated_entries(
+        datasource, cache_queryset,
+        from_timestamp, to_timestamp, period_length,
+        engine=ENGINE_FRACTION):
+    """
+    Implementation of `get_accumulated()`, returning the result as an ordered
+    list of `(timestamp, value)` rather than `Sample` objects.
     """
     entries = list(cache_queryset.filter(
         timestamp__gte=from_timestamp,
@@ -227,27 +430,309 @@ def get_accumulated(
         missing = missing_periods(
             from_timestamp, to_timestamp, timestamps, period_length)
         for missing_from, missing_to in missing:
-            data = raw_data_for_cache(datasource, missing_from, missing_to)
+            data = iter_raw_data_for_cache(
+                datasource, missing_from, missing_to)
             generated = generate_period_data(
-                data, missing_from, missing_to, period_length, interpolate_fn)
+                data, missing_from, missing_to, period_length, interpolate_fn,
+                engine)
             entries.extend(generated)
         entries.sort()
     assert len(entries) <= period_count
+    return entries
+
+
+def get_daily_accumulated(datasource, timezone, from_timestamp, to_timestamp):
+    """
+    Get daily accumulated data, for days in the given `timezone`, as ranged
+    `Sample` instances; using existing cached values when possible.
+    `from_timestamp` and `to_timestamp` must be midnight in `timezone`.
+    """
+    return _get_rolled_up(
+        datasource, timezone, from_timestamp, to_timestamp, condense.DAYS)
+
+
+def get_monthly_accumulated(
+        datasource, timezone, from_timestamp, to_timestamp):
+    """
+    Get monthly accumulated data, for months in the given `timezone`, as
+    ranged `Sample` instances; using existing cached values when possible.
+    `from_timestamp` and `to_timestamp` must be the start of a month in
+    `timezone`.
+    """
+    return _get_rolled_up(
+        datasource, timezone, from_timestamp, to_timestamp, condense.MONTHS)
+
+
+def get_rolled_up_accumulated(
+        datasource, timezone, from_timestamp, to_timestamp, resolution):
+    """
+    Get accumulated data for the given timespan as ranged `Sample` instances
+    suitable for aggregating to the given `resolution` in the given
+    `timezone`.
+
+    The samples are of mixed duration: Hours before the first and after the
+    last midnight, and days in between.  For resolutions coarser than days,
+    whole months in between are represented by single samples.  Thus none of
+    the samples cross a boundary of `resolution`, and existing
+    `DayAccumulatedData` and `MonthAccumulatedData` is used when possible.
+    """
+    validate_hour(from_timestamp)
+    validate_hour(to_timestamp)
+    assert resolution in (
+        condense.DAYS, condense.MONTHS, condense.QUARTERS, condense.YEARS)
+    day_from = condense.ceil(from_timestamp, condense.DAYS, timezone)
+    day_to = condense.floor(to_timestamp, condense.DAYS, timezone)
+    if day_from >= day_to:
+        return get_hourly_accumulated(datasource, from_timestamp, to_timestamp)
+    samples = get_hourly_accumulated(datasource, from_timestamp, day_from)
+    month_from = condense.ceil(day_from, condense.MONTHS, timezone)
+    month_to = condense.floor(day_to, condense.MONTHS, timezone)
+    if resolution == condense.DAYS or month_from >= month_to:
+        samples.extend(
+            get_daily_accumulated(datasource, timezone, day_from, day_to))
+    else:
+        samples.extend(
+            get_daily_accumulated(datasource, timezone, day_from, month_from))
+        samples.extend(
+            get_monthly_accumulated(
+                datasource, timezone, month_from, month_to))
+        samples.extend(
+            get_daily_accumulated(datasource, timezone, month_to, day_to))
+    samples.extend(get_hourly_accumulated(datasource, day_to, to_timestamp))
+    return samples
+
+
+def _get_rolled_up(
+        datasource, timezone, from_timestamp, to_timestamp, resolution):
+    """
+    Shared logic for `get_daily_accumulated()` and
+    `get_monthly_accumulated()`.
+    """
+    assert condense.floor(from_timestamp, resolution, timezone) == \
+        from_timestamp
+    assert condense.floor(to_timestamp, resolution, timezone) == \
+        to_timestamp
     unit = datasource.unit
     return [
-        Sample(timestamp, timestamp + period_length,
+        Sample(timestamp, timestamp + resolution,
                PhysicalQuantity(value, unit), False, False)
-        for timestamp, value in entries
+        for timestamp, value, complete in _rolled_up_entries(
+            datasource, timezone, from_timestamp, to_timestamp, resolution)
     ]
 
 
+def _rolled_up_entries(
+        datasource, timezone, from_timestamp, to_timestamp, resolution):
+    """
+    Read `(timestamp, value, complete)` of days or months from cache, and
+    supplement by computing missing entries; see `_compute_rolled_up()`.
+    Timestamps are returned in `timezone`.
+    """
+    entries = [
+        (timezone.normalize(timestamp.astimezone(timezone)), value, True)
+        for timestamp, value in ROLLUP_MODELS[resolution].objects.filter(
+            datasource=datasource,
+            timezone=timezone,
+            timestamp__gte=from_timestamp,
+            timestamp__lt=to_timestamp).order_by('timestamp').values_list(
+            'timestamp', 'value')
+    ]
+    present = set(timestamp for timestamp, value, complete in entries)
+    missing = _missing_rolled_up_periods(
+        from_timestamp, to_timestamp, present, resolution, timezone)
+    for missing_from, missing_to in missing:
+        entries.extend(_compute_rolled_up(
+            datasource, timezone, missing_from, missing_to, resolution))
+    entries.sort()
+    return entries
+
+
+def _compute_rolled_up(
+        datasource, timezone, from_timestamp, to_timestamp, resolution):
+    """
+    Compute `(timestamp, value, complete)` of days from hourly accumulated
+    data, or of months from daily accumulated data, within the given
+    timespan.  `complete` tells whether every hour/day of the day/month was
+    present.  Days/months without any data are left out.
+    """
+    if resolution == condense.DAYS:
+        finer_entries = [
+            (timezone.normalize(timestamp.astimezone(timezone)), value, True)
+            for timestamp, value in accumulated_entries(
+                datasource, datasource.houraccumulateddata_set,
+                from_timestamp, to_timestamp, datetime.timedelta(hours=1))
+        ]
+    else:
+        assert resolution == condense.MONTHS
+        finer_entries = _rolled_up_entries(
+            datasource, timezone, from_timestamp, to_timestamp, condense.DAYS)
+    result = []
+    for timestamp, group in itertools.groupby(
+            finer_entries,
+            key=lambda entry: condense.floor(entry[0], resolution, timezone)):
+        group = list(group)
+        complete = all(entry_complete for _, _, entry_complete in group) and \
+            len(group) == _finer_period_count(timestamp, resolution, timezone)
+        result.append(
+            (timestamp, sum(value for _, value, _ in group), complete))
+    return result
+
+
+def _finer_period_count(timestamp, resolution, timezone):
+    """
+    The number of hours in the day or days in the month starting at
+    `timestamp`.
+    """
+    end = timestamp + resolution
+    if resolution == condense.DAYS:
+        return int((end - timestamp).total_seconds()) // 3600
+    else:
+        return (timezone.normalize(end.astimezone(timezone)).date() -
+                timezone.normalize(timestamp.astimezone(timezone)).date()).days
+
+
+def _missing_rolled_up_periods(
+        from_timestamp, to_timestamp, present, resolution, timezone):
+    """
+    Find contiguous periods within `from_timestamp`, `to_timestamp` not
+    represented by timestamps from the set `present`.  Each element in
+    `present` represents a day or month in `timezone` by its starting point.
+    """
+    missing_from = None
+    timestamp = timezone.normalize(from_timestamp.astimezone(timezone))
+    while timestamp < to_timestamp:
+        if timestamp in present:
+            if missing_from is not None:
+                yield (missing_from, timestamp)
+                missing_from = None
+        elif missing_from is None:
+            missing_from = timestamp
+        timestamp += resolution
+    if missing_from is not None:
+        yield (missing_from, to_timestamp)
+
+
+def generate_rollup_cache(datasource, timezone, from_timestamp, to_timestamp):
+    """
+    Generate and store `DayAccumulatedData` and `MonthAccumulatedData` for the
+    days and months in `timezone` within the given timespan that are
+    completely covered by hourly accumulated data.  Hourly accumulated data
+    should be generated first; see `generate_cache()`.
+    """
+    assert datasource.unit in CACHABLE_UNITS
+    # Days before months; months are rolled up from days.
+    for resolution in (condense.DAYS, condense.MONTHS):
+        cache_model = ROLLUP_MODELS[resolution]
+        period_from = condense.ceil(from_timestamp, resolution, timezone)
+        period_to = condense.floor(to_timestamp, resolution, timezone)
+        if period_from >= period_to:
+            continue
+        present = set(cache_model.objects.filter(
+            datasource=datasource,
+            timezone=timezone,
+            timestamp__gte=period_from,
+            timestamp__lt=period_to).values_list('timestamp', flat=True))
+        missing = _missing_rolled_up_periods(
+            period_from, period_to, present, resolution, timezone)
+        objects = []
+        for missing_from, missing_to in missing:
+            for timestamp, value, complete in _compute_rolled_up(
+                    datasource, timezone, missing_from, missing_to,
+                    resolution):
+                if complete:
+                    objects.append(cache_model(
+                        datasource=datasource,
+                        timezone=timezone,
+                        timestamp=timestamp,
+                        value=_cache_value(value)))
+        cache_model.objects.bulk_create(objects)
+
+
+def get_hourly_accumulated_bulk(datasources, from_timestamp, to_timestamp):
+    """
+    Bulk variant of `get_hourly_accumulated()` for several data sources.
+
+    :return: A dictionary mapping the id of each of the given `datasources` to
+        a list of hourly ranged `Sample` instances.
+    """
+    validate_hour(from_timestamp)
+    validate_hour(to_timestamp)
+    return get_accumulated_bulk(
+        datasources, HourAccumulatedData,
+        from_timestamp, to_timestamp, datetime.timedelta(hours=1))
+
+
+def get_accumulated_bulk(
+        datasources, cache_model,
+        from_timestamp, to_timestamp, period_length):
+    """
+    Shared logic for bulk variants of `get_accumulated()`.  Cached values for
+    all `datasources` are read with a single query, and missing entries for
+    all of them are computed from a single scan of `RawData` (see
+    `raw_data_for_cache_bulk()`).  Return result as dictionary mapping data
+    source ids to lists of `Sample` objects.
+    """
+    datasources = {datasource.id: datasource for datasource in datasources}
+    entries = {datasource_id: [] for datasource_id in datasources}
+    if not datasources:
+        return entries
+    for datasource_id, timestamp, value in cache_model.objects.filter(
+            datasource_id__in=datasources.keys(),
+            timestamp__gte=from_timestamp,
+            timestamp__lt=to_timestamp).order_by('timestamp').values_list(
+            'datasource_id', 'timestamp', 'value'):
+        entries[datasource_id].append((timestamp, value))
+    period_count = (to_timestamp - from_timestamp).total_seconds() / \
+        period_length.total_seconds()
+    assert period_count == round(period_count)
+    missing = {}
+    for datasource_id, datasource_entries in entries.items():
+        assert len(datasource_entries) <= period_count
+        if len(datasource_entries) < period_count:
+            timestamps = [timestamp for timestamp, value in datasource_entries]
+            missing[datasource_id] = list(missing_periods(
+                from_timestamp, to_timestamp, timestamps, period_length))
+    if missing:
+        raw_data = raw_data_for_cache_bulk(
+            [datasources[datasource_id] for datasource_id in missing],
+            from_timestamp, to_timestamp)
+        for datasource_id, datasource_missing in missing.items():
+            data = raw_data[datasource_id]
+            timestamps = [timestamp for timestamp, value in data]
+            interpolate_fn = datasources[datasource_id]._get_interpolate_fn()
+            for missing_from, missing_to in datasource_missing:
+                # Only the data from the last element at or before
+                # missing_from to the first element at or after missing_to is
+                # relevant; similar to what raw_data_for_cache() would have
+                # loaded for the missing period.
+                start = max(
+                    bisect.bisect_right(timestamps, missing_from) - 1, 0)
+                end = bisect.bisect_left(timestamps, missing_to) + 1
+                entries[datasource_id].extend(generate_period_data(
+                    data[start:end], missing_from, missing_to, period_length,
+                    interpolate_fn))
+            entries[datasource_id].sort()
+            assert len(entries[datasource_id]) <= period_count
+    return {
+        datasource_id: [
+            Sample(timestamp, timestamp + period_length,
+                   PhysicalQuantity(value, datasources[datasource_id].unit),
+                   False, False)
+            for timestamp, value in datasource_entries
+        ]
+        for datasource_id, datasource_entries in entries.items()
+    }
+
+
 INT64_MIN = -2**63
 INT64_MAX = 2**63-1
 
 
-def generate_cache(datasource, from_timestamp, to_timestamp):
+def generate_cache(
+        datasource, from_timestamp, to_timestamp, engine=ENGINE_FRACTION):
     """
-    Generate and store `HourAccumulatedData` and `FiveMinuteAccumulatedData`.
+    Generate and store `HourAccumulatedData` and `FiveMinuteAccumulatedData`,
+    using the `generate_period_data()` implementation selected by `engine`.
     """
     validate_hour(from_timestamp)
     validate_hour(to_timestamp)
@@ -277,49 +762,212 @@ def generate_cache(datasource, from_timestamp, to_timestamp):
     missing_both = missing_five_minutes & missing_hours
     missing_five_minutes_only = missing_five_minutes - missing_both
     missing_hour_only = missing_hours - missing_both
-    five_minute_data = []
-    hour_data = []
+    # Generated data is inserted in bounded chunks as it is produced, rather
+    # than held in memory for the full period.
+    five_minute_writer = _CacheWriter(FiveMinuteAccumulatedData, datasource)
+    hour_writer = _CacheWriter(HourAccumulatedData, datasource)
     for missing_from, missing_to in missing_both:
-        data = raw_data_for_cache(datasource, missing_from, missing_to)
-        five_minute_data.extend(generate_period_data(
-            data, missing_from, missing_to, FIVE_MINUTES, interpolate_fn))
-        hour_data.extend(generate_period_data(
-            data, missing_from, missing_to, ONE_HOUR, interpolate_fn))
-
+        data = iter_raw_data_for_cache(datasource, missing_from, missing_to)
+        hour_writer.extend(hours_from_five_minutes(
+            five_minute_writer.passthrough(generate_period_data(
+                data, missing_from, missing_to, FIVE_MINUTES, interpolate_fn,
+                engine))))
     for missing_from, missing_to in missing_five_minutes_only:
-        data = raw_data_for_cache(datasource, missing_from, missing_to)
-        five_minute_data.extend(generate_period_data(
-            data, missing_from, missing_to, FIVE_MINUTES, interpolate_fn))
+        data = iter_raw_data_for_cache(datasource, missing_from, missing_to)
+        five_minute_writer.extend(generate_period_data(
+            data, missing_from, missing_to, FIVE_MINUTES, interpolate_fn,
+            engine))
     for missing_from, missing_to in missing_hour_only:
-        data = raw_data_for_cache(datasource, missing_from, missing_to)
-        hour_data.extend(generate_period_data(
-            data, missing_from, missing_to, ONE_HOUR, interpolate_fn))
-    if five_minute_data:
-        five_minute_objects = []
-        for timestamp, value in five_minute_data:
-            obj = FiveMinuteAccumulatedData(
-                datasource=datasource,
-                timestamp=timestamp,
-                value=int(Fraction(value).limit_denominator(1)))
-            if obj.value <= INT64_MIN:
-                obj.value = INT64_MIN
-            if obj.value >= INT64_MAX:
-                obj.value = INT64_MAX
-            five_minute_objects.append(obj)
-        FiveMinuteAccumulatedData.objects.bulk_create(five_minute_objects)
-    if hour_data:
-        hour_objects = []
-        for timestamp, value in hour_data:
-            obj = HourAccumulatedData(
-                datasource=datasource,
-                timestamp=timestamp,
-                value=int(Fraction(value).limit_denominator(1)))
-            if obj.value <= INT64_MIN:
-                obj.value = INT64_MIN
-            if obj.value >= INT64_MAX:
-                obj.value = INT64_MAX
-            hour_objects.append(obj)
-        HourAccumulatedData.objects.bulk_create(hour_objects)
+        data = iter_raw_data_for_cache(datasource, missing_from, missing_to)
+        hour_writer.extend(generate_period_data(
+            data, missing_from, missing_to, ONE_HOUR, interpolate_fn,
+            engine))
+    five_minute_writer.flush()
+    hour_writer.flush()
+
+
+class _CacheWriter(object):
+    """
+    Inserts `(timestamp, value)` cache entries for a data source as
+    instances of the given `AccumulatedData` subclass, with
+    ``bulk_create()`` in chunks of `RAW_DATA_CHUNK_SIZE`.  Remaining entries
+    are inserted by `flush()`.
+    """
+    def __init__(self, model, datasource):
+        self.model = model
+        self.datasource_id = datasource.id
+        self.objects = []
+
+    def add(self, timestamp, value):
+        self.objects.append(self.model(
+            datasource_id=self.datasource_id,
+            timestamp=timestamp,
+            value=_cache_value(value)))
+        if len(self.objects) >= RAW_DATA_CHUNK_SIZE:
+            self.flush()
+
+    def extend(self, entries):
+        for timestamp, value in entries:
+            self.add(timestamp, value)
+
+    def passthrough(self, entries):
+        """
+        Add each of `entries` while yielding it, for generating further
+        cache data from the same entries.
+        """
+        for timestamp, value in entries:
+            self.add(timestamp, value)
+            yield (timestamp, value)
+
+    def flush(self):
+        if self.objects:
+            self.model.objects.bulk_create(self.objects)
+            self.objects = []
+
+
+def build_cache_incrementally(
+        datasources, to_timestamp, batch_size=100, engine=ENGINE_FRACTION):
+    """
+    Generate and store `HourAccumulatedData` and `FiveMinuteAccumulatedData`
+    for the `RawData` of each of the given `datasources` that is newer than
+    their `CacheWatermark`, up until `to_timestamp`.
+
+    Data sources without a `CacheWatermark` are condensed from their first
+    `RawData`.  Data sources are processed `batch_size` at a time; each batch
+    is stored and has its watermarks moved forward within a single
+    transaction.  Cache data is generated using the `generate_period_data()`
+    implementation selected by `engine`.
+    """
+    validate_hour(to_timestamp)
+    datasources = list(datasources)
+    for n in range(0, len(datasources), batch_size):
+        with transaction.atomic():
+            _build_cache_batch(
+                datasources[n:n + batch_size], to_timestamp, engine)
+
+
+def _build_cache_batch(datasources, to_timestamp, engine=ENGINE_FRACTION):
+    """
+    Implementation of `build_cache_incrementally()` for a single batch of
+    `datasources`.  Must be called inside a transaction.
+
+    The extent of the raw data of the batch is read with a single aggregate
+    query, and the cache data to be replaced is deleted with a single query
+    per cache table, leaving a single ordered range read of raw data per
+    data source.
+    """
+    ONE_HOUR = datetime.timedelta(hours=1)
+    datasource_ids = [datasource.id for datasource in datasources]
+    watermarks = {
+        watermark.datasource_id: watermark
+        for watermark in CacheWatermark.objects.select_for_update().filter(
+            datasource_id__in=datasource_ids)
+    }
+    extents = {
+        row['datasource_id']: (row['first_timestamp'], row['last_timestamp'])
+        for row in RawData.objects.filter(
+            datasource_id__in=[
+                datasource_id for datasource_id in datasource_ids
+                if datasource_id not in watermarks or
+                watermarks[datasource_id].timestamp < to_timestamp],
+            timestamp__lte=to_timestamp).values('datasource_id').annotate(
+            first_timestamp=Min('timestamp'),
+            last_timestamp=Max('timestamp'))
+    }
+    ranges = []
+    for datasource in datasources:
+        assert datasource.unit in CACHABLE_UNITS
+        if datasource.id not in extents:
+            continue
+        first_timestamp, last_timestamp = extents[datasource.id]
+        watermark = watermarks.get(datasource.id)
+        if watermark is not None:
+            from_timestamp = watermark.timestamp
+        else:
+            from_timestamp = first_timestamp.replace(
+                minute=0, second=0, microsecond=0)
+        # Restricting to whole hours keeps the five minute and hour cache
+        # aligned with the watermark.
+        adjusted_from, adjusted_to = adjust_from_to(
+            [(first_timestamp, None), (last_timestamp, None)],
+            from_timestamp, to_timestamp, ONE_HOUR)
+        if adjusted_from is None or adjusted_from == adjusted_to:
+            continue
+        ranges.append((datasource, adjusted_from, adjusted_to))
+    if not ranges:
+        return
+    # Cache data may already be present from `generate_cache()`; replace it
+    # rather than duplicate it.
+    replaced = reduce(operator.or_, [
+        Q(datasource_id=datasource.id,
+          timestamp__gte=range_from,
+          timestamp__lt=range_to)
+        for datasource, range_from, range_to in ranges])
+    FiveMinuteAccumulatedData.objects.filter(replaced).delete()
+    HourAccumulatedData.objects.filter(replaced).delete()
+    new_watermarks = []
+    for datasource, adjusted_from, adjusted_to in ranges:
+        _store_streamed_cache(datasource, adjusted_from, adjusted_to, engine)
+        watermark = watermarks.get(datasource.id)
+        if watermark is not None:
+            watermark.timestamp = adjusted_to
+            watermark.save(update_fields=['timestamp'])
+        else:
+            new_watermarks.append(CacheWatermark(
+                datasource_id=datasource.id, timestamp=adjusted_to))
+    CacheWatermark.objects.bulk_create(new_watermarks)
+
+
+def _store_streamed_cache(
+        datasource, from_timestamp, to_timestamp, engine=ENGINE_FRACTION):
+    """
+    Generate and store `FiveMinuteAccumulatedData` and `HourAccumulatedData`
+    for the given whole hours in a single streaming pass over the raw data,
+    inserting cache rows in chunks as they are generated.  (With
+    `ENGINE_NUMPY`, the raw data is read into memory first; see
+    `generate_period_data()`.)
+    """
+    FIVE_MINUTES = datetime.timedelta(minutes=5)
+    five_minute_writer = _CacheWriter(FiveMinuteAccumulatedData, datasource)
+    hour_writer = _CacheWriter(HourAccumulatedData, datasource)
+    five_minute_data = generate_period_data(
+        iter_raw_data_for_cache(datasource, from_timestamp, to_timestamp),
+        from_timestamp, to_timestamp, FIVE_MINUTES,
+        datasource._get_interpolate_fn(), engine)
+    hour_writer.extend(hours_from_five_minutes(
+        five_minute_writer.passthrough(five_minute_data)))
+    five_minute_writer.flush()
+    hour_writer.flush()
+
+
+def hours_from_five_minutes(five_minute_data):
+    """
+    Sum ordered `(timestamp, increase)` of five minute periods, as from
+    `generate_period_data()`, into `(timestamp, increase)` of the hours they
+    cover completely.
+
+    As the increases of consecutive periods telescope, the result is
+    identical to generating the hourly data from the same raw data; this
+    saves a second pass over the raw data.  Timestamps of
+    `five_minute_data` must be aligned to whole hours of the timezone they
+    are given in.
+    """
+    for hour, group in itertools.groupby(
+            five_minute_data,
+            key=lambda entry: entry[0].replace(minute=0)):
+        group = list(group)
+        if len(group) == 12:
+            assert group[0][0] == hour
+            yield (hour, sum(value for timestamp, value in group))
+
+
+def _cache_value(value):
+    """
+    Convert an accumulated `value` to an integer within the range of the
+    `BigIntegerField` of `AccumulatedData`.
+    """
+    return min(max(int(Fraction(value).limit_denominator(1)), INT64_MIN),
+               INT64_MAX)
 
 
 def missing_periods(from_timestamp, to_timestamp, present, period_length):
@@ -353,27 +1001,97 @@ def missing_periods(from_timestamp, to_timestamp, present, period_length):
 
 
 def generate_period_data(
-        data, from_timestamp, to_timestamp, period_length, interpolate_fn):
+        data, from_timestamp, to_timestamp, period_length, interpolate_fn,
+        engine=ENGINE_FRACTION):
     """
-    Transform ordered list of `(timestamp, accumulated_value)` from `data` into
-    sequence of `(timestamp, increase)`, where `increase` represents the growth
-    in accumulated value between `timestamp` and `timestamp + period_length`.
+    Transform ordered sequence of `(timestamp, accumulated_value)` from `data`
+    into sequence of `(timestamp, increase)`, where `increase` represents the
+    growth in accumulated value between `timestamp` and `timestamp +
+    period_length`.
 
     Only periods within both the range represented by elements in `data` and
     the range represented by [`from_timestamp`, `to_timestamp`] are included.
     `from_timestamp` and `to_timestamp` should be aligned to `period_length`.
+
+    `data` may be any iterable, e.g. from `iter_raw_data_for_cache()`; it is
+    consumed as a stream, so memory use does not depend on its length.
+
+    With `engine` set to `ENGINE_NUMPY`, the computation is delegated to
+    :func:`gridplatform.condensing.vectorised.period_differences`, which gives
+    identical results but scales far better with the amount of raw data.
+    That engine needs all of `data` in memory.
     """
-    adjusted_from, adjusted_to = adjust_from_to(
-        data, from_timestamp, to_timestamp, period_length)
-    if adjusted_from is None or adjusted_to is None:
+    assert engine in ENGINES
+    if engine == ENGINE_NUMPY:
+        data = list(data)
+        adjusted_from, adjusted_to = adjust_from_to(
+            data, from_timestamp, to_timestamp, period_length)
+        if adjusted_from is None or adjusted_to is None:
+            return
+        for timestamp, increase in period_differences(
+                data, adjusted_from, adjusted_to, period_length,
+                interpolate_fn):
+            yield (timestamp, increase)
         return
-    aligned = period_aligned(
-        data, adjusted_from, adjusted_to, period_length, interpolate_fn)
+    aligned = iter_period_aligned(
+        data, from_timestamp, to_timestamp, period_length, interpolate_fn)
     for (timestamp_a, value_a), (timestamp_b, value_b) in pairwise(aligned):
         assert timestamp_b - timestamp_a == period_length
         yield (timestamp_a, value_b - value_a)
 
 
+def iter_period_aligned(
+        data, from_timestamp, to_timestamp, period_length, interpolate_fn):
+    """
+    Streaming combination of `adjust_from_to()` and `period_aligned()`:
+    Transform iterable of `(timestamp, value)`-tuples, sorted by timestamp, to
+    sequence of `(timestamp, value)`-tuples aligned to `period_length` for
+    each aligned timestamp within both [`from_timestamp`, `to_timestamp`] and
+    the range represented by elements in `data`.
+
+    The pair of data elements surrounding the current aligned timestamp is
+    carried along while consuming `data`, so aligned timestamps between
+    chunks of a chunked reader are interpolated just as any other.
+    Consumption of `data` stops once `to_timestamp` has been passed.
+    """
+    TIMESTAMP = 0
+    VALUE = 1
+    assert from_timestamp <= to_timestamp
+    assert datetime.timedelta(days=1).total_seconds() % \
+        period_length.total_seconds() == 0
+    period_seconds = int(period_length.total_seconds())
+    point_a = None
+    next_timestamp = None
+    for point_b in data:
+        if point_a is None:
+            # First aligned timestamp not before the first data element.
+            if point_b[TIMESTAMP] > from_timestamp:
+                difference = point_b[TIMESTAMP] - from_timestamp
+                seconds = difference.days * 24 * 60 * 60 + \
+                    difference.seconds + bool(difference.microseconds)
+                next_timestamp = from_timestamp + period_length * \
+                    -(-seconds // period_seconds)
+            else:
+                next_timestamp = from_timestamp
+            if next_timestamp > to_timestamp:
+                return
+            point_a = point_b
+            continue
+        # From (unchecked) precondition for function; that data is sorted
+        assert point_a[TIMESTAMP] < point_b[TIMESTAMP]
+        while point_a[TIMESTAMP] <= next_timestamp < point_b[TIMESTAMP]:
+            yield (next_timestamp, interpolate_fn(
+                next_timestamp, point_a, point_b))
+            next_timestamp += period_length
+            if next_timestamp > to_timestamp:
+                return
+        point_a = point_b
+    # Aligned timestamp coinciding with the last data element; this also
+    # handles the edge case of a single data element.
+    if point_a is not None and point_a[TIMESTAMP] == next_timestamp:
+        yield (next_timestamp, Fraction(point_a[VALUE]))
+
+
 def raw_data_for_cache(
         datasource, from_timestamp, to_timestamp,
         border=datetime.timedelta(minutes=1)):
@@ -443,6 +1161,91 @@ def raw_data_for_cache(
     return data
 
 
+def iter_raw_data_for_cache(
+        datasource, from_timestamp, to_timestamp,
+        chunk_size=RAW_DATA_CHUNK_SIZE):
+    """
+    Streaming alternative to `raw_data_for_cache()`.  Yield ordered
+    `(timestamp, value)` of the raw data needed to interpolate the values at
+    any point in the range [`from_timestamp`, `to_timestamp`]; i.e. the last
+    raw data at or before `from_timestamp`, everything in between, and the
+    first raw data at or after `to_timestamp`.
+
+    Raw data inside the range is read in chunks of at most `chunk_size` rows,
+    using the timestamp of the last row of each chunk as the starting point
+    of the next chunk, so memory use is bounded regardless of the length of
+    the range.  Unlike `raw_data_for_cache()`, nothing is yielded if no data is
+    present; insufficient data for interpolation is left for
+    `generate_period_data()` to handle.
+    """
+    assert from_timestamp <= to_timestamp
+    before = datasource.rawdata_set.filter(
+        timestamp__lte=from_timestamp).order_by('timestamp').values_list(
+        'timestamp', 'value').last()
+    if before is not None:
+        yield before
+    last_timestamp = from_timestamp
+    while True:
+        chunk = list(datasource.rawdata_set.filter(
+            timestamp__gt=last_timestamp,
+            timestamp__lt=to_timestamp).order_by('timestamp').values_list(
+            'timestamp', 'value')[:chunk_size])
+        for timestamp, value in chunk:
+            yield (timestamp, value)
+        if len(chunk) < chunk_size:
+            break
+        last_timestamp = chunk[-1][0]
+    after = datasource.rawdata_set.filter(
+        timestamp__gte=to_timestamp).order_by('timestamp').values_list(
+        'timestamp', 'value').first()
+    # For from_timestamp == to_timestamp, raw data at that timestamp is both
+    # "before" and "after".
+    if after is not None and after != before:
+        yield after
+
+
+def raw_data_for_cache_bulk(
+        datasources, from_timestamp, to_timestamp,
+        border=datetime.timedelta(minutes=1)):
+    """
+    Bulk variant of `raw_data_for_cache()`.  Obtain raw data for the requested
+    period for all the given `datasources` with a single query, and, where
+    necessary for interpolating the values at `from_timestamp` and
+    `to_timestamp`, the nearest samples outside the requested period.
+
+    Returns a dictionary mapping data source ids to ordered lists of
+    `(timestamp, value)`.  Unlike `raw_data_for_cache()`, the lists are not
+    emptied when they cannot be used for interpolation within the period;
+    `generate_period_data()` will produce no periods from such data anyway.
+    """
+    assert border >= datetime.timedelta()
+    TIMESTAMP = 0
+    data = {datasource.id: [] for datasource in datasources}
+    for datasource_id, timestamp, value in RawData.objects.filter(
+            datasource_id__in=data.keys(),
+            timestamp__gte=from_timestamp - border,
+            timestamp__lte=to_timestamp + border).order_by(
+            'timestamp').values_list('datasource_id', 'timestamp', 'value'):
+        data[datasource_id].append((timestamp, value))
+    for datasource in datasources:
+        datasource_data = data[datasource.id]
+        if datasource_data == [] or \
+                datasource_data[-1][TIMESTAMP] < to_timestamp:
+            after = datasource.rawdata_set.filter(
+                timestamp__gte=to_timestamp).order_by(
+                'timestamp').values_list('timestamp', 'value').first()
+            if after is not None:
+                datasource_data.append(after)
+        if datasource_data != [] and \
+                datasource_data[0][TIMESTAMP] > from_timestamp:
+            before = datasource.rawdata_set.filter(
+                timestamp__lte=from_timestamp).order_by(
+                'timestamp').values_list('timestamp', 'value').last()
+            if before is not None:
+                datasource_data.insert(0, before)
+    return data
+
+
 def adjust_from_to(data, from_timestamp, to_timestamp, period_length):
     """
     Compute new from/to timestamps such that the resulting range is a subset of
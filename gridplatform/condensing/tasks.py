@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from django.db import transaction
+
+from gridplatform.datasources.models import DataSource
+from gridplatform.trackuser.tasks import task
+
+from .models import CACHABLE_UNITS
+from .models import recompute_cache_range
+
+
+@task(ignore_result=True)
+def recompute_cache_range_task(
+        datasource_id, range_start, range_end, timezones=()):
+    """
+    Regenerate cache data invalidated for the given range; see
+    :func:`gridplatform.condensing.models.recompute_cache_range`.
+    """
+    datasource = DataSource.objects.get(id=datasource_id)
+    if datasource.unit not in CACHABLE_UNITS:
+        return
+    with transaction.atomic():
+        recompute_cache_range(
+            datasource, range_start, range_end, timezones)
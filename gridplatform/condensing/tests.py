@@ -3,26 +3,60 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import datetime
+import itertools
+import random
 
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.test import TestCase
 from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
 from django.test.utils import override_settings
 
+from mock import Mock
+from mock import call
+from mock import patch
 import pytz
 
+from gridplatform.datasequences.utils import \
+    aggregate_sum_ranged_sample_sequence
+from gridplatform.utils import condense
 from gridplatform.utils.samples import Sample
 from gridplatform.utils.unitconversion import PhysicalQuantity
 
 from gridplatform.customer_datasources.models import DataSource
+from gridplatform.customers.models import Customer
 from gridplatform.datasources.models import RawData
+from gridplatform.datasources.models import impulse_interpolate
 from gridplatform.datasources.models import interpolate
+from gridplatform.providers.models import Provider
 
+from .models import CacheWatermark
+from .models import ENGINE_FRACTION
+from .models import ENGINE_NUMPY
+from .models import DayAccumulatedData
+from .models import FiveMinuteAccumulatedData
+from .models import HourAccumulatedData
+from .models import MonthAccumulatedData
 from .models import adjust_from_to
+from .models import build_cache_incrementally
 from .models import generate_cache
+from .models import generate_rollup_cache
+from .models import get_daily_accumulated
+from .models import get_hourly_accumulated
+from .models import get_hourly_accumulated_bulk
+from .models import get_rolled_up_accumulated
+from .models import hours_from_five_minutes
+from .models import iter_raw_data_for_cache
 from .models import generate_period_data
 from .models import missing_periods
 from .models import period_aligned
 from .models import raw_data_for_cache
+from .management.commands.generate_cache import \
+    _build_cache_incrementally_batch
+from .management.commands.generate_cache import _make_periods
+from .management.commands.generate_cache import _map
 
 
 @override_settings(
@@ -216,6 +250,277 @@ class GetAccumulatedTest(TestCase):
             expected_hours)
 
 
+@override_settings(
+    ENCRYPTION_TESTMODE=True)
+class BulkRawDataTest(TestCase):
+    def setUp(self):
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+        self.from_timestamp = datetime.datetime(
+            2014, 4, 14, 0, tzinfo=pytz.utc)
+        self.to_timestamp = datetime.datetime(
+            2014, 4, 15, 0, tzinfo=pytz.utc)
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.datasource, value=n * 1000,
+                timestamp=self.from_timestamp + datetime.timedelta(hours=n))
+            for n in range(25)])
+        generate_cache(
+            self.datasource, self.from_timestamp, self.to_timestamp)
+
+    def hours(self):
+        return list(self.datasource.houraccumulateddata_set.order_by(
+            'timestamp').values_list('timestamp', 'value'))
+
+    def test_delete_raw_data(self):
+        deleted = DataSource.objects.delete_raw_data(
+            [self.datasource],
+            datetime.datetime(2014, 4, 14, 10, 30, tzinfo=pytz.utc),
+            datetime.datetime(2014, 4, 14, 13, 0, tzinfo=pytz.utc))
+        self.assertEqual(deleted, 2)
+        self.assertEqual(
+            [timestamp for timestamp, value in self.hours()],
+            [self.from_timestamp + datetime.timedelta(hours=n)
+             for n in range(24) if not 9 <= n <= 13])
+        self.assertFalse(
+            self.datasource.fiveminuteaccumulateddata_set.filter(
+                timestamp__gte=datetime.datetime(
+                    2014, 4, 14, 10, tzinfo=pytz.utc),
+                timestamp__lt=datetime.datetime(
+                    2014, 4, 14, 13, tzinfo=pytz.utc)).exists())
+
+    def test_delete_raw_data_recompute(self):
+        hours = self.hours()
+        DataSource.objects.delete_raw_data(
+            [self.datasource],
+            datetime.datetime(2014, 4, 14, 11, 0, tzinfo=pytz.utc),
+            datetime.datetime(2014, 4, 14, 13, 0, tzinfo=pytz.utc),
+            recompute=DataSource.objects.RECOMPUTE_NOW)
+        # Linear data; interpolation across the gap gives the same values.
+        self.assertEqual(self.hours(), hours)
+
+    def test_replace_raw_data(self):
+        DataSource.objects.replace_raw_data(
+            self.datasource,
+            datetime.datetime(2014, 4, 14, 11, 0, tzinfo=pytz.utc),
+            datetime.datetime(2014, 4, 14, 13, 0, tzinfo=pytz.utc),
+            [
+                RawData(
+                    datasource=self.datasource, value=11000,
+                    timestamp=datetime.datetime(
+                        2014, 4, 14, 11, 0, tzinfo=pytz.utc)),
+                RawData(
+                    datasource=self.datasource, value=14000,
+                    timestamp=datetime.datetime(
+                        2014, 4, 14, 12, 0, tzinfo=pytz.utc)),
+            ],
+            recompute=DataSource.objects.RECOMPUTE_NOW)
+        hours = dict(self.hours())
+        self.assertEqual(len(hours), 24)
+        self.assertEqual(
+            hours[datetime.datetime(2014, 4, 14, 11, tzinfo=pytz.utc)], 3000)
+        self.assertEqual(
+            hours[datetime.datetime(2014, 4, 14, 12, tzinfo=pytz.utc)], -1000)
+
+    def test_delete_raw_data_recompute_rollup(self):
+        generate_rollup_cache(
+            self.datasource, pytz.utc, self.from_timestamp, self.to_timestamp)
+        days = list(DayAccumulatedData.objects.values_list(
+            'timezone', 'timestamp', 'value'))
+        self.assertEqual(len(days), 1)
+        DataSource.objects.delete_raw_data(
+            [self.datasource],
+            datetime.datetime(2014, 4, 14, 11, 0, tzinfo=pytz.utc),
+            datetime.datetime(2014, 4, 14, 13, 0, tzinfo=pytz.utc),
+            recompute=DataSource.objects.RECOMPUTE_NOW)
+        self.assertEqual(
+            list(DayAccumulatedData.objects.values_list(
+                'timezone', 'timestamp', 'value')),
+            days)
+
+    def test_delete_raw_data_queue_recompute(self):
+        generate_rollup_cache(
+            self.datasource, pytz.utc, self.from_timestamp, self.to_timestamp)
+        with patch('gridplatform.condensing.tasks.'
+                   'recompute_cache_range_task.delay') as delay:
+            DataSource.objects.delete_raw_data(
+                [self.datasource],
+                datetime.datetime(2014, 4, 14, 11, 0, tzinfo=pytz.utc),
+                datetime.datetime(2014, 4, 14, 13, 0, tzinfo=pytz.utc),
+                recompute=DataSource.objects.RECOMPUTE_QUEUE)
+        self.assertFalse(DayAccumulatedData.objects.exists())
+        delay.assert_called_once_with(
+            self.datasource.id,
+            datetime.datetime(2014, 4, 14, 10, 0, tzinfo=pytz.utc),
+            datetime.datetime(2014, 4, 14, 13, 0, tzinfo=pytz.utc),
+            ['UTC'])
+
+    def test_delete_nothing(self):
+        hours = self.hours()
+        self.assertEqual(
+            DataSource.objects.delete_raw_data(
+                [self.datasource],
+                datetime.datetime(2014, 4, 16, tzinfo=pytz.utc),
+                datetime.datetime(2014, 4, 17, tzinfo=pytz.utc)),
+            0)
+        self.assertEqual(self.hours(), hours)
+
+
+@override_settings(
+    ENCRYPTION_TESTMODE=True)
+class GetHourlyAccumulatedBulkTest(TestCase):
+    def setUp(self):
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+        self.other_datasource = DataSource.objects.create(
+            unit='milliwatt*hour')
+        self.empty_datasource = DataSource.objects.create(
+            unit='milliwatt*hour')
+
+    def test_matches_individual(self):
+        from_timestamp = datetime.datetime(2014, 4, 14, 12, tzinfo=pytz.utc)
+        to_timestamp = datetime.datetime(2014, 4, 14, 18, tzinfo=pytz.utc)
+        data = [
+            (datetime.datetime(2014, 4, 14, 11, tzinfo=pytz.utc), 5),
+            (datetime.datetime(2014, 4, 14, 13, 20, tzinfo=pytz.utc), 17),
+            (datetime.datetime(2014, 4, 14, 17, tzinfo=pytz.utc), 77),
+        ]
+        other_data = [
+            (datetime.datetime(2014, 4, 14, 12, 30, tzinfo=pytz.utc), 3),
+            (datetime.datetime(2014, 4, 14, 15, 30, tzinfo=pytz.utc), 39),
+            (datetime.datetime(2014, 4, 14, 22, tzinfo=pytz.utc), 41),
+        ]
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.datasource, value=value, timestamp=timestamp)
+            for timestamp, value in data] + [
+            RawData(
+                datasource=self.other_datasource, value=value,
+                timestamp=timestamp)
+            for timestamp, value in other_data])
+        generate_cache(
+            self.datasource,
+            datetime.datetime(2014, 4, 14, 14, tzinfo=pytz.utc),
+            datetime.datetime(2014, 4, 14, 15, tzinfo=pytz.utc))
+        datasources = [
+            self.datasource, self.other_datasource, self.empty_datasource]
+        result = get_hourly_accumulated_bulk(
+            datasources, from_timestamp, to_timestamp)
+        self.assertEqual(
+            {
+                datasource.id: datasource.hourly_accumulated(
+                    from_timestamp, to_timestamp)
+                for datasource in datasources
+            },
+            result)
+        self.assertEqual(len(result[self.datasource.id]), 5)
+        self.assertEqual(len(result[self.other_datasource.id]), 5)
+        self.assertEqual(result[self.empty_datasource.id], [])
+
+    def test_no_datasources(self):
+        self.assertEqual(
+            get_hourly_accumulated_bulk(
+                [],
+                datetime.datetime(2014, 4, 14, 12, tzinfo=pytz.utc),
+                datetime.datetime(2014, 4, 14, 18, tzinfo=pytz.utc)),
+            {})
+
+
+@override_settings(
+    ENCRYPTION_TESTMODE=True)
+class RollupCacheTest(TestCase):
+    def setUp(self):
+        self.timezone = pytz.timezone('Europe/Copenhagen')
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+        # Covers the switch to daylight saving time on March 30th 2014.
+        self.from_timestamp = self.timezone.localize(
+            datetime.datetime(2014, 3, 29))
+        self.to_timestamp = self.timezone.localize(
+            datetime.datetime(2014, 4, 2))
+        timestamp = self.from_timestamp - datetime.timedelta(hours=1)
+        data = []
+        while timestamp <= self.to_timestamp + datetime.timedelta(hours=1):
+            data.append(RawData(
+                datasource=self.datasource, value=len(data) ** 2,
+                timestamp=timestamp))
+            timestamp += datetime.timedelta(minutes=30)
+        RawData.objects.bulk_create(data)
+        generate_cache(
+            self.datasource, self.from_timestamp, self.to_timestamp)
+
+    def expected_days(self, from_timestamp, to_timestamp):
+        return list(aggregate_sum_ranged_sample_sequence(
+            self.datasource.hourly_accumulated(from_timestamp, to_timestamp),
+            condense.DAYS, self.timezone))
+
+    def test_generate_rollup_cache(self):
+        generate_rollup_cache(
+            self.datasource, self.timezone,
+            self.from_timestamp, self.to_timestamp)
+        self.assertEqual(
+            [
+                (timestamp, PhysicalQuantity(value, 'milliwatt*hour'))
+                for timestamp, value in
+                DayAccumulatedData.objects.filter(
+                    datasource=self.datasource).order_by(
+                    'timestamp').values_list('timestamp', 'value')
+            ],
+            [
+                (sample.from_timestamp, sample.physical_quantity)
+                for sample in self.expected_days(
+                    self.from_timestamp, self.to_timestamp)
+            ])
+        # No complete month is covered.
+        self.assertFalse(MonthAccumulatedData.objects.exists())
+
+    def test_get_daily_accumulated(self):
+        expected = self.expected_days(self.from_timestamp, self.to_timestamp)
+        without_cache = get_daily_accumulated(
+            self.datasource, self.timezone,
+            self.from_timestamp, self.to_timestamp)
+        generate_rollup_cache(
+            self.datasource, self.timezone,
+            self.from_timestamp, self.to_timestamp)
+        with_cache = get_daily_accumulated(
+            self.datasource, self.timezone,
+            self.from_timestamp, self.to_timestamp)
+        self.assertEqual(
+            [(s.from_timestamp, s.to_timestamp, s.physical_quantity)
+             for s in without_cache],
+            [(s.from_timestamp, s.to_timestamp, s.physical_quantity)
+             for s in expected])
+        self.assertEqual(with_cache, without_cache)
+
+    def test_get_rolled_up_accumulated_partial_days(self):
+        from_timestamp = self.from_timestamp + datetime.timedelta(hours=5)
+        to_timestamp = self.to_timestamp - datetime.timedelta(hours=3)
+        samples = get_rolled_up_accumulated(
+            self.datasource, self.timezone,
+            from_timestamp, to_timestamp, condense.MONTHS)
+        self.assertEqual(
+            [(s.from_timestamp, s.to_timestamp, s.physical_quantity)
+             for s in aggregate_sum_ranged_sample_sequence(
+                 samples, condense.DAYS, self.timezone)],
+            [(s.from_timestamp, s.to_timestamp, s.physical_quantity)
+             for s in self.expected_days(from_timestamp, to_timestamp)])
+
+    def test_delete_invalidates(self):
+        generate_rollup_cache(
+            self.datasource, self.timezone,
+            self.from_timestamp, self.to_timestamp)
+        RawData.objects.get(
+            datasource=self.datasource,
+            timestamp=self.timezone.localize(
+                datetime.datetime(2014, 3, 31, 12))).delete()
+        self.assertEqual(
+            list(DayAccumulatedData.objects.filter(
+                datasource=self.datasource).order_by(
+                'timestamp').values_list('timestamp', flat=True)),
+            [
+                self.timezone.localize(datetime.datetime(2014, 3, 29)),
+                self.timezone.localize(datetime.datetime(2014, 3, 30)),
+                self.timezone.localize(datetime.datetime(2014, 4, 1)),
+            ])
+
+
 @override_settings(
     ENCRYPTION_TESTMODE=True)
 class GenerateCacheTest(TestCase):
@@ -274,6 +579,39 @@ class GenerateCacheTest(TestCase):
                 'timestamp').values_list('timestamp', 'value')),
             expected_minutes)
 
+    def test_bounded_inserts(self):
+        from_timestamp = datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc)
+        to_timestamp = datetime.datetime(2014, 4, 14, 15, tzinfo=pytz.utc)
+        data = [
+            (datetime.datetime(2014, 4, 14, 11, tzinfo=pytz.utc), 5),
+            (datetime.datetime(2014, 4, 14, 17, tzinfo=pytz.utc), 77),
+        ]
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.datasource, value=value, timestamp=timestamp)
+            for timestamp, value in data])
+        chunks = []
+        bulk_create = FiveMinuteAccumulatedData.objects.bulk_create
+
+        def record_bulk_create(objs):
+            chunks.append(len(objs))
+            return bulk_create(objs)
+        with patch('gridplatform.condensing.models.RAW_DATA_CHUNK_SIZE', 5), \
+                patch.object(
+                    FiveMinuteAccumulatedData.objects, 'bulk_create',
+                    side_effect=record_bulk_create):
+            generate_cache(self.datasource, from_timestamp, to_timestamp)
+        self.assertEqual(chunks, [5, 5, 5, 5, 4])
+        self.assertEqual(
+            list(self.datasource.houraccumulateddata_set.order_by(
+                'timestamp').values_list('timestamp', 'value')),
+            [
+                (datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc), 12),
+                (datetime.datetime(2014, 4, 14, 14, tzinfo=pytz.utc), 12),
+            ])
+        self.assertEqual(
+            self.datasource.fiveminuteaccumulateddata_set.count(), 24)
+
     def test_partial(self):
         from_timestamp = datetime.datetime(2014, 4, 14, 11, tzinfo=pytz.utc)
         to_timestamp = datetime.datetime(2014, 4, 14, 17, tzinfo=pytz.utc)
@@ -326,6 +664,179 @@ class GenerateCacheTest(TestCase):
             expected_minutes)
 
 
+@override_settings(
+    ENCRYPTION_TESTMODE=True)
+class BuildCacheIncrementallyTest(TestCase):
+    def setUp(self):
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+
+    def test_initial(self):
+        data = [
+            (datetime.datetime(2014, 4, 14, 12, 30, tzinfo=pytz.utc), 5),
+            (datetime.datetime(2014, 4, 14, 15, 30, tzinfo=pytz.utc), 41),
+        ]
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.datasource, value=value, timestamp=timestamp)
+            for timestamp, value in data])
+        build_cache_incrementally(
+            [self.datasource],
+            datetime.datetime(2014, 4, 14, 17, tzinfo=pytz.utc))
+        expected_hours = [
+            (datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc), 12),
+            (datetime.datetime(2014, 4, 14, 14, tzinfo=pytz.utc), 12),
+        ]
+        self.assertEqual(
+            list(self.datasource.houraccumulateddata_set.order_by(
+                'timestamp').values_list('timestamp', 'value')),
+            expected_hours)
+        self.assertEqual(
+            self.datasource.fiveminuteaccumulateddata_set.count(), 24)
+        self.assertEqual(
+            CacheWatermark.objects.get(
+                datasource_id=self.datasource.id).timestamp,
+            datetime.datetime(2014, 4, 14, 15, tzinfo=pytz.utc))
+
+    def test_resume_from_watermark(self):
+        data = [
+            (datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc), 5),
+            (datetime.datetime(2014, 4, 14, 14, 30, tzinfo=pytz.utc), 23),
+        ]
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.datasource, value=value, timestamp=timestamp)
+            for timestamp, value in data])
+        to_timestamp = datetime.datetime(2014, 4, 14, 17, tzinfo=pytz.utc)
+        build_cache_incrementally([self.datasource], to_timestamp)
+        RawData.objects.create(
+            datasource=self.datasource, value=47,
+            timestamp=datetime.datetime(2014, 4, 14, 16, 30, tzinfo=pytz.utc))
+        build_cache_incrementally([self.datasource], to_timestamp)
+        expected_hours = [
+            (datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc), 12),
+            (datetime.datetime(2014, 4, 14, 14, tzinfo=pytz.utc), 12),
+            (datetime.datetime(2014, 4, 14, 15, tzinfo=pytz.utc), 12),
+        ]
+        self.assertEqual(
+            list(self.datasource.houraccumulateddata_set.order_by(
+                'timestamp').values_list('timestamp', 'value')),
+            expected_hours)
+        self.assertEqual(
+            self.datasource.fiveminuteaccumulateddata_set.count(), 36)
+        self.assertEqual(
+            CacheWatermark.objects.get(
+                datasource_id=self.datasource.id).timestamp,
+            datetime.datetime(2014, 4, 14, 16, tzinfo=pytz.utc))
+
+    def test_batch_queries(self):
+        datasources = [self.datasource] + [
+            DataSource.objects.create(unit='milliwatt*hour')
+            for n in range(3)]
+        RawData.objects.bulk_create([
+            RawData(datasource=datasource, value=value, timestamp=timestamp)
+            for datasource in datasources
+            for timestamp, value in [
+                (datetime.datetime(2014, 4, 14, 12, 30, tzinfo=pytz.utc), 5),
+                (datetime.datetime(2014, 4, 14, 15, 30, tzinfo=pytz.utc), 41),
+            ]])
+        to_timestamp = datetime.datetime(2014, 4, 14, 17, tzinfo=pytz.utc)
+        with patch('gridplatform.condensing.models._store_streamed_cache') \
+                as store:
+            with CaptureQueriesContext(connection) as single:
+                build_cache_incrementally(datasources[:1], to_timestamp)
+            with CaptureQueriesContext(connection) as batch:
+                build_cache_incrementally(datasources[1:], to_timestamp)
+        # apart from reading the raw data of each data source
+        self.assertEqual(len(single), len(batch))
+        self.assertEqual(
+            store.call_args_list,
+            [call(datasource,
+                  datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc),
+                  datetime.datetime(2014, 4, 14, 15, tzinfo=pytz.utc),
+                  ENGINE_FRACTION)
+             for datasource in datasources])
+        self.assertEqual(
+            list(CacheWatermark.objects.order_by(
+                'datasource_id').values_list('datasource_id', 'timestamp')),
+            [(datasource.id,
+              datetime.datetime(2014, 4, 14, 15, tzinfo=pytz.utc))
+             for datasource in datasources])
+
+    def test_numpy_engine(self):
+        other = DataSource.objects.create(unit='milliwatt*hour')
+        timestamp = datetime.datetime(2014, 4, 14, 12, 17, tzinfo=pytz.utc)
+        data = []
+        for n in range(50):
+            data.append((timestamp, n ** 2))
+            timestamp += datetime.timedelta(minutes=7 + n % 11)
+        RawData.objects.bulk_create([
+            RawData(datasource=datasource, value=value, timestamp=sampled)
+            for datasource in [self.datasource, other]
+            for sampled, value in data])
+        to_timestamp = datetime.datetime(2014, 4, 14, 22, tzinfo=pytz.utc)
+        with patch('gridplatform.condensing.models.generate_period_data',
+                   side_effect=generate_period_data) as mock:
+            build_cache_incrementally(
+                [self.datasource], to_timestamp, engine=ENGINE_NUMPY)
+        self.assertEqual(mock.call_args[0][5], ENGINE_NUMPY)
+        build_cache_incrementally([other], to_timestamp)
+        for cache_set in ['houraccumulateddata_set',
+                          'fiveminuteaccumulateddata_set']:
+            self.assertEqual(
+                list(getattr(self.datasource, cache_set).order_by(
+                    'timestamp').values_list('timestamp', 'value')),
+                list(getattr(other, cache_set).order_by(
+                    'timestamp').values_list('timestamp', 'value')))
+
+    def test_get_hourly_accumulated_engine(self):
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.datasource, value=value, timestamp=timestamp)
+            for timestamp, value in [
+                (datetime.datetime(2014, 4, 14, 12, 30, tzinfo=pytz.utc), 5),
+                (datetime.datetime(2014, 4, 14, 15, 10, tzinfo=pytz.utc), 37),
+            ]])
+        from_timestamp = datetime.datetime(2014, 4, 14, 12, tzinfo=pytz.utc)
+        to_timestamp = datetime.datetime(2014, 4, 14, 16, tzinfo=pytz.utc)
+        with patch('gridplatform.condensing.models.generate_period_data',
+                   side_effect=generate_period_data) as mock:
+            samples = get_hourly_accumulated(
+                self.datasource, from_timestamp, to_timestamp, ENGINE_NUMPY)
+        self.assertEqual(mock.call_args[0][5], ENGINE_NUMPY)
+        self.assertEqual(
+            samples,
+            get_hourly_accumulated(
+                self.datasource, from_timestamp, to_timestamp))
+
+    def test_delete_moves_watermark_back(self):
+        data = [
+            (datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc), 5),
+            (datetime.datetime(2014, 4, 14, 14, 30, tzinfo=pytz.utc), 23),
+            (datetime.datetime(2014, 4, 14, 16, 30, tzinfo=pytz.utc), 47),
+        ]
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.datasource, value=value, timestamp=timestamp)
+            for timestamp, value in data])
+        to_timestamp = datetime.datetime(2014, 4, 14, 17, tzinfo=pytz.utc)
+        build_cache_incrementally([self.datasource], to_timestamp)
+        RawData.objects.get(
+            timestamp=datetime.datetime(
+                2014, 4, 14, 16, 30, tzinfo=pytz.utc)).delete()
+        self.assertEqual(
+            CacheWatermark.objects.get(
+                datasource_id=self.datasource.id).timestamp,
+            datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc))
+        build_cache_incrementally([self.datasource], to_timestamp)
+        expected_hours = [
+            (datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc), 12),
+        ]
+        self.assertEqual(
+            list(self.datasource.houraccumulateddata_set.order_by(
+                'timestamp').values_list('timestamp', 'value')),
+            expected_hours)
+
+
 class MissingPeriodsTest(SimpleTestCase):
     def test_missing_periods(self):
         from_timestamp = datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc)
@@ -427,6 +938,140 @@ class GeneratePeriodDataTest(SimpleTestCase):
             expected)
 
 
+class VectorisedGeneratePeriodDataTest(SimpleTestCase):
+    """
+    Randomised check of the NumPy engine of `generate_period_data()` against
+    the Fraction based engine, and of properties both must satisfy, on data
+    generated from a number of fixed seeds.
+    """
+    SEEDS = range(8)
+    CASES_PER_SEED = 60
+
+    def random_data(self, rng, start, max_value):
+        timestamp = start + datetime.timedelta(
+            seconds=rng.randint(-3600, 3600))
+        value = rng.randint(-max_value, max_value)
+        data = []
+        for n in range(rng.randint(1, 200)):
+            data.append((timestamp, value))
+            timestamp += datetime.timedelta(
+                seconds=rng.choice([
+                    1, 10, rng.randint(1, 900),
+                    rng.randint(1, 4 * 3600),
+                    5 * 60, 60 * 60]))
+            # Mostly increasing, with the occasional meter reset.
+            if rng.random() < 0.02:
+                value = rng.randint(-max_value, max_value)
+            else:
+                value += rng.randint(0, max_value // 100 + 1)
+        return data
+
+    def assert_engines_agree(self, data, from_timestamp, to_timestamp,
+                             period_length, interpolate_fn, msg=None):
+        self.assertEqual(
+            list(generate_period_data(
+                data, from_timestamp, to_timestamp, period_length,
+                interpolate_fn, ENGINE_NUMPY)),
+            list(generate_period_data(
+                data, from_timestamp, to_timestamp, period_length,
+                interpolate_fn, ENGINE_FRACTION)),
+            msg)
+
+    def random_cases(self):
+        """
+        Yield `(msg, data, from_timestamp, to_timestamp, interpolate_fn)`;
+        `msg` identifies the case for reproducing failures.
+        """
+        start = datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc)
+        for seed in self.SEEDS:
+            rng = random.Random(seed)
+            for case in range(self.CASES_PER_SEED):
+                from_timestamp = start + datetime.timedelta(
+                    hours=rng.randint(-24, 24))
+                to_timestamp = from_timestamp + datetime.timedelta(
+                    hours=rng.randint(0, 48))
+                data = self.random_data(
+                    rng, start, rng.choice([10, 10 ** 6, 10 ** 15]))
+                interpolate_fn = rng.choice(
+                    [interpolate, impulse_interpolate])
+                yield ('seed %d, case %d' % (seed, case), data,
+                       from_timestamp, to_timestamp, interpolate_fn)
+
+    def test_engines_agree(self):
+        for msg, data, from_timestamp, to_timestamp, interpolate_fn in \
+                self.random_cases():
+            for period_length in [
+                    datetime.timedelta(minutes=5),
+                    datetime.timedelta(hours=1)]:
+                self.assert_engines_agree(
+                    data, from_timestamp, to_timestamp, period_length,
+                    interpolate_fn, msg)
+
+    def test_increases_telescope(self):
+        # The increases of consecutive periods sum to the increase across
+        # all of them.
+        for msg, data, from_timestamp, to_timestamp, interpolate_fn in \
+                self.random_cases():
+            period_length = datetime.timedelta(minutes=5)
+            adjusted_from, adjusted_to = adjust_from_to(
+                data, from_timestamp, to_timestamp, period_length)
+            increases = list(generate_period_data(
+                data, from_timestamp, to_timestamp, period_length,
+                interpolate_fn, ENGINE_NUMPY))
+            if adjusted_from is None:
+                self.assertEqual(increases, [], msg)
+                continue
+            aligned = period_aligned(
+                data, adjusted_from, adjusted_to, period_length,
+                interpolate_fn)
+            first = next(aligned)
+            last = first
+            for last in aligned:
+                pass
+            self.assertEqual(
+                [timestamp for timestamp, increase in increases],
+                [adjusted_from + period_length * n
+                 for n in range(len(increases))],
+                msg)
+            self.assertEqual(
+                sum(increase for timestamp, increase in increases),
+                last[1] - first[1],
+                msg)
+
+    def test_hours_from_five_minutes(self):
+        for msg, data, from_timestamp, to_timestamp, interpolate_fn in \
+                self.random_cases():
+            self.assertEqual(
+                list(hours_from_five_minutes(generate_period_data(
+                    data, from_timestamp, to_timestamp,
+                    datetime.timedelta(minutes=5), interpolate_fn,
+                    ENGINE_NUMPY))),
+                list(generate_period_data(
+                    data, from_timestamp, to_timestamp,
+                    datetime.timedelta(hours=1), interpolate_fn,
+                    ENGINE_NUMPY)),
+                msg)
+
+    def test_aligned_endpoints(self):
+        from_timestamp = datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc)
+        to_timestamp = datetime.datetime(2014, 4, 14, 15, tzinfo=pytz.utc)
+        data = [
+            (datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc), 5),
+            (datetime.datetime(2014, 4, 14, 13, 20, tzinfo=pytz.utc), 7),
+            (datetime.datetime(2014, 4, 14, 15, tzinfo=pytz.utc), 25),
+        ]
+        for interpolate_fn in [interpolate, impulse_interpolate]:
+            self.assert_engines_agree(
+                data, from_timestamp, to_timestamp,
+                datetime.timedelta(minutes=5), interpolate_fn)
+
+    def test_single_point(self):
+        timestamp = datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc)
+        self.assert_engines_agree(
+            [(timestamp, 5)], timestamp, timestamp,
+            datetime.timedelta(hours=1), interpolate)
+
+
 @override_settings(
     ENCRYPTION_TESTMODE=True)
 class RawDataForCacheTest(TestCase):
@@ -536,6 +1181,101 @@ class RawDataForCacheTest(TestCase):
             data[1:-1])
 
 
+@override_settings(
+    ENCRYPTION_TESTMODE=True)
+class IterRawDataForCacheTest(TestCase):
+    def setUp(self):
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+        self.from_timestamp = datetime.datetime(
+            2014, 4, 14, 13, tzinfo=pytz.utc)
+        self.to_timestamp = datetime.datetime(
+            2014, 4, 14, 19, tzinfo=pytz.utc)
+
+    def create(self, data):
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.datasource, value=value, timestamp=timestamp)
+            for timestamp, value in data])
+
+    def test_no_data(self):
+        self.assertEqual(
+            list(iter_raw_data_for_cache(
+                self.datasource, self.from_timestamp, self.to_timestamp)),
+            [])
+
+    def test_outside(self):
+        data = [
+            (datetime.datetime(2014, 4, 14, 11, tzinfo=pytz.utc), 5),
+            (datetime.datetime(2014, 4, 14, 17, tzinfo=pytz.utc), 7),
+            (datetime.datetime(2014, 4, 14, 22, tzinfo=pytz.utc), 8),
+        ]
+        self.create(data + [
+            (datetime.datetime(2014, 4, 14, 10, tzinfo=pytz.utc), 4),
+            (datetime.datetime(2014, 4, 14, 23, tzinfo=pytz.utc), 9),
+        ])
+        self.assertEqual(
+            list(iter_raw_data_for_cache(
+                self.datasource, self.from_timestamp, self.to_timestamp)),
+            data)
+
+    def test_single_timestamp(self):
+        data = [(self.from_timestamp, 5)]
+        self.create(data)
+        self.assertEqual(
+            list(iter_raw_data_for_cache(
+                self.datasource, self.from_timestamp, self.from_timestamp)),
+            data)
+
+    def test_chunks(self):
+        data = [
+            (self.from_timestamp + datetime.timedelta(minutes=7 * n), n ** 2)
+            for n in range(-1, 53)
+        ]
+        self.create(data)
+        # Data before the last data at from_timestamp is not needed.
+        self.assertEqual(
+            list(iter_raw_data_for_cache(
+                self.datasource, self.from_timestamp, self.to_timestamp,
+                chunk_size=5)),
+            data[1:])
+
+    def test_generate_period_data_across_chunks(self):
+        data = [
+            (self.from_timestamp + datetime.timedelta(minutes=7 * n), n ** 2)
+            for n in range(-1, 53)
+        ]
+        self.create(data)
+        period_length = datetime.timedelta(minutes=5)
+        self.assertEqual(
+            list(generate_period_data(
+                iter_raw_data_for_cache(
+                    self.datasource, self.from_timestamp, self.to_timestamp,
+                    chunk_size=3),
+                self.from_timestamp, self.to_timestamp, period_length,
+                interpolate)),
+            list(generate_period_data(
+                data, self.from_timestamp, self.to_timestamp, period_length,
+                interpolate)))
+
+
+class HoursFromFiveMinutesTest(SimpleTestCase):
+    def test_telescopes(self):
+        from_timestamp = datetime.datetime(2014, 4, 14, 12, tzinfo=pytz.utc)
+        to_timestamp = datetime.datetime(2014, 4, 14, 19, tzinfo=pytz.utc)
+        data = [
+            (datetime.datetime(2014, 4, 14, 12, 40, 17, tzinfo=pytz.utc), 3),
+            (datetime.datetime(2014, 4, 14, 15, 11, tzinfo=pytz.utc), 37),
+            (datetime.datetime(2014, 4, 14, 17, 59, 59, tzinfo=pytz.utc), 71),
+        ]
+        self.assertEqual(
+            list(hours_from_five_minutes(generate_period_data(
+                data, from_timestamp, to_timestamp,
+                datetime.timedelta(minutes=5), interpolate))),
+            list(generate_period_data(
+                data, from_timestamp, to_timestamp,
+                datetime.timedelta(hours=1), interpolate)))
+
+
 class AdjustFromToTest(SimpleTestCase):
     def test_noop_covered(self):
         from_timestamp = datetime.datetime(2014, 4, 14, 13, tzinfo=pytz.utc)
@@ -722,3 +1462,200 @@ class PeriodAlignedTest(SimpleTestCase):
                 data, from_timestamp, to_timestamp,
                 period_length, interpolate)),
             expected)
+
+
+@override_settings(
+    ENCRYPTION_TESTMODE=True)
+class GenerateCacheCommandTest(TestCase):
+    def setUp(self):
+        self.timezone = pytz.timezone('Europe/Copenhagen')
+        Provider.objects.create()
+        Customer.objects.create(timezone=self.timezone)
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+        self.now = datetime.datetime.now(pytz.utc).replace(
+            minute=0, second=0, microsecond=0)
+
+    def add_raw_data(self, from_timestamp, to_timestamp):
+        data = []
+        timestamp = from_timestamp
+        while timestamp <= to_timestamp:
+            # Accumulated value increases by 7 per half hour.
+            value = int(
+                (timestamp - self.now).total_seconds() / (30 * 60) * 7)
+            data.append(RawData(
+                datasource=self.datasource, value=10 ** 6 + value,
+                timestamp=timestamp))
+            timestamp += datetime.timedelta(minutes=30)
+        RawData.objects.bulk_create(data)
+
+    def expected_days(self):
+        hours = HourAccumulatedData.objects.filter(
+            datasource=self.datasource).order_by('timestamp')
+        day = condense.ceil(
+            hours.first().timestamp, condense.DAYS, self.timezone)
+        end = condense.floor(
+            hours.last().timestamp + datetime.timedelta(hours=1),
+            condense.DAYS, self.timezone)
+        days = []
+        while day < end:
+            days.append(day)
+            day += condense.DAYS
+        return days
+
+    def test_incremental_rollup(self):
+        self.add_raw_data(
+            self.now - datetime.timedelta(days=5),
+            self.now - datetime.timedelta(days=3))
+        call_command(
+            'generate_cache', incremental=True, rollup=True, verbosity=0)
+        first_days = self.expected_days()
+        self.assertNotEqual(first_days, [])
+        self.assertEqual(
+            list(DayAccumulatedData.objects.filter(
+                datasource=self.datasource).order_by(
+                'timestamp').values_list('timestamp', flat=True)),
+            first_days)
+
+        # Days completed by raw data received since the previous run are
+        # rolled up by the next incremental run.
+        self.add_raw_data(
+            self.now - datetime.timedelta(days=3) +
+            datetime.timedelta(minutes=30),
+            self.now)
+        call_command(
+            'generate_cache', incremental=True, rollup=True, verbosity=0)
+        days = self.expected_days()
+        self.assertGreater(len(days), len(first_days))
+        self.assertEqual(
+            list(DayAccumulatedData.objects.filter(
+                datasource=self.datasource).order_by(
+                'timestamp').values_list('timestamp', flat=True)),
+            days)
+
+    def test_incremental_without_rollup(self):
+        self.add_raw_data(
+            self.now - datetime.timedelta(days=3), self.now)
+        call_command('generate_cache', incremental=True, verbosity=0)
+        self.assertTrue(HourAccumulatedData.objects.filter(
+            datasource=self.datasource).exists())
+        self.assertFalse(DayAccumulatedData.objects.exists())
+
+    def test_workers_and_chunk_days(self):
+        self.add_raw_data(
+            self.now - datetime.timedelta(days=4), self.now)
+        calls = []
+
+        def record_map(function, arguments, workers):
+            arguments = list(arguments)
+            calls.append((arguments, workers))
+            return itertools.imap(function, arguments)
+        with patch('gridplatform.condensing.management.commands.'
+                   'generate_cache._map', side_effect=record_map):
+            call_command(
+                'generate_cache', days=3, workers=2, chunk_days=1,
+                verbosity=0)
+        [(chunks, workers)] = calls
+        self.assertEqual(workers, 2)
+        self.assertEqual(
+            sorted((period_from, period_to)
+                   for _, period_from, period_to, _ in chunks),
+            [
+                (self.now - datetime.timedelta(days=n + 1),
+                 self.now - datetime.timedelta(days=n))
+                for n in reversed(range(3))
+            ])
+        self.assertEqual(
+            HourAccumulatedData.objects.filter(
+                datasource=self.datasource).count(), 3 * 24)
+
+    def test_incremental_batches(self):
+        other = DataSource.objects.create(unit='milliwatt*hour')
+        calls = []
+
+        def record_map(function, arguments, workers):
+            arguments = list(arguments)
+            calls.append((arguments, workers))
+            return itertools.imap(function, arguments)
+        with patch('gridplatform.condensing.management.commands.'
+                   'generate_cache._map', side_effect=record_map):
+            call_command(
+                'generate_cache', incremental=True, batch_size=1, workers=3,
+                verbosity=0)
+        [(batches, workers)] = calls
+        self.assertEqual(workers, 3)
+        self.assertEqual(
+            [(ids, batch_size, engine)
+             for ids, _, batch_size, engine in batches],
+            [([self.datasource.id], 1, ENGINE_FRACTION),
+             ([other.id], 1, ENGINE_FRACTION)])
+
+    def test_empty_incremental_batch(self):
+        self.assertEqual(
+            _build_cache_incrementally_batch(
+                ([], self.now, 100, ENGINE_FRACTION))[0], 0)
+
+    def test_invalid_options(self):
+        for options in [
+                {'workers': 0}, {'chunk_days': 0},
+                {'incremental': True, 'batch_size': 0}]:
+            with self.assertRaises(CommandError):
+                call_command('generate_cache', days=1, verbosity=0, **options)
+
+
+def _square(value):
+    return value ** 2
+
+
+class GenerateCacheCommandHelpersTest(SimpleTestCase):
+    def test_make_periods(self):
+        from_timestamp = datetime.datetime(2014, 4, 1, tzinfo=pytz.utc)
+        to_timestamp = datetime.datetime(2014, 4, 10, tzinfo=pytz.utc)
+        self.assertEqual(
+            list(_make_periods(from_timestamp, to_timestamp, 4)),
+            [
+                (datetime.datetime(2014, 4, 6, tzinfo=pytz.utc),
+                 to_timestamp),
+                (datetime.datetime(2014, 4, 2, tzinfo=pytz.utc),
+                 datetime.datetime(2014, 4, 6, tzinfo=pytz.utc)),
+                (from_timestamp,
+                 datetime.datetime(2014, 4, 2, tzinfo=pytz.utc)),
+            ])
+
+    def test_map_in_process(self):
+        self.assertEqual(list(_map(_square, range(5), 1)), [0, 1, 4, 9, 16])
+
+    @patch('gridplatform.condensing.management.commands.generate_cache.'
+           'connection')
+    def test_map_pool(self, connection):
+        self.assertEqual(
+            sorted(_map(_square, range(20), 2)),
+            [n ** 2 for n in range(20)])
+        connection.close.assert_called_once_with()
+
+    @patch('gridplatform.condensing.management.commands.generate_cache.'
+           'connection', Mock())
+    @patch('gridplatform.condensing.management.commands.generate_cache.'
+           'multiprocessing.Pool')
+    def test_map_pool_joined(self, pool_class):
+        pool = pool_class.return_value
+        pool.imap_unordered.return_value = iter([1, 4])
+        self.assertEqual(list(_map(_square, [1, 2], 2)), [1, 4])
+        pool_class.assert_called_once_with(2)
+        pool.close.assert_called_once_with()
+        pool.join.assert_called_once_with()
+        self.assertFalse(pool.terminate.called)
+
+    @patch('gridplatform.condensing.management.commands.generate_cache.'
+           'connection', Mock())
+    @patch('gridplatform.condensing.management.commands.generate_cache.'
+           'multiprocessing.Pool')
+    def test_map_pool_terminated(self, pool_class):
+        pool = pool_class.return_value
+        pool.imap_unordered.return_value = iter([1, 4])
+        results = _map(_square, [1, 2], 2)
+        next(results)
+        # as when the loop of the caller raises
+        results.close()
+        pool.terminate.assert_called_once_with()
+        pool.join.assert_called_once_with()
+        self.assertFalse(pool.close.called)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy implementation of the period alignment done by
+:func:`gridplatform.condensing.models.period_aligned` and
+:func:`gridplatform.condensing.models.generate_period_data`.
+
+Rather than stepping through each pair of raw data points in Python, the raw
+data points surrounding the period-aligned timestamps are located with
+:func:`numpy.searchsorted`, and interpolation is done on arrays of their epoch
+seconds and values in exact integer arithmetic as numerator/denominator
+pairs.  Results are thus identical to those of the :class:`fractions.Fraction`
+based implementation.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from fractions import Fraction
+import datetime
+
+import numpy
+import pytz
+
+from gridplatform.datasources.models import impulse_interpolate
+from gridplatform.datasources.models import interpolate
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+# Intermediate products of values and timespans in seconds must stay below
+# this to be computed safely in int64.
+_INT64_SAFE = 2 ** 62
+
+
+def _epoch_seconds(timestamp):
+    delta = timestamp - _EPOCH
+    return delta.days * 24 * 60 * 60 + delta.seconds
+
+
+def period_differences(
+        data, from_timestamp, to_timestamp, period_length, interpolate_fn):
+    """
+    Vectorised equivalent of taking the pairwise differences of
+    :func:`gridplatform.condensing.models.period_aligned`; i.e. yield
+    `(timestamp, increase)` for each period of length `period_length` from
+    `from_timestamp` to `to_timestamp`.
+
+    Preconditions are those of `period_aligned()`.  `interpolate_fn` must be
+    either :func:`gridplatform.datasources.models.interpolate` or
+    :func:`gridplatform.datasources.models.impulse_interpolate`.
+    """
+    assert from_timestamp <= to_timestamp
+    period_seconds = int(period_length.total_seconds())
+    from_seconds = _epoch_seconds(from_timestamp)
+    count, remainder = divmod(
+        _epoch_seconds(to_timestamp) - from_seconds, period_seconds)
+    assert remainder == 0
+    # Locate the raw data points surrounding each period-aligned point by
+    # binary search on the timestamps of the raw data, all at once.  Only the
+    # values of those raw data points are converted to arrays.
+    raw_timestamps = numpy.fromiter(
+        (_epoch_seconds(timestamp) for timestamp, value in data),
+        dtype=numpy.int64, count=len(data))
+    points = from_seconds + period_seconds * numpy.arange(
+        count + 1, dtype=numpy.int64)
+    assert raw_timestamps[0] <= points[0]
+    assert raw_timestamps[-1] >= points[-1]
+    raw_before = numpy.searchsorted(raw_timestamps, points, side='right') - 1
+    # Only the very last point may coincide with the last raw data point; it
+    # then "interpolates" over an empty timespan.
+    raw_after = numpy.minimum(raw_before + 1, len(data) - 1)
+    used = numpy.union1d(raw_before, raw_after)
+    timestamps = raw_timestamps[used]
+    values = numpy.fromiter(
+        (data[index][1] for index in used.tolist()),
+        dtype=numpy.int64, count=len(used))
+    before = numpy.searchsorted(used, raw_before)
+    after = numpy.searchsorted(used, raw_after)
+
+    if interpolate_fn is impulse_interpolate:
+        numerators = values[before]
+        denominators = numpy.ones_like(numerators)
+    else:
+        assert interpolate_fn is interpolate
+        value_a = values[before]
+        value_b = values[after]
+        spans = timestamps[after] - timestamps[before]
+        offsets = points - timestamps[before]
+        max_value = int(numpy.abs(values).max())
+        max_span = int(timestamps[-1] - timestamps[0])
+        if (2 * max_value + 1) * max(max_span, 1) >= _INT64_SAFE:
+            # Fall back to (still vectorised) arbitrary precision integers.
+            value_a = value_a.astype(object)
+            value_b = value_b.astype(object)
+            spans = spans.astype(object)
+            offsets = offsets.astype(object)
+        at_end = spans == 0
+        numerators = value_a * spans + (value_b - value_a) * offsets
+        denominators = spans
+        numerators[at_end] = value_a[at_end]
+        denominators[at_end] = 1
+
+    numerators = numerators.tolist()
+    denominators = denominators.tolist()
+    timestamp = from_timestamp
+    for n in xrange(count):
+        numerator_a, denominator_a = numerators[n], denominators[n]
+        numerator_b, denominator_b = numerators[n + 1], denominators[n + 1]
+        yield (
+            timestamp,
+            Fraction(
+                numerator_b * denominator_a - numerator_a * denominator_b,
+                denominator_a * denominator_b))
+        timestamp += period_length
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from django.utils.functional import cached_property
+
+from gridplatform.datasequences.models import prefetch_hourly_accumulated
+from gridplatform.datasequences.utils import add_ranged_sample_sequences
+from gridplatform.datasequences.utils import multiply_ranged_sample_sequences
+from gridplatform.datasequences.utils import subtract_ranged_sample_sequences
+from gridplatform.utils import condense
+from gridplatform.utils import sum_or_none
+from gridplatform.utils.unitconversion import PhysicalQuantity
+from gridplatform.utils.unitconversion import sum_quantities
+
+from .models import Consumption
+from .models import MainConsumption
+
+
+def _is_energy(consumption):
+    return PhysicalQuantity.compatible_units(consumption.unit, 'joule') or \
+        PhysicalQuantity.compatible_units(consumption.unit, 'second')
+
+
+class _HourlyData(object):
+    """
+    Hourly utility and energy of individual consumptions, shared between
+    :class:`.ConsumptionMetrics` instances.
+
+    Hourly utility is read with :func:`.prefetch_hourly_accumulated` for all
+    the consumptions requested for a timespan at once, and each consumption
+    is read at most once per timespan.
+    """
+
+    def __init__(self):
+        # {(consumption_id, from_timestamp, to_timestamp):
+        #      (consumption, utility samples, energy samples)}
+        self._data = {}
+
+    def load(self, consumptions, from_timestamp, to_timestamp):
+        """
+        :return: A list of ``(consumption, utility, energy)`` for the given
+            consumptions, where ``utility`` and ``energy`` are lists of hourly
+            ranged samples within the given timespan.
+        """
+        missing = {}
+        for consumption in consumptions:
+            if (consumption.id, from_timestamp, to_timestamp) not in \
+                    self._data:
+                missing[consumption.id] = consumption
+        if missing:
+            prefetch_hourly_accumulated(
+                missing.values(), from_timestamp, to_timestamp)
+        for consumption in missing.values():
+            utility = list(consumption.utility_sequence(
+                from_timestamp, to_timestamp, condense.HOURS))
+            if _is_energy(consumption):
+                energy = utility
+            else:
+                energy = list(consumption.energy_sequence(
+                    from_timestamp, to_timestamp, condense.HOURS))
+            self._data[(consumption.id, from_timestamp, to_timestamp)] = (
+                consumption, utility, energy)
+        return [
+            self._data[(consumption.id, from_timestamp, to_timestamp)]
+            for consumption in consumptions]
+
+
+class ConsumptionMetrics(object):
+    """
+    Evaluates the sums of a :class:`.MainConsumption` or a
+    :class:`.ConsumptionGroup` in a given period together, with the hourly
+    utility of its consumptions read only once.
+
+    Each of the sums equals the result of the corresponding method of
+    :class:`.ConsumptionUnionBase`; e.g. :attr:`.variable_cost` equals
+    ``consumption_union.variable_cost_sum(from_timestamp, to_timestamp)``.
+    When the sums are evaluated through those methods, each of them reads
+    the hourly utility of all the consumptions again.
+
+    The sums are evaluated when first accessed, so sums that are not needed
+    cost nothing.  :attr:`.co2_emissions` is computed from five-minute
+    utility, which is read separately.
+
+    :ivar consumption_union: The :class:`.MainConsumption` or
+        :class:`.ConsumptionGroup`.
+    :ivar from_timestamp: The start of the given period.
+    :ivar to_timestamp: The end of the given period.
+    """
+
+    def __init__(self, consumption_union, from_timestamp, to_timestamp,
+                 hourly_data=None):
+        self.consumption_union = consumption_union
+        self.from_timestamp = from_timestamp
+        self.to_timestamp = to_timestamp
+        if hourly_data is None:
+            hourly_data = _HourlyData()
+        self._hourly_data = hourly_data
+
+    @classmethod
+    def for_unions(cls, consumption_unions, from_timestamp, to_timestamp):
+        """
+        :return: A list of :class:`.ConsumptionMetrics` for the given
+            consumption unions in the given period.  The hourly utility of
+            all their consumptions is read together.
+        """
+        hourly_data = _HourlyData()
+        result = [
+            cls(consumption_union, from_timestamp, to_timestamp, hourly_data)
+            for consumption_union in consumption_unions]
+        timespans = {}
+        for metrics in result:
+            if metrics._intersection is not None:
+                timespans.setdefault(
+                    metrics._intersection, []).extend(metrics._members)
+        for (timespan_from, timespan_to), consumptions in timespans.items():
+            hourly_data.load(consumptions, timespan_from, timespan_to)
+        return result
+
+    @cached_property
+    def _intersection(self):
+        return self.consumption_union.timestamp_range_intersection(
+            self.from_timestamp, self.to_timestamp,
+            self.consumption_union.customer.timezone)
+
+    @cached_property
+    def _members(self):
+        return list(self.consumption_union.consumptions.all())
+
+    @cached_property
+    def _consumptions(self):
+        """
+        ``(consumption, utility, energy)`` for each consumption of the
+        consumption union; see :meth:`._HourlyData.load`.
+        """
+        if self._intersection is None:
+            return []
+        return self._hourly_data.load(
+            self._members, self._intersection.from_timestamp,
+            self._intersection.to_timestamp)
+
+    def _add(self, sequences):
+        return list(add_ranged_sample_sequences(
+            sequences, self._intersection.from_timestamp,
+            self._intersection.to_timestamp, condense.HOURS))
+
+    @cached_property
+    def _hourly_utility(self):
+        if self._intersection is None:
+            return []
+        return self._add([utility for _, utility, _ in self._consumptions])
+
+    @cached_property
+    def _hourly_energy(self):
+        if self._intersection is None:
+            return []
+        return self._add([energy for _, _, energy in self._consumptions])
+
+    @cached_property
+    def _hourly_net_cost(self):
+        tariff = self.consumption_union.tariff
+        if not tariff or not self._hourly_utility:
+            return []
+        return list(multiply_ranged_sample_sequences(
+            self._hourly_utility,
+            tariff.period_set.value_sequence(
+                self.from_timestamp, self.to_timestamp)))
+
+    @cached_property
+    def _hourly_costcompensation_amount(self):
+        if isinstance(self.consumption_union, MainConsumption):
+            return self._main_hourly_costcompensation_amount()
+        else:
+            return self._group_hourly_costcompensation_amount()
+
+    def _group_hourly_costcompensation_amount(self):
+        """
+        :see: :meth:`.ConsumptionGroup.costcompensation_amount_sequence`.
+        """
+        consumptiongroup = self.consumption_union
+        if consumptiongroup.cost_compensation:
+            costcompensation = consumptiongroup.cost_compensation
+        elif consumptiongroup.mainconsumption.cost_compensation:
+            costcompensation = consumptiongroup.mainconsumption.\
+                cost_compensation
+        else:
+            return []
+        return list(multiply_ranged_sample_sequences(
+            self._hourly_energy,
+            costcompensation.period_set.value_sequence(
+                self.from_timestamp, self.to_timestamp)))
+
+    def _main_hourly_costcompensation_amount(self):
+        """
+        :see: :meth:`.MainConsumption.costcompensation_amount_sequence`.
+        """
+        mainconsumption = self.consumption_union
+
+        if mainconsumption.cost_compensation:
+            tainted_consumptions = list(Consumption.objects.filter(
+                consumptiongroup__cost_compensation__isnull=False,
+                consumptiongroup__mainconsumption=mainconsumption))
+            tainted_energy_sequence = add_ranged_sample_sequences(
+                [
+                    utility for _, utility, _ in self._hourly_data.load(
+                        tainted_consumptions,
+                        self.from_timestamp, self.to_timestamp)
+                ],
+                self.from_timestamp, self.to_timestamp, condense.HOURS)
+            untainted_energy_sequence = subtract_ranged_sample_sequences(
+                self._hourly_energy, tainted_energy_sequence)
+            untainted_costcompensation_amount_sequence = \
+                multiply_ranged_sample_sequences(
+                    untainted_energy_sequence,
+                    mainconsumption.cost_compensation.period_set.
+                    value_sequence(self.from_timestamp, self.to_timestamp))
+        else:
+            untainted_costcompensation_amount_sequence = []
+
+        tainted_costcompensation_amount_sequence = add_ranged_sample_sequences(
+            [
+                ConsumptionMetrics(
+                    consumptiongroup, self.from_timestamp, self.to_timestamp,
+                    self._hourly_data)._hourly_costcompensation_amount
+                for consumptiongroup in
+                mainconsumption.consumptiongroup_set.filter(
+                    cost_compensation__isnull=False)
+            ],
+            self.from_timestamp, self.to_timestamp, condense.HOURS)
+
+        return list(add_ranged_sample_sequences(
+            [
+                untainted_costcompensation_amount_sequence,
+                tainted_costcompensation_amount_sequence,
+            ],
+            self.from_timestamp, self.to_timestamp, condense.HOURS))
+
+    @cached_property
+    def energy(self):
+        """
+        :see: :meth:`.ConsumptionUnionBase.energy_sum`.
+        """
+        if self._intersection is None:
+            return None
+        return sum_or_none(
+            quantity for quantity in (
+                sum_quantities(
+                    (sample.physical_quantity for sample in energy),
+                    consumption.unit if _is_energy(consumption) else None)
+                for consumption, _, energy in self._consumptions)
+            if quantity is not None)
+
+    @cached_property
+    def utility(self):
+        """
+        :see: :meth:`.ConsumptionUnionBase.utility_sum`.
+        """
+        if self._intersection is None:
+            return None
+        return sum_or_none(
+            sum_quantities(
+                (sample.physical_quantity for sample in utility),
+                consumption.unit)
+            for consumption, utility, _ in self._consumptions)
+
+    @cached_property
+    def net_cost(self):
+        """
+        :see: :meth:`.ConsumptionUnionBase.net_cost_sum`.
+        """
+        return sum_quantities(
+            sample.physical_quantity for sample in self._hourly_net_cost)
+
+    @cached_property
+    def costcompensation_amount(self):
+        """
+        :see: :meth:`.ConsumptionUnionBase.costcompensation_amount_sum`.
+        """
+        return sum_quantities(
+            sample.physical_quantity
+            for sample in self._hourly_costcompensation_amount)
+
+    @cached_property
+    def variable_cost(self):
+        """
+        :see: :meth:`.ConsumptionUnionBase.variable_cost_sum`.
+        """
+        if self.costcompensation_amount is None:
+            return self.net_cost
+        elif self.net_cost is not None:
+            return self.net_cost - self.costcompensation_amount
+        else:
+            return None
+
+    @cached_property
+    def fixed_cost(self):
+        """
+        :see: :meth:`.MainConsumption.fixed_cost_sum`.  Fixed costs are only
+            defined for main consumptions; ``None`` for consumption groups.
+        """
+        if isinstance(self.consumption_union, MainConsumption):
+            return self.consumption_union.fixed_cost_sum(
+                self.from_timestamp, self.to_timestamp)
+        return None
+
+    @cached_property
+    def total_cost(self):
+        """
+        :see: :meth:`.MainConsumption.total_cost_sum`.
+        """
+        return sum_or_none(
+            x for x in [self.variable_cost, self.fixed_cost]
+            if x is not None)
+
+    @cached_property
+    def co2_emissions(self):
+        """
+        :see: :meth:`.ConsumptionUnionBase.co2_emissions_sum`.
+        """
+        return self.consumption_union.co2_emissions_sum(
+            self.from_timestamp, self.to_timestamp)
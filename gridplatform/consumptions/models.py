@@ -17,6 +17,7 @@ from gridplatform.datasequences.utils import multiply_ranged_sample_sequences
 from gridplatform.datasequences.utils import subtract_ranged_sample_sequences
 from gridplatform.datasequences.utils import aggregate_sum_ranged_sample_sequence  # noqa
 from gridplatform.datasequences.models import EnergyPerVolumeDataSequence
+from gridplatform.datasequences.models import prefetch_hourly_accumulated
 from gridplatform.encryption.fields import EncryptedCharField
 from gridplatform.encryption.fields import EncryptedTextField
 from gridplatform.encryption.models import EncryptedModel
@@ -25,6 +26,7 @@ from gridplatform.trackuser.managers import CustomerBoundManager
 from gridplatform.utils import condense
 from gridplatform.utils import sum_or_none
 from gridplatform.utils.unitconversion import PhysicalQuantity
+from gridplatform.utils.unitconversion import sum_quantities
 from gridplatform.utils.utilitytypes import ENERGY_UTILITY_TYPE_CHOICES
 from gridplatform.utils.utilitytypes import ENERGY_UTILITY_TYPE_TO_BASE_UNIT_MAP  # noqa
 from gridplatform.utils.api import next_valid_date_for_datasequence
@@ -221,6 +223,17 @@ class ConsumptionUnionBase(
                 raise ValidationError(
                     _('Cost compensation cannot be changed once selected'))
 
+    def _prefetched_consumptions(self, from_timestamp, to_timestamp):
+        """
+        :return: The consumptions of this instance with hourly utility in
+            the given period prefetched.
+
+        :see: :func:`.prefetch_hourly_accumulated`.
+        """
+        consumptions = list(self.consumptions.all())
+        prefetch_hourly_accumulated(consumptions, from_timestamp, to_timestamp)
+        return consumptions
+
     def energy_sum(self, from_timestamp, to_timestamp):
         """
         :return: the total energy in the given period.  If
@@ -239,7 +252,8 @@ class ConsumptionUnionBase(
             quantity for quantity in (
                 consumption.energy_sum(
                     intersection.from_timestamp, intersection.to_timestamp)
-                for consumption in self.consumptions.all())
+                for consumption in self._prefetched_consumptions(
+                    intersection.from_timestamp, intersection.to_timestamp))
             if quantity is not None)
 
     def energy_sequence(self, from_timestamp, to_timestamp, resolution):
@@ -257,12 +271,20 @@ class ConsumptionUnionBase(
         if intersection is None:
             return []
 
+        # Coarser resolutions are served by the daily/monthly accumulation
+        # cache.
+        if resolution != condense.HOURS:
+            consumptions = self.consumptions.all()
+        else:
+            consumptions = self._prefetched_consumptions(
+                intersection.from_timestamp, intersection.to_timestamp)
+
         return add_ranged_sample_sequences(
             [
                 consumption.energy_sequence(
                     intersection.from_timestamp, intersection.to_timestamp,
                     resolution)
-                for consumption in self.consumptions.all()
+                for consumption in consumptions
             ],
             intersection.from_timestamp, intersection.to_timestamp, resolution)
 
@@ -284,7 +306,8 @@ class ConsumptionUnionBase(
             quantity for quantity in (
                 consumption.utility_sum(
                     intersection.from_timestamp, intersection.to_timestamp)
-                for consumption in self.consumptions.all())
+                for consumption in self._prefetched_consumptions(
+                    intersection.from_timestamp, intersection.to_timestamp))
             if quantity is not None)
 
     def utility_sequence(self, from_timestamp, to_timestamp, resolution):
@@ -302,12 +325,20 @@ class ConsumptionUnionBase(
         if intersection is None:
             return []
 
+        # Coarser resolutions are served by the daily/monthly accumulation
+        # cache.
+        if resolution != condense.HOURS:
+            consumptions = self.consumptions.all()
+        else:
+            consumptions = self._prefetched_consumptions(
+                intersection.from_timestamp, intersection.to_timestamp)
+
         return add_ranged_sample_sequences(
             [
                 consumption.utility_sequence(
                     intersection.from_timestamp, intersection.to_timestamp,
                     resolution)
-                for consumption in self.consumptions.all()
+                for consumption in consumptions
             ],
             intersection.from_timestamp, intersection.to_timestamp, resolution)
 
@@ -360,7 +391,7 @@ class ConsumptionUnionBase(
         net_cost_sequence = self.net_cost_sequence(
             from_timestamp, to_timestamp, condense.HOURS)
 
-        return sum_or_none(
+        return sum_quantities(
             sample.physical_quantity for sample in net_cost_sequence)
 
     def variable_cost_sum(self, from_timestamp, to_timestamp):
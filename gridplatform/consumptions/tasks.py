@@ -7,9 +7,11 @@ from collections import defaultdict
 
 from gridplatform.trackuser.tasks import task
 from gridplatform.utils import condense
+from gridplatform.datasequences.models import prefetch_hourly_accumulated
 from gridplatform.datasequences.utils import add_ranged_sample_sequences
 from gridplatform.utils.unitconversion import PhysicalQuantity
 
+from .metrics import ConsumptionMetrics
 from .models import ConsumptionGroup
 from .models import MainConsumption
 from .models import Consumption
@@ -25,13 +27,11 @@ def net_cost_sum_and_costcompensation_amount_task(
     result = {}
 
     task.set_progress(0, count)
-    for n, consumptiongroup in enumerate(consumptiongroups):
-        result[consumptiongroup.id] = {
-            'net_cost_sum': consumptiongroup.net_cost_sum(
-                from_timestamp, to_timestamp),
-            'costcompensation_amount_sum': (
-                consumptiongroup.costcompensation_amount_sum(
-                    from_timestamp, to_timestamp)),
+    for n, metrics in enumerate(ConsumptionMetrics.for_unions(
+            consumptiongroups, from_timestamp, to_timestamp)):
+        result[metrics.consumption_union.id] = {
+            'net_cost_sum': metrics.net_cost,
+            'costcompensation_amount_sum': metrics.costcompensation_amount,
         }
 
         task.set_progress(n + 1, count)
@@ -49,9 +49,9 @@ def total_cost_sum_task(
     result = {}
 
     task.set_progress(0, count)
-    for n, mainconsumption in enumerate(mainconsumptions):
-        result[mainconsumption.id] = mainconsumption.total_cost_sum(
-            from_timestamp, to_timestamp)
+    for n, metrics in enumerate(ConsumptionMetrics.for_unions(
+            mainconsumptions, from_timestamp, to_timestamp)):
+        result[metrics.consumption_union.id] = metrics.total_cost
         task.set_progress(n + 1, count)
 
     return result
@@ -93,10 +93,10 @@ def mainconsumptions_weekly_utility_task(
 @task(bind=True)
 def consumptions_weekly_utility_task(
         task, consumption_ids, from_timestamp, to_timestamp):
-    consumptions = Consumption.objects.filter(
-        id__in=consumption_ids)
+    consumptions = list(Consumption.objects.filter(
+        id__in=consumption_ids))
     total_consumptions = len(consumptions)
-
+    prefetch_hourly_accumulated(consumptions, from_timestamp, to_timestamp)
 
     measured = {'week_selected': []}
     for n, consumption in enumerate(consumptions):
@@ -117,11 +117,10 @@ def consumptions_weekly_utility_task(
 @task(bind=True)
 def consumptions_weekly_time_task(
         task, consumption_ids, from_timestamp, to_timestamp):
-    consumptions = Consumption.objects.filter(
-        id__in=consumption_ids)
+    consumptions = list(Consumption.objects.filter(
+        id__in=consumption_ids))
     total_consumptions = len(consumptions)
 
-
     measured = {'week_selected': []}
     for n, consumption in enumerate(consumptions):
         task.set_progress(n, total_consumptions)
@@ -10,6 +10,7 @@ from django.test.utils import override_settings
 from django.core.exceptions import ValidationError
 import pytz
 from mock import patch
+from mock import PropertyMock
 from django.test import RequestFactory
 
 from gridplatform.customers.models import Customer
@@ -36,6 +37,7 @@ from energymanager.energyuses.models import EnergyUse
 from gridplatform.datasequences.models.energyconversion import VolumeToEnergyConversionPeriodManager  # noqa
 from gridplatform.co2conversions.models import Co2ConversionManager
 
+from .metrics import ConsumptionMetrics
 from .models import ConsumptionGroup
 from .models import MainConsumption
 from .models import Consumption
@@ -310,6 +312,27 @@ class ConsumptionUnionBaseTest(TestCase):
                 self.timezone.localize(datetime.datetime(2014, 1, 1)),
                 self.timezone.localize(datetime.datetime(2014, 1, 2))))
 
+    def test_energy_sequence_prefetches_hourly_only(self):
+        subject = TestConsumptionUnion.objects.create(
+            customer=self.customer,
+            from_date=datetime.date(2014, 1, 1))
+        subject.consumptions = [self.consumption]
+        for resolution, prefetched in [
+                (condense.FIVE_MINUTES, False),
+                (condense.HOURS, True),
+                (condense.DAYS, False),
+                (condense.MONTHS, False)]:
+            with patch.object(
+                    Consumption, 'energy_sequence', autospec=True,
+                    return_value=[]), \
+                    patch('gridplatform.consumptions.models.'
+                          'prefetch_hourly_accumulated') as mock:
+                subject.energy_sequence(
+                    self.timezone.localize(datetime.datetime(2014, 1, 1)),
+                    self.timezone.localize(datetime.datetime(2014, 2, 1)),
+                    resolution)
+            self.assertEqual(mock.called, prefetched)
+
     def test_co2_emission_sequence_no_consumptions(self):
         subject = TestConsumptionUnion.objects.create(
             customer=self.customer,
@@ -677,7 +700,8 @@ class NetCostSumAndCostCompensationAmountTaskTest(TestCase):
         costcompensation_amount_sum = PhysicalQuantity(17, 'currency_dkk')
 
         with replace_user(self.user), patch.object(
-                ConsumptionGroup, 'costcompensation_amount_sum',
+                ConsumptionMetrics, 'costcompensation_amount',
+                new_callable=PropertyMock,
                 return_value=costcompensation_amount_sum):
 
             eager = net_cost_sum_and_costcompensation_amount_task.delay(
@@ -698,7 +722,8 @@ class NetCostSumAndCostCompensationAmountTaskTest(TestCase):
         net_cost_sum = PhysicalQuantity(42, 'currency_dkk')
 
         with replace_user(self.user), patch.object(
-                ConsumptionGroup, 'net_cost_sum', return_value=net_cost_sum):
+                ConsumptionMetrics, 'net_cost', new_callable=PropertyMock,
+                return_value=net_cost_sum):
 
             eager = net_cost_sum_and_costcompensation_amount_task.delay(
                 [self.consumptiongroup.id],
@@ -1217,6 +1242,146 @@ class MainConsumptionTest(TestCase):
         self.assertEqual(args, (from_timestamp, to_timestamp))
 
 
+@override_settings(ENCRYPTION_TESTMODE=True)
+class ConsumptionMetricsTest(TestCase):
+    def setUp(self):
+        self.timezone = pytz.timezone('Europe/Copenhagen')
+        self.provider = Provider.objects.create()
+        self.customer = Customer.objects.create(
+            timezone=self.timezone,
+            currency_unit='currency_dkk')
+        self.from_timestamp = self.timezone.localize(
+            datetime.datetime(2014, 1, 1))
+        self.to_timestamp = self.timezone.localize(
+            datetime.datetime(2014, 1, 2))
+
+        self.mainconsumption = MainConsumption.objects.create(
+            customer=self.customer,
+            utility_type=ENERGY_UTILITY_TYPE_CHOICES.electricity,
+            tariff=EnergyTariff.objects.create(customer=self.customer),
+            cost_compensation=CostCompensation.objects.create(
+                customer=self.customer),
+            from_date=datetime.date(2014, 1, 1))
+        FixedPricePeriod.objects.create(
+            from_timestamp=self.from_timestamp,
+            to_timestamp=self.to_timestamp,
+            value=10,
+            unit='currency_dkk*kilowatt^-1*hour^-1',
+            datasequence=self.mainconsumption.tariff,
+            subscription_fee=100,
+            subscription_period=FixedPricePeriod.SUBSCRIPTION_PERIODS.monthly)
+        FixedCompensationPeriod.objects.create(
+            from_timestamp=self.from_timestamp,
+            to_timestamp=self.to_timestamp,
+            value=3,
+            unit='currency_dkk*kilowatt^-1*hour^-1',
+            datasequence=self.mainconsumption.cost_compensation)
+
+        consumption = Consumption.objects.create(
+            unit='milliwatt*hour',
+            customer=self.customer)
+        SingleValuePeriod.objects.create(
+            from_timestamp=self.from_timestamp,
+            to_timestamp=self.to_timestamp,
+            datasequence=consumption,
+            value=42,
+            unit='kilowatt*hour')
+        self.mainconsumption.consumptions.add(consumption)
+
+        self.consumptiongroup = ConsumptionGroup.objects.create(
+            mainconsumption=self.mainconsumption,
+            customer=self.customer,
+            cost_compensation=CostCompensation.objects.create(
+                customer=self.customer),
+            from_date=datetime.date(2014, 1, 1))
+        FixedCompensationPeriod.objects.create(
+            from_timestamp=self.from_timestamp,
+            to_timestamp=self.to_timestamp,
+            value=2,
+            unit='currency_dkk*kilowatt^-1*hour^-1',
+            datasequence=self.consumptiongroup.cost_compensation)
+
+        consumption_part = Consumption.objects.create(
+            unit='milliwatt*hour',
+            customer=self.customer)
+        SingleValuePeriod.objects.create(
+            from_timestamp=self.from_timestamp,
+            to_timestamp=self.to_timestamp,
+            datasequence=consumption_part,
+            value=17,
+            unit='kilowatt*hour')
+        self.mainconsumption.consumptions.add(consumption_part)
+        self.consumptiongroup.consumptions.add(consumption_part)
+
+    def assert_matches_methods(self, consumption_union, metrics):
+        from_timestamp = self.from_timestamp
+        to_timestamp = self.to_timestamp
+        self.assertEqual(
+            consumption_union.energy_sum(from_timestamp, to_timestamp),
+            metrics.energy)
+        self.assertEqual(
+            consumption_union.utility_sum(from_timestamp, to_timestamp),
+            metrics.utility)
+        self.assertEqual(
+            consumption_union.net_cost_sum(from_timestamp, to_timestamp),
+            metrics.net_cost)
+        self.assertEqual(
+            consumption_union.costcompensation_amount_sum(
+                from_timestamp, to_timestamp),
+            metrics.costcompensation_amount)
+        self.assertEqual(
+            consumption_union.variable_cost_sum(from_timestamp, to_timestamp),
+            metrics.variable_cost)
+
+    def test_mainconsumption(self):
+        metrics = ConsumptionMetrics(
+            self.mainconsumption, self.from_timestamp, self.to_timestamp)
+
+        self.assert_matches_methods(self.mainconsumption, metrics)
+        self.assertEqual(
+            PhysicalQuantity(42 + 17, 'kilowatt*hour'), metrics.energy)
+        self.assertEqual(
+            PhysicalQuantity((42 + 17) * 10, 'currency_dkk'),
+            metrics.net_cost)
+        self.assertEqual(
+            PhysicalQuantity(42 * 3 + 17 * 2, 'currency_dkk'),
+            metrics.costcompensation_amount)
+        self.assertEqual(
+            self.mainconsumption.total_cost_sum(
+                self.from_timestamp, self.to_timestamp),
+            metrics.total_cost)
+
+    def test_consumptiongroup(self):
+        metrics = ConsumptionMetrics(
+            self.consumptiongroup, self.from_timestamp, self.to_timestamp)
+
+        self.assert_matches_methods(self.consumptiongroup, metrics)
+        self.assertIsNone(metrics.fixed_cost)
+        self.assertEqual(metrics.variable_cost, metrics.total_cost)
+
+    def test_for_unions(self):
+        mainconsumption_metrics, consumptiongroup_metrics = \
+            ConsumptionMetrics.for_unions(
+                [self.mainconsumption, self.consumptiongroup],
+                self.from_timestamp, self.to_timestamp)
+
+        self.assert_matches_methods(
+            self.mainconsumption, mainconsumption_metrics)
+        self.assert_matches_methods(
+            self.consumptiongroup, consumptiongroup_metrics)
+
+    def test_outside_date_range(self):
+        metrics = ConsumptionMetrics(
+            self.mainconsumption,
+            self.timezone.localize(datetime.datetime(2013, 1, 1)),
+            self.timezone.localize(datetime.datetime(2013, 1, 2)))
+
+        self.assertIsNone(metrics.energy)
+        self.assertIsNone(metrics.utility)
+        self.assertIsNone(metrics.net_cost)
+        self.assertIsNone(metrics.variable_cost)
+
+
 @override_settings(ENCRYPTION_TESTMODE=True)
 class VariableCostSumTest(TestCase):
     def setUp(self):
@@ -1416,7 +1581,7 @@ class TotalCostSumTaskTest(TestCase):
 
         total_cost_quantity = PhysicalQuantity(42, 'currency_dkk')
         patched_total_cost_sum = patch.object(
-            MainConsumption, 'total_cost_sum',
+            ConsumptionMetrics, 'total_cost', new_callable=PropertyMock,
             return_value=total_cost_quantity)
 
         with replace_user(self.user), patched_total_cost_sum:
@@ -15,6 +15,7 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 
 from gridplatform.datasources.models import RawData
+from gridplatform.datasources.models import upsert_raw_data
 from gridplatform.datahub.models import DatahubConnection
 
 
@@ -82,6 +83,7 @@ class Command(BaseCommand):
                 else:
                     sorted_measurements = sorted(
                         measurements, key=itemgetter('DateFrom'))
+                    rows = []
                     for m in sorted_measurements:
                         timestamp = dateutil.parser.parse(m["DateTo"]).replace(
                             tzinfo=pytz.timezone('Europe/Copenhagen'))
@@ -89,19 +91,6 @@ class Command(BaseCommand):
                             continue
                         last_value += int(float(m["Usage"]) * 1000 * 1000)
                         last_timestamp = timestamp
+                        rows.append((timestamp, last_value))
 
-                        RawData.objects.create(
-                            timestamp=timestamp, datasource_id=input_id, value=last_value)
-
-    def _update_or_create(self, timestamp, datasource_id, updated_values):
-        try:
-            obj = RawData.objects.get(
-                timestamp=timestamp, datasource_id=datasource_id)
-            for key, value in updated_values.iteritems():
-                setattr(obj, key, value)
-            obj.save()
-        except RawData.DoesNotExist:
-            updated_values.update(
-                {'timestamp': timestamp, 'datasource_id': datasource_id, 'unit': "milliwatt*hour"})
-            obj = RawData(**updated_values)
-            obj.save()
+                    upsert_raw_data(input_id, rows)
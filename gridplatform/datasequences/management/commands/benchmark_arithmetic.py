@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Defines a ``benchmark_arithmetic`` command with micro-benchmarks of the
+physical quantity arithmetic behind
+:meth:`.AccumulationBase.development_sum`,
+:meth:`.ConsumptionUnionBase.net_cost_sum` and
+:meth:`.ConsumptionUnionBase.net_cost_sequence`, on generated hourly data.
+Each benchmark compares the generic implementation with the bulk one, and
+checks that their results are equal.
+
+example commands:
+./manage.py benchmark_arithmetic
+./manage.py benchmark_arithmetic development_sum --hours 43800
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from fractions import Fraction
+from optparse import make_option
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+import pytz
+
+from gridplatform.datasequences.utils import SampleArray
+from gridplatform.datasequences.utils import aggregate_sum_ranged_sample_sequence  # noqa
+from gridplatform.datasequences.utils import multiply_ranged_sample_sequences
+from gridplatform.utils import condense
+from gridplatform.utils.samples import RangedSample
+from gridplatform.utils.unitconversion import PhysicalQuantity
+from gridplatform.utils.unitconversion import dot_quantities
+from gridplatform.utils.unitconversion import sum_quantities
+
+
+def _hourly(hours, unit, value):
+    timezone = pytz.timezone('Europe/Copenhagen')
+    start = timezone.localize(datetime.datetime(2014, 1, 1))
+    hour = datetime.timedelta(hours=1)
+    return [
+        RangedSample(
+            start + hour * n, start + hour * (n + 1),
+            PhysicalQuantity(value(), unit))
+        for n in range(hours)]
+
+
+def _data(hours):
+    generator = random.Random(0)
+    # Interpolated between raw data points up to an hour apart.
+    utility = _hourly(
+        hours, 'milliwatt*hour', lambda: Fraction(
+            generator.randint(0, 10 ** 7), generator.randint(1, 3600)))
+    tariff = _hourly(
+        hours, 'currency_dkk*kilowatt^-1*hour^-1', lambda: Fraction(
+            generator.randint(0, 10 ** 4), 100))
+    return utility, tariff
+
+
+def development_sum(utility, tariff):
+    quantities = [sample.physical_quantity for sample in utility]
+    return (
+        lambda: sum(quantities, PhysicalQuantity(0, 'milliwatt*hour')),
+        lambda: sum_quantities(quantities, 'milliwatt*hour'))
+
+
+def net_cost_sum(utility, tariff):
+    def generic():
+        return sum(
+            (sample.physical_quantity for sample in
+             multiply_ranged_sample_sequences(utility, tariff)),
+            PhysicalQuantity(0, 'currency_dkk'))
+
+    def bulk():
+        return dot_quantities(
+            [sample.physical_quantity for sample in utility],
+            [sample.physical_quantity for sample in tariff],
+            'currency_dkk')
+
+    return generic, bulk
+
+
+def net_cost_sequence(utility, tariff):
+    timezone = pytz.timezone('Europe/Copenhagen')
+
+    def generic():
+        return list(aggregate_sum_ranged_sample_sequence(
+            multiply_ranged_sample_sequences(utility, tariff),
+            condense.DAYS, timezone))
+
+    def bulk():
+        product = SampleArray.from_samples(utility, 'joule') * \
+            SampleArray.from_samples(tariff, 'currency_dkk*joule^-1')
+        return list(product.aggregate(condense.DAYS, timezone).to_samples(
+            timezone))
+
+    return generic, bulk
+
+
+BENCHMARKS = [
+    ('development_sum', development_sum),
+    ('net_cost_sum', net_cost_sum),
+    ('net_cost_sequence', net_cost_sequence),
+]
+
+
+def _measure(function, repeat):
+    best = None
+    for n in range(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+class Command(BaseCommand):
+    args = '[benchmark ...]'
+    help = 'Benchmark bulk physical quantity arithmetic; benchmarks: %s' % (
+        ', '.join(name for name, benchmark in BENCHMARKS))
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--hours',
+            dest='hours',
+            help='Number of hourly samples',
+            type=int,
+            default=365 * 24,
+        ),
+        make_option(
+            '--repeat',
+            dest='repeat',
+            help='Number of runs; the best is reported',
+            type=int,
+            default=3,
+        ),
+    )
+
+    def handle(self, *args, **options):
+        benchmarks = dict(BENCHMARKS)
+        for name in args:
+            if name not in benchmarks:
+                raise CommandError('unknown benchmark %s' % name)
+        utility, tariff = _data(options['hours'])
+        for name, benchmark in BENCHMARKS:
+            if args and name not in args:
+                continue
+            generic, bulk = benchmark(utility, tariff)
+            generic_elapsed, generic_result = _measure(
+                generic, options['repeat'])
+            bulk_elapsed, bulk_result = _measure(bulk, options['repeat'])
+            if generic_result != bulk_result:
+                raise CommandError('%s: results differ' % name)
+            self.stdout.write('%-20s %10.4f s %10.4f s %8.1fx' % (
+                name, generic_elapsed, bulk_elapsed,
+                generic_elapsed / bulk_elapsed))
@@ -9,6 +9,7 @@ from .accumulation import AccumulationPeriodBase
 from .accumulation import NonpulseAccumulationPeriodMixin
 from .accumulation import PulseAccumulationPeriodMixin
 from .accumulation import SingleValueAccumulationPeriodMixin
+from .accumulation import prefetch_hourly_accumulated
 from .base import DataSequenceBase
 from .base import PeriodBase
 from .base import is_clock_hour
@@ -43,7 +44,8 @@ __all__ = [
     'SingleValueAccumulationPeriodMixin',
     'OfflineToleranceMixin',
     'CurrencyUnitMixin',
-    'is_clock_hour'
+    'is_clock_hour',
+    'prefetch_hourly_accumulated',
 ]
 
 
@@ -19,6 +19,7 @@ from gridplatform.utils.models import StoreSubclass
 from gridplatform.utils.models import StoredSubclassManager
 from gridplatform.utils.relativetimedelta import RelativeTimeDelta
 from gridplatform.utils.unitconversion import PhysicalQuantity
+from gridplatform.utils.unitconversion import sum_quantities
 from gridplatform.utils.units import ACCUMULATION_BASE_UNITS
 from gridplatform.utils.units import IMPULSE_BASE_UNITS
 from gridplatform.utils.samples import Sample
@@ -48,6 +49,20 @@ class AccumulationBase(DataSequenceBase):
         :param to_timestamp:  The end of the given timespan.
 
         :see: Used to implement :meth:`.AccumulationBase.development_sequence`.
+
+        :see: :func:`.prefetch_hourly_accumulated`.
+        """
+        prefetched = getattr(
+            self, '_prefetched_hourly_accumulated', {}).get(
+                (from_timestamp, to_timestamp))
+        if prefetched is not None:
+            return iter(prefetched)
+        return self._period_hourly_accumulated(from_timestamp, to_timestamp)
+
+    def _period_hourly_accumulated(self, from_timestamp, to_timestamp):
+        """
+        Implementation of :meth:`.AccumulationBase._hourly_accumulated` in
+        terms of ``self.period_set``.
         """
         for period in self.period_set.in_range(
                 from_timestamp, to_timestamp).order_by('from_timestamp'):
@@ -74,6 +89,23 @@ class AccumulationBase(DataSequenceBase):
                     period_from, period_to):
                 yield sample
 
+    def _rolled_up_accumulated(self, from_timestamp, to_timestamp, resolution):
+        """
+        Yield accumulating ranged samples of mixed duration within the given
+        timespan, none of which cross a boundary of the given (day or coarser)
+        resolution in the timezone of the customer.
+
+        :see: Used to implement :meth:`.AccumulationBase.development_sequence`.
+        """
+        timezone = self.customer.timezone
+        for period in self.period_set.in_range(
+                from_timestamp, to_timestamp).order_by('from_timestamp'):
+            period_from, period_to = period.overlapping(
+                from_timestamp, to_timestamp)
+            for sample in period._rolled_up_accumulated(
+                    period_from, period_to, timezone, resolution):
+                yield sample
+
     def development_sequence(self, from_timestamp, to_timestamp, resolution):
         """
         :return: a sequence of accumulating ranged samples for given period in
@@ -87,10 +119,16 @@ class AccumulationBase(DataSequenceBase):
             return self._five_minute_accumulated(from_timestamp, to_timestamp)
         elif resolution == RelativeTimeDelta(hours=1):
             return self._hourly_accumulated(from_timestamp, to_timestamp)
-        else:
+        elif (from_timestamp, to_timestamp) in getattr(
+                self, '_prefetched_hourly_accumulated', {}):
             data = self._hourly_accumulated(from_timestamp, to_timestamp)
             return aggregate_sum_ranged_sample_sequence(
                 data, resolution, self.customer.timezone)
+        else:
+            data = self._rolled_up_accumulated(
+                from_timestamp, to_timestamp, resolution)
+            return aggregate_sum_ranged_sample_sequence(
+                data, resolution, self.customer.timezone)
 
     def development_sum(self, from_timestamp, to_timestamp):
         """
@@ -112,10 +150,82 @@ class AccumulationBase(DataSequenceBase):
         assert is_clock_hour(to_timestamp), \
             '%r does not match clock hour' % to_timestamp
         samples = self._hourly_accumulated(from_timestamp, to_timestamp)
-        value = sum(
-            (s.physical_quantity for s in samples),
-            PhysicalQuantity(0, self.unit))
-        return value
+        return sum_quantities(
+            (s.physical_quantity for s in samples), self.unit)
+
+
+def prefetch_hourly_accumulated(accumulations, from_timestamp, to_timestamp):
+    """
+    Prefetch hourly accumulated data for the given timespan for each of the
+    given accumulation data sequences.
+
+    Cached data for all data sources involved is read with a single query, and
+    missing cache data is computed from a single scan of raw data (see
+    :func:`gridplatform.condensing.models.get_hourly_accumulated_bulk`),
+    rather than once per data source.  Subsequent calls to
+    :meth:`.AccumulationBase._hourly_accumulated` (and thus e.g.
+    :meth:`.AccumulationBase.development_sequence`) on the given instances for
+    the exact same timespan are served from the prefetched data.
+
+    :param accumulations: A list of :class:`.AccumulationBase` instances.
+    :param from_timestamp:  The start of the given timespan.
+    :param to_timestamp:  The end of the given timespan.
+    """
+    from gridplatform.condensing.models import get_hourly_accumulated_bulk
+
+    periods = []
+    datasource_ids = set()
+    for accumulation in accumulations:
+        for period in accumulation.period_set.in_range(
+                from_timestamp, to_timestamp).order_by('from_timestamp'):
+            period = period.subclass_instance
+            period_from, period_to = period.overlapping(
+                from_timestamp, to_timestamp)
+            if isinstance(period, (NonpulseAccumulationPeriodMixin,
+                                   PulseAccumulationPeriodMixin)):
+                datasource_ids.add(period.datasource_id)
+                periods.append(
+                    (accumulation, period, period_from, period_to, True))
+            else:
+                periods.append(
+                    (accumulation, period, period_from, period_to, False))
+
+    datasources = {
+        datasource.id: datasource
+        for datasource in DataSource.objects.filter(id__in=datasource_ids)
+    }
+    # Data sources are grouped by the timespan of their periods; usually all
+    # periods involved will cover the entire given timespan.
+    timespans = {}
+    for accumulation, period, period_from, period_to, from_datasource in \
+            periods:
+        if from_datasource:
+            timespans.setdefault((period_from, period_to), set()).add(
+                period.datasource_id)
+    datasource_samples = {
+        timespan: get_hourly_accumulated_bulk(
+            [datasources[datasource_id] for datasource_id in ids],
+            timespan[0], timespan[1])
+        for timespan, ids in timespans.items()
+    }
+
+    samples = {accumulation.id: [] for accumulation in accumulations}
+    for accumulation, period, period_from, period_to, from_datasource in \
+            periods:
+        if from_datasource:
+            samples[accumulation.id].extend(
+                period._convert_datasource_samples(
+                    datasource_samples[(period_from, period_to)][
+                        period.datasource_id]))
+        else:
+            samples[accumulation.id].extend(
+                period._hourly_accumulated(period_from, period_to))
+
+    for accumulation in accumulations:
+        if not hasattr(accumulation, '_prefetched_hourly_accumulated'):
+            accumulation._prefetched_hourly_accumulated = {}
+        accumulation._prefetched_hourly_accumulated[
+            (from_timestamp, to_timestamp)] = samples[accumulation.id]
 
 
 class AccumulationPeriodManager(
@@ -161,6 +271,16 @@ class AccumulationPeriodBase(StoreSubclass, PeriodBase):
         """
         raise NotImplementedError(self.__class__)
 
+    @virtual
+    def _rolled_up_accumulated(
+            self, from_timestamp, to_timestamp, timezone, resolution):
+        """
+        Delegate of :meth:`.AccumulationBase._rolled_up_accumulated` within
+        the timespan of this period.  Unless overridden, plain hourly samples
+        are used.
+        """
+        return self._hourly_accumulated(from_timestamp, to_timestamp)
+
     @virtual
     def _get_unit(self):
         """
@@ -216,6 +336,22 @@ class NonpulseAccumulationPeriodMixin(models.Model):
         return self.datasource.five_minute_accumulated(
             from_timestamp, to_timestamp)
 
+    def _rolled_up_accumulated(
+            self, from_timestamp, to_timestamp, timezone, resolution):
+        """
+        Delegates to data source.
+        """
+        return self.datasource.rolled_up_accumulated(
+            from_timestamp, to_timestamp, timezone, resolution)
+
+    def _convert_datasource_samples(self, samples):
+        """
+        Data source samples need no conversion.
+
+        :see: :func:`.prefetch_hourly_accumulated`.
+        """
+        return samples
+
     def _get_unit(self):
         """
         Delegates to data source.
@@ -289,6 +425,26 @@ class PulseAccumulationPeriodMixin(models.Model):
             physical_quantity=self._conversion_factor *
             sample.physical_quantity)
 
+    def _rolled_up_accumulated(
+            self, from_timestamp, to_timestamp, timezone, resolution):
+        """
+        Implementation of
+        :meth:`.AccumulationPeriodBase._rolled_up_accumulated` yielding pulse
+        samples converted to output samples.
+        """
+        return itertools.imap(
+            self._convert_sample,
+            self.datasource.rolled_up_accumulated(
+                from_timestamp, to_timestamp, timezone, resolution))
+
+    def _convert_datasource_samples(self, samples):
+        """
+        Converts given pulse samples of the data source to output samples.
+
+        :see: :func:`.prefetch_hourly_accumulated`.
+        """
+        return [self._convert_sample(sample) for sample in samples]
+
     def _hourly_accumulated(self, from_timestamp, to_timestamp):
         """
         Implementation of :meth:`.AccumulationPeriodBase._hourly_accumulated`
@@ -13,9 +13,13 @@ from gridplatform.utils import condense
 from gridplatform.utils.samples import RangedSample
 from gridplatform.utils.unitconversion import PhysicalQuantity
 
+from gridplatform.utils.unitconversion import IncompatibleUnitsError
+
+from .utils import SampleArray
 from .utils import _pad_ranged_sample_sequence
 from .utils import add_ranged_sample_sequences
 from .utils import aggregate_sum_ranged_sample_sequence
+from .utils import multiply_ranged_sample_sequences
 from .utils import subtract_ranged_sample_sequences
 
 
@@ -282,3 +286,95 @@ class SubtractRangedSampleSequencesTest(TestCase):
 
         with self.assertRaises(StopIteration):
             next(sequence)
+
+
+class SampleArrayTest(SimpleTestCase):
+    def setUp(self):
+        self.timezone = pytz.timezone('Europe/Copenhagen')
+        self.start = self.timezone.localize(datetime.datetime(2014, 3, 29))
+        self.energy = self.hourly(
+            [(n, 17 + n % 5, 'milliwatt*hour') for n in range(72)
+             if n != 3])
+        self.other_energy = self.hourly(
+            [(n, 4 * n, 'kilowatt*hour') for n in range(2, 80) if n != 30])
+        self.tariff = self.hourly(
+            [(n, 1 + n % 3, 'currency_dkk*kilowatt^-1*hour^-1')
+             for n in range(72) if n != 40])
+
+    def hourly(self, values):
+        hour = datetime.timedelta(hours=1)
+        return [
+            RangedSample(
+                self.start + hour * n, self.start + hour * (n + 1),
+                PhysicalQuantity(value, unit))
+            for n, value, unit in values]
+
+    def test_round_trip(self):
+        self.assertEqual(
+            self.energy,
+            list(SampleArray.from_samples(self.energy, 'joule').to_samples(
+                self.timezone)))
+
+    def test_empty(self):
+        empty = SampleArray.from_samples([], 'joule')
+        energy = SampleArray.from_samples(self.energy, 'joule')
+        self.assertEqual([], list(empty.to_samples()))
+        self.assertIsNone(empty.sum())
+        self.assertEqual(0, len(empty * energy))
+        self.assertEqual(
+            self.energy, list((empty + energy).to_samples(self.timezone)))
+
+    def test_incompatible_units(self):
+        with self.assertRaises(IncompatibleUnitsError):
+            SampleArray.from_samples(self.tariff, 'joule')
+        with self.assertRaises(IncompatibleUnitsError):
+            SampleArray.from_samples(self.energy, 'joule') + \
+                SampleArray.from_samples(
+                    self.tariff, 'currency_dkk*joule^-1')
+
+    def test_add(self):
+        result = SampleArray.from_samples(self.energy, 'joule') + \
+            SampleArray.from_samples(self.other_energy, 'joule')
+        self.assertEqual(
+            list(add_ranged_sample_sequences(
+                [self.energy, self.other_energy], self.start,
+                self.start + datetime.timedelta(hours=80), condense.HOURS)),
+            list(result.to_samples(self.timezone)))
+
+    def test_subtract(self):
+        result = SampleArray.from_samples(self.energy, 'joule') - \
+            SampleArray.from_samples(self.other_energy, 'joule')
+        self.assertEqual(
+            list(subtract_ranged_sample_sequences(
+                self.energy, self.other_energy)),
+            list(result.to_samples(self.timezone)))
+
+    def test_multiply(self):
+        result = SampleArray.from_samples(self.energy, 'joule') * \
+            SampleArray.from_samples(self.tariff, 'currency_dkk*joule^-1')
+        expected = list(multiply_ranged_sample_sequences(
+            self.energy, self.tariff))
+        self.assertEqual(expected, list(result.to_samples(self.timezone)))
+        self.assertEqual(
+            sum((sample.physical_quantity for sample in expected),
+                PhysicalQuantity(0, 'currency_dkk')),
+            result.sum())
+
+    def test_multiply_large_values(self):
+        energy = self.hourly(
+            [(n, 10 ** 17 + n, 'joule') for n in range(24)])
+        result = SampleArray.from_samples(energy, 'joule') * \
+            SampleArray.from_samples(energy, 'joule')
+        self.assertEqual(
+            list(multiply_ranged_sample_sequences(energy, energy)),
+            list(result.to_samples(self.timezone)))
+
+    def test_aggregate(self):
+        # crosses the switch to daylight saving time
+        energy = SampleArray.from_samples(self.energy, 'joule')
+        for resolution in [condense.HOURS, condense.DAYS, condense.MONTHS]:
+            self.assertEqual(
+                list(aggregate_sum_ranged_sample_sequence(
+                    self.energy, resolution, self.timezone)),
+                list(energy.aggregate(resolution, self.timezone).to_samples(
+                    self.timezone)))
@@ -7,11 +7,19 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from fractions import Fraction
+from fractions import gcd
+import datetime
 import itertools
 import operator
 
+import numpy
+import pytz
+
 from gridplatform.utils import condense
 from gridplatform.utils.samples import RangedSample
+from gridplatform.utils.unitconversion import IncompatibleUnitsError
+from gridplatform.utils.unitconversion import PhysicalQuantity
 
 
 def _pad_ranged_sample_sequence(
@@ -281,3 +289,275 @@ def aggregate_sum_ranged_sample_sequence(data, resolution, timezone):
             reduce(
                 operator.add,
                 (s.physical_quantity for s in samples)))
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+# Intermediate results must stay below this to be computed safely in int64.
+_INT64_SAFE = 2 ** 62
+
+
+def _epoch_seconds(timestamp):
+    delta = timestamp - _EPOCH
+    return delta.days * 24 * 60 * 60 + delta.seconds
+
+
+def _magnitude(numerators):
+    if len(numerators) == 0:
+        return 0
+    return int(numpy.abs(numerators).max())
+
+
+def _scaled(numerators, factor):
+    """
+    ``numerators * factor``; as arbitrary precision integers if the result
+    might not fit in int64.
+    """
+    if factor == 1:
+        return numerators
+    if numerators.dtype != object and \
+            _magnitude(numerators) * factor >= _INT64_SAFE:
+        numerators = numerators.astype(object)
+    return numerators * factor
+
+
+class SampleArray(object):
+    """
+    A sequence of accumulating ranged samples stored as arrays, for
+    arithmetic on long sample sequences without constructing a
+    :class:`.RangedSample` and a :class:`.PhysicalQuantity` per sample, and
+    without checking units per sample.
+
+    The value of the n'th sample is ``numerators[n] * quantum``, where
+    ``quantum`` is a single :class:`.PhysicalQuantity` for the entire
+    sequence.  Values are thus exact, as with
+    :class:`.PhysicalQuantity`, and results are identical to those of
+    :func:`.add_ranged_sample_sequences`,
+    :func:`.subtract_ranged_sample_sequences`,
+    :func:`.multiply_ranged_sample_sequences` and
+    :func:`.aggregate_sum_ranged_sample_sequence`.  Numerators are int64
+    where results are known to fit, and arbitrary precision integers
+    otherwise.
+
+    :ivar from_timestamps: The starts of the samples in seconds since
+        epoch, in increasing order.
+    :ivar to_timestamps: The ends of the samples in seconds since epoch.
+    :ivar numerators: The sample values in multiples of ``quantum``.
+    :ivar quantum: A :class:`.PhysicalQuantity` with a positive value.
+    """
+
+    def __init__(self, from_timestamps, to_timestamps, numerators, quantum):
+        assert len(from_timestamps) == len(to_timestamps) == len(numerators)
+        assert quantum.value > 0
+        self.from_timestamps = from_timestamps
+        self.to_timestamps = to_timestamps
+        self.numerators = numerators
+        self.quantum = quantum
+
+    @classmethod
+    def from_samples(cls, samples, unit):
+        """
+        :param samples: A sequence of :class:`RangedSamples<.RangedSample>`,
+            ordered by time and not overlapping.
+        :param unit: A unit compatible with the units of the samples; the
+            unit of the result if ``samples`` is empty.
+
+        :raise IncompatibleUnitsError: If the unit of some sample is not
+            compatible with ``unit``.
+        """
+        unit_vector = PhysicalQuantity(1, unit).unit_vector
+        from_timestamps = []
+        to_timestamps = []
+        values = []
+        for sample in samples:
+            quantity = sample.physical_quantity
+            if quantity.unit_vector != unit_vector:
+                raise IncompatibleUnitsError(
+                    "Incompatible Dimensions '%s' and '%s'" % (
+                        quantity.units, unit))
+            from_timestamps.append(_epoch_seconds(sample.from_timestamp))
+            to_timestamps.append(_epoch_seconds(sample.to_timestamp))
+            values.append(quantity.value)
+        denominator = reduce(
+            lambda a, b: a * b // gcd(a, b),
+            set(value.denominator for value in values), 1)
+        numerators = [
+            value.numerator * (denominator // value.denominator)
+            for value in values]
+        numerator = abs(reduce(gcd, numerators, 0)) or 1
+        numerators = [n // numerator for n in numerators]
+        if max([abs(n) for n in numerators] or [0]) < _INT64_SAFE:
+            dtype = numpy.int64
+        else:
+            dtype = object
+        return cls(
+            numpy.array(from_timestamps, dtype=numpy.int64),
+            numpy.array(to_timestamps, dtype=numpy.int64),
+            numpy.array(numerators, dtype=dtype),
+            PhysicalQuantity._make(
+                (Fraction(numerator, denominator), unit_vector)))
+
+    def to_samples(self, timezone=pytz.utc):
+        """
+        :return: The samples of this sequence as
+            :class:`RangedSamples<.RangedSample>`, with timestamps in the
+            given timezone.
+        """
+        for from_timestamp, to_timestamp, numerator in itertools.izip(
+                self.from_timestamps.tolist(), self.to_timestamps.tolist(),
+                self.numerators.tolist()):
+            yield RangedSample(
+                timezone.normalize(
+                    _EPOCH + datetime.timedelta(seconds=from_timestamp)),
+                timezone.normalize(
+                    _EPOCH + datetime.timedelta(seconds=to_timestamp)),
+                self.quantum._replace(value=self.quantum.value * numerator))
+
+    def __len__(self):
+        return len(self.numerators)
+
+    def sum(self):
+        """
+        :return: The sum of the sample values, or ``None`` if there are no
+            samples.
+        """
+        if len(self) == 0:
+            return None
+        numerators = self.numerators
+        if numerators.dtype != object and \
+                _magnitude(numerators) * len(numerators) >= _INT64_SAFE:
+            numerators = numerators.astype(object)
+        return self.quantum._replace(
+            value=self.quantum.value * int(numerators.sum()))
+
+    def _common_quantum(self, other):
+        """
+        :return: The numerators of ``self`` and ``other`` in multiples of a
+            common quantum, and that quantum.
+        """
+        if self.quantum.unit_vector != other.quantum.unit_vector:
+            raise IncompatibleUnitsError(
+                "Incompatible Dimensions '%s' and '%s'" % (
+                    self.quantum.units, other.quantum.units))
+        a = self.quantum.value
+        b = other.quantum.value
+        value = Fraction(
+            gcd(a.numerator, b.numerator),
+            a.denominator * b.denominator //
+            gcd(a.denominator, b.denominator))
+        numerators_a = _scaled(self.numerators, int(a / value))
+        numerators_b = _scaled(other.numerators, int(b / value))
+        if numerators_a.dtype != object and numerators_b.dtype != object and \
+                _magnitude(numerators_a) + _magnitude(numerators_b) >= \
+                _INT64_SAFE:
+            numerators_a = numerators_a.astype(object)
+        return (
+            numerators_a, numerators_b, self.quantum._replace(value=value))
+
+    def _combine(self, other, sign):
+        """
+        Union of the samples of ``self`` and ``other`` by start; the values
+        of samples present in both are added (``sign=1``) or subtracted
+        (``sign=-1``).
+        """
+        numerators_a, numerators_b, quantum = self._common_quantum(other)
+        from_timestamps = numpy.union1d(
+            self.from_timestamps, other.from_timestamps)
+        positions_a = numpy.searchsorted(
+            from_timestamps, self.from_timestamps)
+        positions_b = numpy.searchsorted(
+            from_timestamps, other.from_timestamps)
+        to_timestamps = numpy.zeros(len(from_timestamps), dtype=numpy.int64)
+        to_timestamps[positions_a] = self.to_timestamps
+        to_timestamps[positions_b] = other.to_timestamps
+        if object in (numerators_a.dtype, numerators_b.dtype):
+            dtype = object
+        else:
+            dtype = numpy.int64
+        numerators = numpy.zeros(len(from_timestamps), dtype=dtype)
+        numerators[positions_a] = numerators_a
+        numerators[positions_b] += sign * numerators_b
+        return SampleArray(
+            from_timestamps, to_timestamps, numerators, quantum)
+
+    def __add__(self, other):
+        """
+        :see: :func:`.add_ranged_sample_sequences`.
+        """
+        return self._combine(other, 1)
+
+    def __sub__(self, other):
+        """
+        :see: :func:`.subtract_ranged_sample_sequences`.
+        """
+        return self._combine(other, -1)
+
+    def __neg__(self):
+        return SampleArray(
+            self.from_timestamps, self.to_timestamps, -self.numerators,
+            self.quantum)
+
+    def __mul__(self, other):
+        """
+        Multiply the samples of ``self`` and ``other`` with the same start;
+        samples present in only one of them are skipped.
+
+        :see: :func:`.multiply_ranged_sample_sequences`.
+        """
+        positions = numpy.searchsorted(
+            other.from_timestamps, self.from_timestamps)
+        positions = numpy.minimum(positions, len(other) - 1)
+        if len(other):
+            matched = \
+                other.from_timestamps[positions] == self.from_timestamps
+        else:
+            matched = numpy.zeros(len(self), dtype=bool)
+        positions = positions[matched]
+        to_timestamps = self.to_timestamps[matched]
+        assert numpy.array_equal(
+            to_timestamps, other.to_timestamps[positions])
+        numerators_a = self.numerators[matched]
+        numerators_b = other.numerators[positions]
+        if numerators_a.dtype != object and numerators_b.dtype != object and \
+                _magnitude(numerators_a) * _magnitude(numerators_b) >= \
+                _INT64_SAFE:
+            numerators_a = numerators_a.astype(object)
+        return SampleArray(
+            self.from_timestamps[matched], to_timestamps,
+            numerators_a * numerators_b, self.quantum * other.quantum)
+
+    def aggregate(self, resolution, timezone):
+        """
+        :see: :func:`.aggregate_sum_ranged_sample_sequence`.
+        """
+        assert resolution in _PERIOD_KEYS
+        assert hasattr(timezone, 'localize')
+        if len(self) == 0:
+            return self
+        # Period boundaries in the given timezone from the start of the first
+        # sample to past the end of the last; one datetime per period rather
+        # than per sample.
+        boundary = condense.floor(
+            timezone.normalize(
+                _EPOCH + datetime.timedelta(
+                    seconds=int(self.from_timestamps[0]))),
+            resolution, timezone)
+        last = int(self.from_timestamps[-1])
+        boundaries = [_epoch_seconds(boundary)]
+        while boundaries[-1] <= last:
+            boundary = boundary + resolution
+            boundaries.append(_epoch_seconds(boundary))
+        boundaries = numpy.array(boundaries, dtype=numpy.int64)
+
+        periods = numpy.searchsorted(
+            boundaries, self.from_timestamps, side='right') - 1
+        starts = numpy.flatnonzero(
+            numpy.concatenate(([True], periods[1:] != periods[:-1])))
+        periods = periods[starts]
+        numerators = self.numerators
+        if numerators.dtype != object and \
+                _magnitude(numerators) * len(numerators) >= _INT64_SAFE:
+            numerators = numerators.astype(object)
+        return SampleArray(
+            boundaries[periods], boundaries[periods + 1],
+            numpy.add.reduceat(numerators, starts), self.quantum)
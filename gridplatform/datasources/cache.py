@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+In-process caches of data source metadata, for the ingest paths that resolve
+the same data sources over and over; the agent server and the REST raw data
+endpoints.
+
+Entries expire after a time to live, as the caches are not invalidated by
+changes made in other processes, and the least recently used entries are
+evicted when a cache is full.  Changes made in this process invalidate the
+relevant entries through model signals.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from gridplatform.trackuser import get_customer
+from gridplatform.trackuser import get_provider_id
+from gridplatform.trackuser import get_user
+
+from .models import DataSource
+
+
+class MetadataCache(object):
+    """
+    Thread-safe mapping with a time to live and a least recently used bound
+    on its entries.
+
+    :ivar hits: Number of keys looked up and found.
+    :ivar misses: Number of keys looked up and not found; including expired
+        entries.
+    :ivar evictions: Number of entries evicted to stay within ``maxsize``.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, clock=time.time):
+        """
+        :param maxsize: The maximal number of entries.
+        :param ttl: Seconds an entry is valid after being set.
+        :param clock: Function returning the current time in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # {key: (expires, value)}, least recently used first
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys):
+        """
+        :return: A dictionary of the valid entries for the given keys.
+        """
+        now = self._clock()
+        result = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None and entry[0] > now:
+                    # reinserted as most recently used
+                    self._entries[key] = entry
+                    result[key] = entry[1]
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return result
+
+    def set_many(self, mapping):
+        expires = self._clock() + self.ttl
+        with self._lock:
+            for key, value in mapping.items():
+                self._entries.pop(key, None)
+                self._entries[key] = (expires, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, load):
+        """
+        The value for ``key``; from the cache if present, otherwise loaded
+        with ``load(key)`` and cached.  Exceptions from ``load`` are
+        propagated, and nothing is cached.
+        """
+        found = self.get_many([key])
+        if key in found:
+            return found[key]
+        value = load(key)
+        self.set_many({key: value})
+        return value
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_if(self, predicate):
+        """
+        Invalidate the entries for which ``predicate(key, value)`` holds.
+        """
+        with self._lock:
+            for key, (expires, value) in self._entries.items():
+                if predicate(key, value):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        :return: A dictionary of the number of ``entries``, ``hits``,
+            ``misses`` and ``evictions``.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+#: Data sources by data source model, id and visibility scope.
+datasource_cache = MetadataCache()
+
+
+def _visibility_scope():
+    """
+    The data sources visible through the managers of data source models
+    depend on the current user, customer and provider; see
+    :class:`gridplatform.datasources.managers.DataSourceQuerySetMixinBase`.
+    Lookups are cached per visibility scope.
+    """
+    user = get_user()
+    if user is None:
+        return None
+    if not user.is_authenticated():
+        return False
+    customer = get_customer()
+    if customer is not None:
+        return ('customer', user.id, customer.id, customer.is_active)
+    return ('provider', user.id, get_provider_id())
+
+
+def get_datasource(datasource_model, datasource_id):
+    """
+    The data source with the given id, as visible through
+    ``datasource_model.objects`` to the current user.
+
+    The instance returned is shared between threads and requests, and must
+    not be modified.
+
+    :raise datasource_model.DoesNotExist: If no such data source is visible.
+    """
+    def load(key):
+        return datasource_model.objects.get(id=datasource_id)
+
+    return datasource_cache.get(
+        (datasource_model, int(datasource_id), _visibility_scope()), load)
+
+
+@receiver(post_save, dispatch_uid='datasources_cache_invalidate_save')
+@receiver(post_delete, dispatch_uid='datasources_cache_invalidate_delete')
+def _invalidate_datasource(sender, instance, **kwargs):
+    if isinstance(instance, DataSource):
+        datasource_cache.invalidate_if(
+            lambda key, value: value.id == instance.id)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Parsing of compact formats for bulk ingest of raw data; see
+:class:`gridplatform.datasources.viewsets.RawDataBulkViewSet`.
+
+Each format is parsed from a stream, row by row, by a function returning
+the unit given in the data, if any, and an iterable of ``(position,
+timestamp, value)`` tuples, where ``position`` identifies the row in error
+messages.  Timestamps are ISO 8601 strings; naive timestamps are taken to
+be UTC.  Values are integers.
+
+CSV and newline delimited JSON are read line by line, so memory use does not
+grow with the size of the request.  Columnar JSON is decoded as a whole
+before any row is converted; clients sending large amounts of data should
+prefer one of the line based formats.
+
+Columnar JSON (``application/json``)::
+
+    {"unit": "watt*hour",
+     "timestamps": ["2014-01-01T00:00:00Z", "2014-01-01T00:05:00Z"],
+     "values": [1200, 1260]}
+
+CSV (``text/csv``), with an optional ``timestamp,value`` header::
+
+    2014-01-01T00:00:00Z,1200
+    2014-01-01T00:05:00Z,1260
+
+Newline delimited JSON (``application/x-ndjson``)::
+
+    {"timestamp": "2014-01-01T00:00:00Z", "value": 1200}
+    {"timestamp": "2014-01-01T00:05:00Z", "value": 1260}
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import csv
+import json
+
+from django.utils.dateparse import parse_datetime
+import pytz
+
+from gridplatform.utils import units
+from gridplatform.utils.unitconversion import PhysicalQuantity
+from gridplatform.utils.units import unit_conversion_map
+
+from .models import is_clock_hour
+from .models import is_five_minute_multiplum
+from .models import insert_raw_data
+
+
+class IngestError(Exception):
+    """
+    Raised for data that cannot be ingested; the message is meant for the
+    client.
+    """
+    pass
+
+
+def _lines(stream):
+    if stream is None:
+        return iter([])
+    return iter(stream.readline, b'')
+
+
+def parse_columnar_json(stream):
+    """
+    Parse columnar JSON; the ``timestamps`` and ``values`` lists must be of
+    equal length.  Unlike the other formats, the entire document is read
+    and decoded at once.
+    """
+    try:
+        data = json.load(stream) if stream is not None else {}
+    except ValueError as e:
+        raise IngestError('invalid JSON: %s' % e)
+    if not isinstance(data, dict):
+        raise IngestError('expected a JSON object')
+    timestamps = data.get('timestamps', [])
+    values = data.get('values', [])
+    if not isinstance(timestamps, list) or not isinstance(values, list):
+        raise IngestError('timestamps and values must be lists')
+    if len(timestamps) != len(values):
+        raise IngestError(
+            '%d timestamps but %d values' % (len(timestamps), len(values)))
+    return data.get('unit'), (
+        ('index %d' % n, timestamp, value)
+        for n, (timestamp, value) in enumerate(zip(timestamps, values)))
+
+
+def parse_csv(stream):
+    """
+    Parse CSV rows of timestamp and value.
+    """
+    def rows():
+        for n, row in enumerate(csv.reader(_lines(stream)), 1):
+            if not row:
+                continue
+            if n == 1 and row[0].strip() == 'timestamp':
+                continue
+            if len(row) != 2:
+                raise IngestError('line %d: expected 2 fields' % n)
+            yield 'line %d' % n, row[0].strip(), row[1].strip()
+    return None, rows()
+
+
+def parse_ndjson(stream):
+    """
+    Parse a JSON object with ``timestamp`` and ``value`` per line.
+    """
+    def rows():
+        for n, line in enumerate(_lines(stream), 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                timestamp = data['timestamp']
+                value = data['value']
+            except (ValueError, KeyError, TypeError):
+                raise IngestError(
+                    'line %d: expected object with timestamp and value' % n)
+            yield 'line %d' % n, timestamp, value
+    return None, rows()
+
+
+#: Parse functions by content type.
+FORMATS = {
+    'application/json': parse_columnar_json,
+    'text/csv': parse_csv,
+    'application/x-ndjson': parse_ndjson,
+}
+
+
+class RawDataConverter(object):
+    """
+    Converts parsed rows to ``(datasource_id, timestamp, value)`` rows for
+    :func:`gridplatform.datasources.models.insert_raw_data`, validating and
+    converting values to the unit of the data source.
+
+    The unit is validated, and the conversion factor found, once; rather
+    than constructing a
+    :class:`~gridplatform.utils.unitconversion.PhysicalQuantity` per row.
+    """
+
+    def __init__(self, datasource, unit):
+        if unit is None:
+            raise IngestError('unit not given')
+        if unit not in unit_conversion_map or \
+                not PhysicalQuantity.compatible_units(unit, datasource.unit):
+            raise IngestError(
+                'unit %s is not compatible with data source unit %s' % (
+                    unit, datasource.unit))
+        self.datasource_id = datasource.id
+        self.factor = PhysicalQuantity(1, unit).convert(datasource.unit)
+        # same constraints as RawData.clean()
+        if any(PhysicalQuantity.compatible_units(datasource.unit, tariff_unit)
+               for tariff_unit in units.TARIFF_BASE_UNITS):
+            self.timestamp_check = (is_clock_hour, 'must be clock hour')
+        elif any(PhysicalQuantity.compatible_units(datasource.unit, co2_unit)
+                 for co2_unit in units.CO2_CONVERSION_BASE_UNITS):
+            self.timestamp_check = (
+                is_five_minute_multiplum, 'must be five-minute multiplum')
+        else:
+            self.timestamp_check = None
+
+    def __call__(self, position, timestamp, value):
+        parsed = parse_datetime(timestamp) \
+            if isinstance(timestamp, basestring) else None
+        if parsed is None:
+            raise IngestError('%s: invalid timestamp %r' % (
+                position, timestamp))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=pytz.utc)
+        else:
+            parsed = parsed.astimezone(pytz.utc)
+        if self.timestamp_check is not None:
+            check, message = self.timestamp_check
+            if not check(parsed):
+                raise IngestError('%s: %s' % (position, message))
+
+        if isinstance(value, basestring):
+            try:
+                value = int(value)
+            except ValueError:
+                pass
+        if isinstance(value, bool) or not isinstance(value, (int, long)):
+            raise IngestError('%s: invalid value %r' % (position, value))
+
+        return self.datasource_id, parsed, int(value * self.factor)
+
+
+def ingest(datasource, parse, stream, unit=None):
+    """
+    Parse rows from ``stream`` with the given parse function (see
+    :data:`.FORMATS`), and store them as raw data for ``datasource``; rows
+    already stored for the same timestamps are skipped.
+
+    Must be called inside a transaction to be rolled back on
+    :class:`.IngestError`, as rows are stored while parsing.
+
+    :param unit: The unit of the values, unless given in the data.
+
+    :return: The number of rows received and the number of rows inserted.
+    """
+    data_unit, rows = parse(stream)
+    convert = RawDataConverter(datasource, data_unit or unit)
+    received = [0]
+
+    def converted():
+        for row in rows:
+            received[0] += 1
+            yield convert(*row)
+
+    inserted = insert_raw_data(converted())
+    return received[0], inserted
@@ -3,7 +3,9 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 from django.db.models.query import QuerySet
+from django.db import connection
 from django.db import models
+from django.db import transaction
 from django.db.models.query import DateQuerySet
 from django.db.models.query import DateTimeQuerySet
 from django.db.models.query import ValuesListQuerySet
@@ -157,5 +159,141 @@ class DataSourceManager(
     """
     A manager that is both a :class:`.StoredSubclassManager` and a
     :class:`DataSourceManagerBase`.
+
+    Also provides bulk operations on :class:`.RawData` that invalidate
+    condensed cache data once per data source rather than once per
+    :class:`.RawData` row.
+
+    :cvar RECOMPUTE_NOW: Value for the ``recompute`` argument of bulk raw
+        data operations; regenerate invalidated cache data before returning.
+    :cvar RECOMPUTE_QUEUE: Value for the ``recompute`` argument of bulk raw
+        data operations; queue a Celery task for regenerating invalidated
+        cache data.
     """
     use_for_related_fields = False
+
+    RECOMPUTE_NOW = 'now'
+    RECOMPUTE_QUEUE = 'queue'
+
+    def delete_raw_data(
+            self, datasources, from_timestamp, to_timestamp, recompute=None):
+        """
+        Delete all :class:`.RawData` of the given data sources within the
+        half-open timespan [``from_timestamp``; ``to_timestamp``).
+
+        Unlike deleting :class:`.RawData` through a queryset, the
+        ``post_delete`` signal is not sent for each row.  Instead, affected
+        cache data is invalidated with a single ranged delete per cache table
+        for each data source.
+
+        :param datasources: An iterable of :class:`.DataSource`.
+        :param recompute: ``None`` to leave invalidated cache data for lazy
+            regeneration, or one of :attr:`.RECOMPUTE_NOW` or
+            :attr:`.RECOMPUTE_QUEUE`.  Tasks are queued when the changes have
+            been committed, so this should not be used inside an outer
+            transaction.
+
+        :return: The number of :class:`.RawData` deleted.
+        """
+        deleted = 0
+        tainted = []
+        with transaction.atomic():
+            for datasource in datasources:
+                count, tainted_range = self._replace_raw_data(
+                    datasource, from_timestamp, to_timestamp, [], recompute)
+                deleted += count
+                if tainted_range is not None:
+                    tainted.append((datasource, tainted_range))
+        if recompute == self.RECOMPUTE_QUEUE:
+            self._queue_recompute(tainted)
+        return deleted
+
+    def replace_raw_data(
+            self, datasource, from_timestamp, to_timestamp, raw_data,
+            recompute=None):
+        """
+        Replace all :class:`.RawData` of the given data source within the
+        half-open timespan [``from_timestamp``; ``to_timestamp``) with
+        ``raw_data``, invalidating affected cache data as
+        :meth:`.delete_raw_data` does.
+
+        :param raw_data: An iterable of unsaved :class:`.RawData` for
+            ``datasource`` inside the given timespan.
+        :param recompute: See :meth:`.delete_raw_data`.
+
+        :return: The number of :class:`.RawData` deleted.
+        """
+        with transaction.atomic():
+            deleted, tainted_range = self._replace_raw_data(
+                datasource, from_timestamp, to_timestamp, list(raw_data),
+                recompute)
+        if recompute == self.RECOMPUTE_QUEUE and tainted_range is not None:
+            self._queue_recompute([(datasource, tainted_range)])
+        return deleted
+
+    def _replace_raw_data(
+            self, datasource, from_timestamp, to_timestamp, raw_data,
+            recompute):
+        """
+        Shared implementation of :meth:`.delete_raw_data` and
+        :meth:`.replace_raw_data` for a single data source.
+
+        :return: A tuple of the number of :class:`.RawData` deleted and the
+            tainted ``(range_start, range_end, timezones)``, the latter being
+            ``None`` if nothing changed; ``timezones`` are the names of the
+            timezones of invalidated daily and monthly cache data.
+        """
+        from gridplatform.condensing.models import CACHABLE_UNITS
+        from gridplatform.condensing.models import invalidate_cache_range
+        from gridplatform.condensing.models import recompute_cache_range
+        from .models import RawData
+        assert from_timestamp < to_timestamp
+        assert recompute in (None, self.RECOMPUTE_NOW, self.RECOMPUTE_QUEUE)
+        assert all(
+            from_timestamp <= obj.timestamp < to_timestamp and
+            obj.datasource_id == datasource.id
+            for obj in raw_data)
+
+        cursor = connection.cursor()
+        cursor.execute(
+            'DELETE FROM {table} '
+            'WHERE datasource_id = %s '
+            'AND timestamp >= %s AND timestamp < %s'.format(
+                table=RawData._meta.db_table),
+            [datasource.id, from_timestamp, to_timestamp])
+        deleted = cursor.rowcount
+        RawData.objects.bulk_create(raw_data)
+        if not deleted and not raw_data:
+            return (0, None)
+
+        # The tainted period extends to the nearest remaining RawData on
+        # either side of the given timespan; cf.
+        # gridplatform.condensing.models.cleanup_cache_for_rawdata_delete().
+        previous_timestamp = RawData.objects.filter(
+            datasource_id=datasource.id,
+            timestamp__lt=from_timestamp,
+        ).order_by('timestamp').values_list('timestamp', flat=True).last()
+        range_start = previous_timestamp or from_timestamp
+        next_timestamp = RawData.objects.filter(
+            datasource_id=datasource.id,
+            timestamp__gte=to_timestamp,
+        ).order_by('timestamp').values_list('timestamp', flat=True).first()
+        range_end = next_timestamp or to_timestamp
+        timezones = invalidate_cache_range(
+            datasource.id, range_start, range_end)
+
+        if recompute == self.RECOMPUTE_NOW and \
+                datasource.unit in CACHABLE_UNITS:
+            recompute_cache_range(
+                datasource, range_start, range_end, timezones)
+        return (deleted, (range_start, range_end, timezones))
+
+    def _queue_recompute(self, tainted):
+        """
+        Queue regeneration of cache data for each ``(datasource, (range_start,
+        range_end, timezones))`` in ``tainted``.
+        """
+        from gridplatform.condensing.tasks import recompute_cache_range_task
+        for datasource, (range_start, range_end, timezones) in tainted:
+            recompute_cache_range_task.delay(
+                datasource.id, range_start, range_end, sorted(timezones))
@@ -4,7 +4,9 @@ from __future__ import unicode_literals
 
 import datetime
 from fractions import Fraction
+import itertools
 
+from django.db import connection
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
@@ -76,6 +78,23 @@ class DataSourceBase(models.Model):
         from gridplatform.condensing.models import get_five_minute_accumulated
         return get_five_minute_accumulated(self, from_timestamp, to_timestamp)
 
+    def rolled_up_accumulated(
+            self, from_timestamp, to_timestamp, timezone, resolution):
+        """
+        Accumulated data for the given timespan, suitable for aggregating to
+        the given resolution in the given timezone.  Whole days and months
+        are each represented by a single sample, read from the daily and
+        monthly cache when possible.
+
+        :return: A list of ranged
+            :class:`gridplatform.utils.samples.Sample` instances.
+
+        :see: :func:`gridplatform.condensing.models.get_rolled_up_accumulated`
+        """
+        from gridplatform.condensing.models import get_rolled_up_accumulated
+        return get_rolled_up_accumulated(
+            self, timezone, from_timestamp, to_timestamp, resolution)
+
     def _get_interpolate_fn(self):
         """
         :return: :func:`.impulse_interpolate` if ``self.unit`` is 'impulse' and
@@ -274,3 +293,140 @@ class RawData(RawDataBase):
                     raise ValidationError(
                         {'timestamp': [
                             ugettext('Must be five-minute multiplum.')]})
+
+
+#: PostgreSQL NOTIFY channel on which the ids of data sources with new raw data
+#: are announced; see :func:`.notify_raw_data`.
+RAW_DATA_CHANNEL = 'datasources_rawdata'
+
+
+def notify_raw_data(datasource_ids):
+    """
+    Announce new raw data for the given data sources on
+    :data:`.RAW_DATA_CHANNEL`; one notification per data source, with its id
+    as payload.
+
+    Notifications are delivered to listeners when the current transaction
+    commits, and duplicates within a transaction are delivered only once.
+    """
+    datasource_ids = list(datasource_ids)
+    if not datasource_ids:
+        return
+    cursor = connection.cursor()
+    cursor.execute(
+        'SELECT pg_notify(%s, datasource_id::text) '
+        'FROM unnest(%s) AS datasource_id',
+        [RAW_DATA_CHANNEL, datasource_ids])
+
+
+#: Number of rows per multi-row INSERT in :func:`.insert_raw_data`.
+RAW_DATA_INSERT_CHUNK_SIZE = 1000
+
+
+def insert_raw_data(rows):
+    """
+    Store ``(datasource_id, timestamp, value)`` rows as :class:`.RawData`,
+    using multi-row INSERT statements of at most
+    :data:`.RAW_DATA_INSERT_CHUNK_SIZE` rows.  ``rows`` may be any iterable;
+    it is consumed one chunk at a time.
+
+    Rows for which :class:`.RawData` already exists for the same data source
+    and timestamp are skipped rather than failing the transaction, so that
+    data sent again is stored only once; of rows given more than once for
+    the same data source and timestamp, the first is stored.
+
+    :note: Existing rows are skipped with ``WHERE NOT EXISTS`` rather than
+        ``ON CONFLICT``, which requires PostgreSQL 9.5.  Rows inserted
+        concurrently by another transaction are therefore not skipped, but
+        fail with an :class:`~django.db.IntegrityError`.
+
+    The data sources are announced with :func:`.notify_raw_data`.
+
+    :return: The number of rows actually inserted.
+    """
+    rows = iter(rows)
+    cursor = connection.cursor()
+    inserted = 0
+    datasource_ids = set()
+    while True:
+        chunk = list(itertools.islice(rows, RAW_DATA_INSERT_CHUNK_SIZE))
+        if not chunk:
+            break
+        unique_chunk = []
+        keys = set()
+        for datasource_id, timestamp, value in chunk:
+            if (datasource_id, timestamp) not in keys:
+                keys.add((datasource_id, timestamp))
+                unique_chunk.append((datasource_id, timestamp, value))
+        cursor.execute(
+            'INSERT INTO {table} (datasource_id, timestamp, value) '
+            'SELECT v.datasource_id, v.timestamp, v.value '
+            'FROM (VALUES {values}) AS v (datasource_id, timestamp, value) '
+            'WHERE NOT EXISTS ('
+            'SELECT 1 FROM {table} AS r '
+            'WHERE r.datasource_id = v.datasource_id '
+            'AND r.timestamp = v.timestamp)'.format(
+                table=RawData._meta.db_table,
+                values=', '.join(
+                    ['(%s::integer, %s::timestamp with time zone, '
+                     '%s::bigint)'] * len(unique_chunk))),
+            [param for row in unique_chunk for param in row])
+        inserted += cursor.rowcount
+        datasource_ids.update(row[0] for row in unique_chunk)
+    notify_raw_data(datasource_ids)
+    return inserted
+
+
+def upsert_raw_data(datasource_id, rows):
+    """
+    Store ``(timestamp, value)`` rows as :class:`.RawData` of the given data
+    source, replacing the values already stored for the same timestamps; for
+    importers of data that may be published again with corrected values.
+
+    Existing raw data is read with a single ranged query, new rows are
+    inserted with :func:`.insert_raw_data`, and only values that changed are
+    updated, with UPDATE statements of at most
+    :data:`.RAW_DATA_INSERT_CHUNK_SIZE` rows.  Of rows given more than once
+    for the same timestamp, the last is stored.
+
+    Model signals are not sent for the rows stored.  The data source is
+    announced with :func:`.notify_raw_data` if anything was stored.
+
+    :return: The number of rows inserted and the number of rows updated.
+    """
+    values = {}
+    for timestamp, value in rows:
+        values[timestamp] = value
+    if not values:
+        return 0, 0
+
+    existing = dict(
+        (timestamp, (id, value)) for id, timestamp, value in
+        RawData.objects.filter(
+            datasource_id=datasource_id,
+            timestamp__gte=min(values),
+            timestamp__lte=max(values),
+        ).values_list('id', 'timestamp', 'value'))
+
+    inserted = insert_raw_data(
+        (datasource_id, timestamp, value)
+        for timestamp, value in sorted(values.items())
+        if timestamp not in existing)
+
+    changed = [
+        (existing[timestamp][0], value)
+        for timestamp, value in sorted(values.items())
+        if timestamp in existing and existing[timestamp][1] != value]
+    cursor = connection.cursor()
+    for start in range(0, len(changed), RAW_DATA_INSERT_CHUNK_SIZE):
+        chunk = changed[start:start + RAW_DATA_INSERT_CHUNK_SIZE]
+        cursor.execute(
+            'UPDATE {table} SET value = v.value '
+            'FROM (VALUES {values}) AS v (id, value) '
+            'WHERE {table}.id = v.id'.format(
+                table=RawData._meta.db_table,
+                values=', '.join(['(%s::bigint, %s::bigint)'] * len(chunk))),
+            [param for row in chunk for param in row])
+    if changed:
+        notify_raw_data([datasource_id])
+    return inserted, len(changed)
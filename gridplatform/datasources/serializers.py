@@ -14,6 +14,7 @@ from gridplatform.utils import units
 
 from .models import RawData
 from .models import DataSource
+from .cache import get_datasource
 
 
 class DataSourceSerializerBase(serializers.DefaultSerializer):
@@ -51,7 +52,7 @@ class RawDataWithUnitSerializer(serializers.ModelSerializer):
         parser_context = self.context['request'].parser_context
         datasource_id = parser_context['kwargs'].get('datasource_id')
         datasource_model = self.opts.model.datasource.field.rel.to
-        self.datasource = datasource_model.objects.get(id=datasource_id)
+        self.datasource = get_datasource(datasource_model, datasource_id)
         unit_choices = (
             (unit, display_name) for unit, display_name in
             units.UNIT_DISPLAY_NAMES.items()
@@ -2,14 +2,26 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import StringIO
 import datetime
 
+from django.test import RequestFactory
+from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.core.exceptions import ValidationError
+from mock import patch
 import pytz
 
+from gridplatform.users.models import User
+
 from .models import RawData
 from .models import DataSource
+from .models import insert_raw_data
+from .models import upsert_raw_data
+from .cache import MetadataCache
+from . import ingest
+from . import viewsets
 
 
 class TariffRawDataTest(TestCase):
@@ -58,3 +70,265 @@ class Co2ConversionRawDataTest(TestCase):
 
         with self.assertRaises(ValidationError):
             rawdata.clean()
+
+
+class InsertRawDataTest(TestCase):
+    def setUp(self):
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+        self.timestamp = datetime.datetime(2014, 1, 1, tzinfo=pytz.utc)
+        RawData.objects.create(
+            datasource=self.datasource, timestamp=self.timestamp, value=1)
+
+    def test_skips_existing_and_duplicate_rows(self):
+        hour = datetime.timedelta(hours=1)
+        self.assertEqual(
+            1,
+            insert_raw_data([
+                (self.datasource.id, self.timestamp, 10),
+                (self.datasource.id, self.timestamp + hour, 2),
+                (self.datasource.id, self.timestamp + hour, 20),
+            ]))
+        self.assertEqual(
+            [1, 2],
+            list(RawData.objects.filter(
+                datasource=self.datasource,
+            ).order_by('timestamp').values_list('value', flat=True)))
+
+    def test_chunks(self):
+        hour = datetime.timedelta(hours=1)
+        with patch(
+                'gridplatform.datasources.models.RAW_DATA_INSERT_CHUNK_SIZE',
+                2):
+            inserted = insert_raw_data(
+                (self.datasource.id, self.timestamp + n * hour, n)
+                for n in range(5))
+        self.assertEqual(4, inserted)
+        self.assertEqual(
+            5, RawData.objects.filter(datasource=self.datasource).count())
+
+
+class UpsertRawDataTest(TestCase):
+    def setUp(self):
+        self.datasource = DataSource.objects.create(
+            unit='currency_dkk*gigawatt^-1*hour^-1')
+        self.timestamp = datetime.datetime(2014, 1, 1, tzinfo=pytz.utc)
+        RawData.objects.create(
+            datasource=self.datasource, timestamp=self.timestamp, value=1)
+        RawData.objects.create(
+            datasource=self.datasource,
+            timestamp=self.timestamp + datetime.timedelta(hours=1),
+            value=2)
+
+    def test_upsert(self):
+        hour = datetime.timedelta(hours=1)
+        self.assertEqual(
+            (1, 1),
+            upsert_raw_data(self.datasource.id, [
+                (self.timestamp, 1),
+                (self.timestamp + hour, 20),
+                (self.timestamp + 2 * hour, 30),
+            ]))
+        self.assertEqual(
+            [1, 20, 30],
+            list(RawData.objects.filter(
+                datasource=self.datasource,
+            ).order_by('timestamp').values_list('value', flat=True)))
+
+    def test_upsert_nothing(self):
+        self.assertEqual((0, 0), upsert_raw_data(self.datasource.id, []))
+
+
+class MetadataCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = MetadataCache(maxsize=3, ttl=10, clock=lambda: self.now)
+
+    def test_get_loads_once(self):
+        loaded = []
+
+        def load(key):
+            loaded.append(key)
+            return key * 2
+
+        self.assertEqual(self.cache.get(1, load), 2)
+        self.assertEqual(self.cache.get(1, load), 2)
+        self.assertEqual(loaded, [1])
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_expires(self):
+        self.cache.set_many({1: 'a'})
+        self.now = 9
+        self.assertEqual(self.cache.get_many([1]), {1: 'a'})
+        self.now = 10
+        self.assertEqual(self.cache.get_many([1]), {})
+
+    def test_least_recently_used_evicted(self):
+        self.cache.set_many({1: 'a', 2: 'b', 3: 'c'})
+        self.cache.get_many([1])
+        self.cache.set_many({4: 'd'})
+        self.assertEqual(
+            self.cache.get_many([1, 2, 3, 4]), {1: 'a', 3: 'c', 4: 'd'})
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_none_cached(self):
+        self.cache.set_many({1: None})
+        self.assertEqual(self.cache.get_many([1]), {1: None})
+
+    def test_invalidate_if(self):
+        self.cache.set_many({1: 'a', 2: 'b'})
+        self.cache.invalidate_if(lambda key, value: value == 'a')
+        self.assertEqual(self.cache.get_many([1, 2]), {2: 'b'})
+
+
+class IngestParseTest(SimpleTestCase):
+    def test_columnar_json(self):
+        unit, rows = ingest.parse_columnar_json(StringIO.StringIO(
+            '{"unit": "watt*hour", "timestamps": ["2014-01-01T00:00:00Z", '
+            '"2014-01-01T00:05:00Z"], "values": [1, 2]}'))
+        self.assertEqual(unit, 'watt*hour')
+        self.assertEqual(list(rows), [
+            ('index 0', '2014-01-01T00:00:00Z', 1),
+            ('index 1', '2014-01-01T00:05:00Z', 2),
+        ])
+
+    def test_columnar_json_lengths_differ(self):
+        with self.assertRaises(ingest.IngestError):
+            ingest.parse_columnar_json(StringIO.StringIO(
+                '{"timestamps": ["2014-01-01T00:00:00Z"], "values": []}'))
+
+    def test_csv(self):
+        unit, rows = ingest.parse_csv(StringIO.StringIO(
+            'timestamp,value\n'
+            '2014-01-01T00:00:00Z,1\n'
+            '\n'
+            '2014-01-01T00:05:00Z, 2\n'))
+        self.assertIsNone(unit)
+        self.assertEqual(list(rows), [
+            ('line 2', '2014-01-01T00:00:00Z', '1'),
+            ('line 4', '2014-01-01T00:05:00Z', '2'),
+        ])
+
+    def test_ndjson(self):
+        unit, rows = ingest.parse_ndjson(StringIO.StringIO(
+            '{"timestamp": "2014-01-01T00:00:00Z", "value": 1}\n'
+            '{"value": 2}\n'))
+        rows = iter(rows)
+        self.assertEqual(next(rows), ('line 1', '2014-01-01T00:00:00Z', 1))
+        with self.assertRaises(ingest.IngestError):
+            next(rows)
+
+
+class RawDataConverterTest(SimpleTestCase):
+    def test_converts_to_datasource_unit(self):
+        convert = ingest.RawDataConverter(
+            DataSource(id=7, unit='milliwatt*hour'), 'kilowatt*hour')
+        self.assertEqual(
+            convert('line 1', '2014-01-01T01:00:00+01:00', '2'),
+            (7, datetime.datetime(2014, 1, 1, tzinfo=pytz.utc), 2000000))
+
+    def test_incompatible_unit(self):
+        with self.assertRaises(ingest.IngestError):
+            ingest.RawDataConverter(
+                DataSource(id=7, unit='milliwatt*hour'), 'kelvin')
+
+    def test_invalid_value(self):
+        convert = ingest.RawDataConverter(
+            DataSource(id=7, unit='milliwatt*hour'), 'milliwatt*hour')
+        with self.assertRaises(ingest.IngestError):
+            convert('line 1', '2014-01-01T00:00:00Z', 1.5)
+
+    def test_tariff_clock_hour(self):
+        convert = ingest.RawDataConverter(
+            DataSource(id=7, unit='currency_dkk*kilowatt^-1*hour^-1'),
+            'currency_dkk*kilowatt^-1*hour^-1')
+        with self.assertRaises(ingest.IngestError):
+            convert('line 1', '2014-01-01T00:03:00Z', 1)
+
+
+class IngestTest(TestCase):
+    def setUp(self):
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+        RawData.objects.create(
+            datasource=self.datasource, value=1,
+            timestamp=datetime.datetime(2014, 1, 1, tzinfo=pytz.utc))
+
+    def test_ingest(self):
+        self.assertEqual(
+            (3, 2),
+            ingest.ingest(
+                self.datasource, ingest.parse_csv, StringIO.StringIO(
+                    '2014-01-01T00:00:00Z,2\n'
+                    '2014-01-01T00:05:00Z,3\n'
+                    '2014-01-01T00:10:00Z,4\n'),
+                'watt*hour'))
+        self.assertEqual(
+            [1, 3000, 4000],
+            list(RawData.objects.filter(
+                datasource=self.datasource,
+            ).order_by('timestamp').values_list('value', flat=True)))
+
+    def test_error_after_insert(self):
+        with patch(
+                'gridplatform.datasources.models.RAW_DATA_INSERT_CHUNK_SIZE',
+                1), self.assertRaises(ingest.IngestError):
+            ingest.ingest(
+                self.datasource, ingest.parse_ndjson, StringIO.StringIO(
+                    '{"timestamp": "2014-01-01T00:05:00Z", "value": 3}\n'
+                    '{"timestamp": "2014-01-01T00:10:00Z", "value": 4}\n'
+                    'garbage\n'),
+                'milliwatt*hour')
+        # stored while parsing; cf. the transaction of RawDataBulkViewSet
+        self.assertEqual(
+            3, RawData.objects.filter(datasource=self.datasource).count())
+
+
+@override_settings(ENCRYPTION_TESTMODE=True)
+class RawDataBulkViewSetTest(TestCase):
+    def setUp(self):
+        self.datasource = DataSource.objects.create(unit='milliwatt*hour')
+        self.factory = RequestFactory()
+        self.view = viewsets.RawDataBulkViewSet.as_view(
+            actions={'post': 'create'})
+
+    def post(self, body, content_type, unit='milliwatt*hour'):
+        request = self.factory.post(
+            '/?unit=%s' % unit, data=body, content_type=content_type)
+        request.user = User(name_plain='test user', is_superuser=True)
+        return self.view(request, datasource_id=self.datasource.id)
+
+    def test_create(self):
+        body = '2014-01-01T00:00:00Z,1\n2014-01-01T00:05:00Z,2\n'
+        response = self.post(body, 'text/csv; charset=utf-8')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'received': 2, 'inserted': 2})
+        # repeated requests are safe
+        response = self.post(body, 'text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'received': 2, 'inserted': 0})
+        self.assertEqual(
+            2, RawData.objects.filter(datasource=self.datasource).count())
+
+    def test_unsupported_content_type(self):
+        response = self.post('<rawData/>', 'application/xml')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(RawData.objects.exists())
+
+    def test_invalid_data_rolled_back(self):
+        with patch(
+                'gridplatform.datasources.models.RAW_DATA_INSERT_CHUNK_SIZE',
+                1):
+            response = self.post(
+                '2014-01-01T00:00:00Z,1\n'
+                '2014-01-01T00:05:00Z,2\n'
+                '2014-01-01T00:10:00Z,many\n',
+                'text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 3', response.data['detail'])
+        self.assertFalse(RawData.objects.exists())
+
+    def test_incompatible_unit(self):
+        response = self.post(
+            '2014-01-01T00:00:00Z,1\n', 'text/csv', unit='kelvin')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RawData.objects.exists())
@@ -4,6 +4,9 @@ from __future__ import unicode_literals
 
 import datetime
 
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets
 from rest_framework import status
@@ -16,8 +19,10 @@ from gridplatform.utils.serializers import PointSampleSerializer
 from gridplatform.utils.unitconversion import PhysicalQuantity
 from rest_framework.templatetags.rest_framework import replace_query_param
 
+from . import ingest
 from . import models
 from . import serializers
+from .cache import get_datasource
 
 
 def _unit_check(unit, expected_unit):
@@ -97,9 +102,9 @@ class RawDataViewSetBase(viewsets.ModelViewSet):
             context={'request': request})
 
         if serializer.is_valid():
-            datasource = \
-                self.model._meta.get_field('datasource').rel.to.objects.get(
-                    id=request.parser_context['kwargs']['datasource_id'])
+            datasource = get_datasource(
+                self.model._meta.get_field('datasource').rel.to,
+                request.parser_context['kwargs']['datasource_id'])
             errors = _unit_check(request.DATA['unit'], datasource.unit)
             if errors:
                 serializer._errors = errors
@@ -117,9 +122,9 @@ class RawDataViewSetBase(viewsets.ModelViewSet):
             files=request.FILES,
             many=True)
         if serializer.is_valid():
-            datasource = \
-                self.model._meta.get_field('datasource').rel.to.objects.get(
-                    id=request.parser_context['kwargs']['datasource_id'])
+            datasource = get_datasource(
+                self.model._meta.get_field('datasource').rel.to,
+                request.parser_context['kwargs']['datasource_id'])
             errors = []
             for data in request.DATA:
                 errors.append(_unit_check(data['unit'], datasource.unit))
@@ -146,6 +151,49 @@ class RawDataViewSet(NestedMixin, RawDataViewSetBase):
     serializer_class = serializers.RawDataWithUnitSerializer
 
 
+class RawDataBulkViewSet(NestedMixin, viewsets.GenericViewSet):
+    """
+    Bulk ingest of raw data for a data source, e.g. for gateways back-filling
+    after an outage.  The request body is parsed according to its content
+    type; see :mod:`gridplatform.datasources.ingest` for the formats, of
+    which CSV and newline delimited JSON are parsed as a stream.  The unit is
+    given in the data or by the ``unit`` query parameter, and is validated
+    once per request.
+
+    Rows are stored with multi-row inserts as they are parsed; rows for
+    timestamps already stored are skipped, so a request may safely be
+    repeated.  On invalid data, nothing is stored.
+
+    Responds with the number of rows ``received`` and ``inserted``.
+    """
+    model = models.RawData
+
+    def create(self, request, *args, **kwargs):
+        try:
+            datasource = get_datasource(
+                self.model._meta.get_field('datasource').rel.to,
+                kwargs['datasource_id'])
+        except ObjectDoesNotExist:
+            raise Http404
+        content_type = request.META.get('CONTENT_TYPE', '')
+        parse = ingest.FORMATS.get(content_type.split(';')[0].strip())
+        if parse is None:
+            return Response(
+                {'detail': 'unsupported content type %s' % content_type},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            with transaction.atomic():
+                received, inserted = ingest.ingest(
+                    datasource, parse, request.stream,
+                    request.QUERY_PARAMS.get('unit'))
+        except ingest.IngestError as e:
+            return Response(
+                {'detail': unicode(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {'received': received, 'inserted': inserted},
+            status=status.HTTP_201_CREATED)
+
+
 class DataSourceViewSet(NestedMixin, viewsets.ModelViewSet):
     model = models.DataSource
     serializer_class = serializers.DataSourceSerializer
@@ -7,6 +7,7 @@ from django.db import models
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 
+from gridplatform.consumptions.metrics import ConsumptionMetrics
 from gridplatform.consumptions.models import ConsumptionGroup
 from gridplatform.customers.mixins import EncryptionCustomerFieldMixin
 from gridplatform.encryption.fields import EncryptedCharField
@@ -121,11 +122,11 @@ class ProductionEnergyPerformance(EnergyPerformance):
         """
         total_energy = sum(
             (
-                energy for energy in (
-                    consumptiongroup.energy_sum(
-                        from_timestamp, to_timestamp)
-                    for consumptiongroup in self.consumptiongroups.all())
-                if energy is not None),
+                metrics.energy for metrics in
+                ConsumptionMetrics.for_unions(
+                    self.consumptiongroups.all(),
+                    from_timestamp, to_timestamp)
+                if metrics.energy is not None),
             PhysicalQuantity(0, 'watt*hour'))
 
         total_production = sum(
@@ -188,11 +189,11 @@ class TimeEnergyPerformance(EnergyPerformance):
         assert from_timestamp < to_timestamp
         total_energy = sum(
             (
-                energy for energy in (
-                    consumptiongroup.energy_sum(
-                        from_timestamp, to_timestamp)
-                    for consumptiongroup in self.consumptiongroups.all())
-                if energy is not None),
+                metrics.energy for metrics in
+                ConsumptionMetrics.for_unions(
+                    self.consumptiongroups.all(),
+                    from_timestamp, to_timestamp)
+                if metrics.energy is not None),
             PhysicalQuantity(0, 'watt*hour'))
         return total_energy / \
             PhysicalQuantity(
@@ -2,22 +2,41 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from optparse import make_option
 import datetime
 import requests
 import re
 
 from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
 from django.db import transaction
 
 import pytz
 
 from gridplatform.global_datasources.models import GlobalDataSource
-from gridplatform.datasources.models import RawData
+from gridplatform.datasources.models import upsert_raw_data
+from gridplatform.tariffs.spotprices import invalidate_spot_prices
 
 
 class Command(BaseCommand):
     help = "Import data from nordpool api"
 
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--from',
+            dest='from_date',
+            help='Backfill prices from this date (YYYY-MM-DD)',
+            default=None,
+        ),
+        make_option(
+            '--to',
+            dest='to_date',
+            help='Backfill prices to this date (YYYY-MM-DD); '
+                 'defaults to today',
+            default=None,
+        ),
+    )
+
     def handle(self, *args, **options):
         dk1, created = GlobalDataSource.objects.get_or_create(
             name="dk1", app_label="nordpool", codename="nordpool_dk1",
@@ -25,7 +44,61 @@ class Command(BaseCommand):
         dk2, created = GlobalDataSource.objects.get_or_create(
             name="dk2", app_label="nordpool", codename="nordpool_dk2",
             country="DK", unit="currency_dkk*gigawatt^-1*hour^-1")
+        areas = {"DK1": dk1, "DK2": dk2}
+
+        if options['from_date']:
+            from_date = self._parse_date(options['from_date'])
+            if options['to_date']:
+                to_date = self._parse_date(options['to_date'])
+            else:
+                to_date = datetime.date.today()
+            if to_date < from_date:
+                raise CommandError('--to before --from')
+            dates = [
+                from_date + datetime.timedelta(days=n)
+                for n in range((to_date - from_date).days + 1)]
+        elif options['to_date']:
+            raise CommandError('--to given without --from')
+        else:
+            # the prices currently published
+            dates = [None]
+
+        # {datasource id: {timestamp: value}}; fetched before writing
+        # anything, so that the transaction is not held open while waiting
+        # for the api.
+        prices = dict((datasource.id, {}) for datasource in areas.values())
+        for date in dates:
+            for area, timestamp, value in self._fetch(date, areas):
+                prices[areas[area].id][timestamp] = value
+
+        with transaction.atomic():
+            for area, datasource in sorted(areas.items()):
+                inserted, updated = upsert_raw_data(
+                    datasource.id, prices[datasource.id].items())
+                self.stdout.write('%s: %d inserted, %d updated' % (
+                    area, inserted, updated))
+
+        # The rows are stored without model signals.
+        timestamps = [
+            timestamp for values in prices.values() for timestamp in values]
+        if timestamps:
+            invalidate_spot_prices(
+                [dk1.id, dk2.id], min(timestamps),
+                max(timestamps) + datetime.timedelta(hours=1))
 
+    def _parse_date(self, date):
+        try:
+            return datetime.datetime.strptime(date, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('invalid date %s' % date)
+
+    def _fetch(self, date, areas):
+        """
+        Fetch the hourly prices of the given areas on the given date, or the
+        prices currently published if ``date`` is ``None``.
+
+        :return: A list of ``(area, timestamp, value)``.
+        """
         url = 'http://www.nordpoolspot.com/api/marketdata/page/41?currency=,DKK,,EUR'
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0) AppleWebKit/537.36 (KHTML,'
@@ -37,46 +110,32 @@ class Command(BaseCommand):
             'Accept-Language': 'da-DK,da;q=0.8,en-US;q=0.6,en;q=0.4,nb;q=0.2',
         }
 
-        response = requests.get(url, headers=headers)
+        params = {}
+        if date is not None:
+            params['endDate'] = date.strftime('%d-%m-%Y')
+
+        response = requests.get(url, headers=headers, params=params)
         data = {}
 
         if response.ok:
             data = response.json()['data']['Rows']
 
         prog = re.compile(r"\d\d&nbsp;-&nbsp;\d\d")
+        result = []
 
-        with transaction.atomic():
-            for row in data:
-                if prog.match(row["Name"]):
-                    timestamp = datetime.datetime.strptime(
-                        row["StartTime"], "%Y-%m-%dT%H:%M:%S")
-                    timestamp = pytz.timezone('Europe/Copenhagen').localize(timestamp)
-                    print timestamp
-                    for column in row["Columns"]:
-                        if column["Name"] == "DK1":
-                            self._update_or_create(
-                                timestamp,
-                                dk1.id,
-                                {
-                                    'value': int(float(column["Value"].replace(',', '.').replace(' ', '')) * 1000),
-                                }
-                            )
-                        elif column["Name"] == "DK2":
-                            self._update_or_create(
-                                timestamp,
-                                dk2.id,
-                                {
-                                    'value': int(float(column["Value"].replace(',', '.').replace(' ', '')) * 1000),
-                                }
-                            )
-
-    def _update_or_create(self, timestamp, datasource_id, updated_values):
-        try:
-            obj = RawData.objects.get(timestamp=timestamp, datasource_id=datasource_id)
-            for key, value in updated_values.iteritems():
-                setattr(obj, key, value)
-            obj.save()
-        except RawData.DoesNotExist:
-            updated_values.update({'timestamp': timestamp, 'datasource_id': datasource_id, 'unit': "currency_dkk*gigawatt^-1*hour^-1"})
-            obj = RawData(**updated_values)
-            obj.save()
+        for row in data:
+            if prog.match(row["Name"]):
+                timestamp = datetime.datetime.strptime(
+                    row["StartTime"], "%Y-%m-%dT%H:%M:%S")
+                timestamp = pytz.timezone('Europe/Copenhagen').localize(
+                    timestamp)
+                for column in row["Columns"]:
+                    if column["Name"] not in areas:
+                        continue
+                    result.append((
+                        column["Name"],
+                        timestamp,
+                        int(float(column["Value"].replace(
+                            ',', '.').replace(' ', '')) * 1000),
+                    ))
+        return result
@@ -21,6 +21,9 @@ from gridplatform.utils import condense
 from gridplatform.utils.samples import Sample
 from gridplatform.datasequences.models import CurrencyUnitMixin
 
+from .spotprices import spot_prices
+from .spotprices import tariff_values
+
 
 class Tariff(CurrencyUnitMixin, piecewiseconstant.PiecewiseConstantBase):
     """
@@ -308,36 +311,34 @@ class SpotPricePeriod(SubscriptionMixin, Period):
         return self.spotprice.unit
 
     def _value_sequence(self, from_timestamp, to_timestamp):
-        unit = self.spotprice.unit
-        constant = PhysicalQuantity(
-            self.constant, self.unit_for_constant_and_ceiling)
-        coefficient = self.coefficient
-
+        """
+        Yields hourly samples of the spot price with ``self.coefficient``,
+        ``self.constant`` and ``self.ceiling`` applied.  The spot prices are
+        read through :func:`gridplatform.tariffs.spotprices.spot_prices`.
+        """
         if self.ceiling is not None:
-            def value(spot_value):
-                ceiling = PhysicalQuantity(
-                    self.ceiling, self.unit_for_constant_and_ceiling)
-                return min(
-                    PhysicalQuantity(
-                        spot_value, unit) * coefficient + constant,
-                    ceiling)
+            ceiling = PhysicalQuantity(
+                self.ceiling, self.unit_for_constant_and_ceiling)
         else:
-            def value(spot_value):
-                return PhysicalQuantity(
-                    spot_value, unit) * coefficient + constant
+            ceiling = None
 
         # NOTE: this assumes that the "spotprice" datasource delivers hourly
         # data.
-        spot_data = self.spotprice.rawdata_set.filter(
-            timestamp__gte=from_timestamp,
-            timestamp__lt=to_timestamp
-        ).order_by('timestamp').values_list('timestamp', 'value')
-
-        for timestamp, spot_value in spot_data:
+        timestamps, spot_values = spot_prices(
+            self.spotprice_id, from_timestamp, to_timestamp)
+        if not timestamps:
+            return
+        values = tariff_values(
+            spot_values, self.spotprice.unit, self.coefficient,
+            PhysicalQuantity(
+                self.constant, self.unit_for_constant_and_ceiling),
+            ceiling)
+
+        for timestamp, value in zip(timestamps, values):
             # BUG: timezone retreived from db as utc.  RelativeTimeDelta is
             # equivalent with datetime.timedelta in that case, and the DST
             # transitions may not be handled correctly.
             yield Sample(
                 timestamp,
-                timestamp + RelativeTimeDelta(hours=1), value(spot_value),
+                timestamp + RelativeTimeDelta(hours=1), value,
                 False, False)
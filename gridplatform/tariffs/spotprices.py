@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Spot prices for :class:`.SpotPricePeriod`, read through an in-process cache
+of the hourly raw data of spot price data sources.
+
+Spot prices are global data; the same series are read by the tariffs of
+every customer, and the same days are read again and again when evaluating
+costs.  The cache holds the raw data of a spot price data source per UTC
+date, and only complete days are cached, so days still being published are
+always read from the database.
+
+Invalidation must reach every process, while the cache itself is local to
+each of them.  Each cached day is therefore tagged with the invalidation
+generation of that day, kept in the shared ``django.core.cache``, and is only
+used while the shared generation is unchanged.  A day is invalidated by
+giving it a new generation; through model signals on raw data saved or
+deleted, and explicitly with :func:`.invalidate_spot_prices` by imports that
+bypass the signals, such as the ``fetch_nordpool`` management command.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from fractions import Fraction
+from fractions import gcd
+import bisect
+import datetime
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+import numpy
+import pytz
+
+from gridplatform.datasources.cache import MetadataCache
+from gridplatform.datasources.models import RawData
+from gridplatform.utils.unitconversion import IncompatibleUnitsError
+from gridplatform.utils.unitconversion import PhysicalQuantity
+
+
+#: Invalidation generation and hourly raw data by spot price data source id
+#: and UTC date.
+spotprice_cache = MetadataCache(maxsize=20000, ttl=60 * 60)
+
+# Seconds a generation is kept in the shared cache; longer than any entry of
+# an older generation may live in spotprice_cache.
+_GENERATION_TIMEOUT = 2 * spotprice_cache.ttl
+
+_HOURS_PER_DAY = 24
+_INT64_SAFE = 2 ** 62
+
+
+def _utc_date(timestamp):
+    return timestamp.astimezone(pytz.utc).date()
+
+
+def _days(from_date, to_date):
+    return [
+        from_date + datetime.timedelta(days=n)
+        for n in range((to_date - from_date).days + 1)]
+
+
+def _generation_key(datasource_id, date):
+    return 'tariffs.spotprices:%d:%s' % (datasource_id, date.isoformat())
+
+
+def _generations(datasource_id, dates):
+    """
+    :return: A dictionary of the shared invalidation generation by date; 0
+        for days not invalidated recently.
+    """
+    keys = dict((_generation_key(datasource_id, date), date) for date in dates)
+    generations = cache.get_many(keys.keys())
+    return dict(
+        (date, generations.get(key, 0)) for key, date in keys.items())
+
+
+def _load_days(datasource_id, dates, generations):
+    """
+    Read the raw data of the given UTC dates with a single query, and cache
+    the complete days tagged with their generation from ``generations``.
+
+    :return: A dictionary of ``(timestamps, values)`` by date.
+    """
+    from_timestamp = pytz.utc.localize(
+        datetime.datetime.combine(min(dates), datetime.time()))
+    to_timestamp = pytz.utc.localize(
+        datetime.datetime.combine(
+            max(dates) + datetime.timedelta(days=1), datetime.time()))
+    rows = RawData.objects.filter(
+        datasource_id=datasource_id,
+        timestamp__gte=from_timestamp,
+        timestamp__lt=to_timestamp,
+    ).order_by('timestamp').values_list('timestamp', 'value')
+
+    days = dict((date, ([], [])) for date in dates)
+    for timestamp, value in rows:
+        day = days.get(_utc_date(timestamp))
+        if day is not None:
+            day[0].append(timestamp)
+            day[1].append(value)
+
+    result = dict(
+        (date, (tuple(timestamps), tuple(values)))
+        for date, (timestamps, values) in days.items())
+    spotprice_cache.set_many(dict(
+        ((datasource_id, date), (generations[date], day))
+        for date, day in result.items()
+        if len(day[0]) == _HOURS_PER_DAY))
+    return result
+
+
+def spot_prices(datasource_id, from_timestamp, to_timestamp):
+    """
+    The raw data of a spot price data source within the given timespan.
+
+    :param datasource_id: The id of the spot price data source.
+
+    :return: A pair of a list of timestamps and a list of the corresponding
+        values in the unit of the data source, ordered by timestamp.
+    """
+    if from_timestamp >= to_timestamp:
+        return [], []
+    dates = _days(
+        _utc_date(from_timestamp),
+        _utc_date(to_timestamp - datetime.timedelta(microseconds=1)))
+    generations = _generations(datasource_id, dates)
+    cached = spotprice_cache.get_many(
+        [(datasource_id, date) for date in dates])
+    days = dict(
+        (date, day) for (_, date), (generation, day) in cached.items()
+        if generation == generations[date])
+    missing = [date for date in dates if date not in days]
+    if missing:
+        days.update(_load_days(datasource_id, missing, generations))
+
+    timestamps = []
+    values = []
+    for date in dates:
+        day_timestamps, day_values = days[date]
+        # only the first and the last day may extend beyond the timespan
+        start = bisect.bisect_left(day_timestamps, from_timestamp)
+        end = bisect.bisect_left(day_timestamps, to_timestamp)
+        timestamps.extend(day_timestamps[start:end])
+        values.extend(day_values[start:end])
+    return timestamps, values
+
+
+def invalidate_spot_prices(datasource_ids, from_timestamp, to_timestamp):
+    """
+    Invalidate the cached spot prices of the given data sources within the
+    given timespan, in every process; for imports that do not save
+    :class:`~gridplatform.datasources.models.RawData` instances one by one.
+    """
+    if from_timestamp >= to_timestamp:
+        return
+    dates = _days(
+        _utc_date(from_timestamp),
+        _utc_date(to_timestamp - datetime.timedelta(microseconds=1)))
+    # The time of invalidation rather than a counter, so that a generation
+    # is not reused once an expired generation has been reset to 0.
+    generation = time.time()
+    cache.set_many(dict(
+        (_generation_key(datasource_id, date), generation)
+        for datasource_id in datasource_ids for date in dates),
+        _GENERATION_TIMEOUT)
+    spotprice_cache.invalidate(
+        (datasource_id, date)
+        for datasource_id in datasource_ids for date in dates)
+
+
+def tariff_values(values, unit, coefficient, constant, ceiling=None):
+    """
+    The tariff values for the given spot price values.  The n'th result
+    equals ``min(PhysicalQuantity(values[n], unit) * coefficient + constant,
+    ceiling)``, but the coefficient, constant and ceiling are applied to all
+    the values at once, on integers over a common denominator, rather than
+    with :class:`.PhysicalQuantity` arithmetic per value.
+
+    :param values: The spot price values.
+    :param unit: The unit of the spot price values.
+    :param coefficient: A unitless :class:`~decimal.Decimal` coefficient.
+    :param constant: A :class:`.PhysicalQuantity` added after multiplying
+        with ``coefficient``.
+    :param ceiling: An optional :class:`.PhysicalQuantity` upper bound.
+
+    :return: A list of :class:`.PhysicalQuantity`.
+
+    :raise IncompatibleUnitsError: If ``constant`` or ``ceiling`` is not
+        compatible with ``unit``.
+    """
+    quantum = PhysicalQuantity(1, unit)
+    for quantity in [constant, ceiling]:
+        if quantity is not None and \
+                quantity.unit_vector != quantum.unit_vector:
+            raise IncompatibleUnitsError(
+                'spot price unit %s incompatible with %s' % (unit, quantity))
+    scale = quantum.value * Fraction(coefficient)
+    terms = [scale, constant.value]
+    if ceiling is not None:
+        terms.append(ceiling.value)
+    denominator = reduce(
+        lambda a, b: a // gcd(a, b) * b,
+        (term.denominator for term in terms), 1)
+    multiplier, offset = [
+        int(term * denominator) for term in terms[:2]]
+
+    magnitude = max([abs(value) for value in values] or [0])
+    if magnitude * abs(multiplier) + abs(offset) < _INT64_SAFE:
+        dtype = numpy.int64
+    else:
+        dtype = object
+    numerators = numpy.array(values, dtype=dtype) * multiplier + offset
+    if ceiling is not None:
+        numerators = numpy.minimum(
+            numerators, int(ceiling.value * denominator))
+
+    return [
+        PhysicalQuantity._make(
+            (Fraction(int(numerator), denominator), quantum.unit_vector))
+        for numerator in numerators]
+
+
+@receiver(post_save, sender=RawData,
+          dispatch_uid='tariffs_spotprices_invalidate_save')
+@receiver(post_delete, sender=RawData,
+          dispatch_uid='tariffs_spotprices_invalidate_delete')
+def _invalidate_rawdata(sender, instance, **kwargs):
+    invalidate_spot_prices(
+        [instance.datasource_id], instance.timestamp,
+        instance.timestamp + datetime.timedelta(microseconds=1))
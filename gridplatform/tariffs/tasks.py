@@ -17,7 +17,7 @@ def tariff_hourly_task(
 
     result = {}
     result['tariff_id'] = tariff_id
-    result['data'] = list(tariff.period_set.value_sequence(from_timestamp, to_timestamp))
+    result['data'] = data
     task.set_progress(1, 1)
 
     return result
@@ -5,9 +5,11 @@ from __future__ import unicode_literals
 import datetime
 from decimal import Decimal
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.core.exceptions import ValidationError
+from mock import patch
 import pytz
 
 from gridplatform import trackuser
@@ -19,6 +21,7 @@ from gridplatform.customers.models import Customer
 from gridplatform.providers.models import Provider
 from gridplatform.utils import units
 from gridplatform.utils.samples import Sample
+from gridplatform.datasources.cache import MetadataCache
 from gridplatform.datasources.models import RawData
 
 from . import forms
@@ -27,6 +30,10 @@ from .models import EnergyTariff
 from .models import VolumeTariff
 from .models import FixedPricePeriod
 from .models import SpotPricePeriod
+from .spotprices import invalidate_spot_prices
+from .spotprices import spot_prices
+from .spotprices import spotprice_cache
+from .spotprices import tariff_values
 
 
 @override_settings(ENCRYPTION_TESTMODE=True)
@@ -212,6 +219,8 @@ class VolumeTariffTest(TestCase):
 @override_settings(ENCRYPTION_TESTMODE=True)
 class SpotPricePeriodTest(TestCase):
     def setUp(self):
+        spotprice_cache.clear()
+        cache.clear()
         self.provider = Provider.objects.create()
         self.customer = Customer.objects.create()
         self.timezone = pytz.timezone('Europe/Copenhagen')
@@ -349,3 +358,121 @@ class SpotPricePeriodTest(TestCase):
                 self.tariff.period_set.value_sequence(
                     from_timestamp,
                     from_timestamp + datetime.timedelta(days=1))))
+
+
+@override_settings(ENCRYPTION_TESTMODE=True)
+class SpotPricesTest(TestCase):
+    def setUp(self):
+        spotprice_cache.clear()
+        cache.clear()
+        self.spotprice = gridplatform.global_datasources.models. \
+            GlobalDataSource.objects.create(
+                name='test spot price',
+                app_label='nordpool',
+                codename='test',
+                country='DK',
+                unit='currency_dkk*gigawatt^-1*hour^-1',
+            )
+        self.from_timestamp = datetime.datetime(2014, 1, 1, tzinfo=pytz.utc)
+        RawData.objects.bulk_create([
+            RawData(
+                datasource=self.spotprice,
+                timestamp=self.from_timestamp + datetime.timedelta(hours=h),
+                value=1000 * h)
+            for h in range(36)])
+
+    def test_spot_prices(self):
+        timestamps, values = spot_prices(
+            self.spotprice.id,
+            self.from_timestamp + datetime.timedelta(hours=22),
+            self.from_timestamp + datetime.timedelta(hours=26))
+        self.assertEqual(
+            [self.from_timestamp + datetime.timedelta(hours=h)
+             for h in range(22, 26)],
+            timestamps)
+        self.assertEqual([1000 * h for h in range(22, 26)], values)
+
+    def test_complete_days_cached(self):
+        to_timestamp = self.from_timestamp + datetime.timedelta(days=1)
+        with self.assertNumQueries(1):
+            spot_prices(self.spotprice.id, self.from_timestamp, to_timestamp)
+        with self.assertNumQueries(0):
+            timestamps, values = spot_prices(
+                self.spotprice.id, self.from_timestamp, to_timestamp)
+        self.assertEqual([1000 * h for h in range(24)], values)
+
+    def test_incomplete_days_not_cached(self):
+        from_timestamp = self.from_timestamp + datetime.timedelta(days=1)
+        to_timestamp = from_timestamp + datetime.timedelta(days=1)
+        with self.assertNumQueries(1):
+            spot_prices(self.spotprice.id, from_timestamp, to_timestamp)
+        with self.assertNumQueries(1):
+            timestamps, values = spot_prices(
+                self.spotprice.id, from_timestamp, to_timestamp)
+        self.assertEqual([1000 * h for h in range(24, 36)], values)
+
+    def test_invalidated_on_save(self):
+        to_timestamp = self.from_timestamp + datetime.timedelta(days=1)
+        spot_prices(self.spotprice.id, self.from_timestamp, to_timestamp)
+        rawdata = RawData.objects.get(
+            datasource=self.spotprice, timestamp=self.from_timestamp)
+        rawdata.value = 42
+        rawdata.save()
+        timestamps, values = spot_prices(
+            self.spotprice.id, self.from_timestamp, to_timestamp)
+        self.assertEqual(42, values[0])
+
+    def test_invalidate_spot_prices(self):
+        to_timestamp = self.from_timestamp + datetime.timedelta(days=1)
+        spot_prices(self.spotprice.id, self.from_timestamp, to_timestamp)
+        RawData.objects.filter(
+            datasource=self.spotprice, timestamp=self.from_timestamp,
+        ).update(value=42)
+        invalidate_spot_prices(
+            [self.spotprice.id], self.from_timestamp,
+            self.from_timestamp + datetime.timedelta(hours=1))
+        timestamps, values = spot_prices(
+            self.spotprice.id, self.from_timestamp, to_timestamp)
+        self.assertEqual(42, values[0])
+
+    def test_invalidate_spot_prices_other_process(self):
+        to_timestamp = self.from_timestamp + datetime.timedelta(days=1)
+        spot_prices(self.spotprice.id, self.from_timestamp, to_timestamp)
+        RawData.objects.filter(
+            datasource=self.spotprice, timestamp=self.from_timestamp,
+        ).update(value=42)
+        # as by fetch_nordpool, in a process with a cache of its own
+        with patch('gridplatform.tariffs.spotprices.spotprice_cache',
+                   MetadataCache()):
+            invalidate_spot_prices(
+                [self.spotprice.id], self.from_timestamp,
+                self.from_timestamp + datetime.timedelta(hours=1))
+        self.assertEqual(1, len(spotprice_cache))
+        with self.assertNumQueries(1):
+            timestamps, values = spot_prices(
+                self.spotprice.id, self.from_timestamp, to_timestamp)
+        self.assertEqual(42, values[0])
+        with self.assertNumQueries(0):
+            spot_prices(self.spotprice.id, self.from_timestamp, to_timestamp)
+
+    def test_tariff_values(self):
+        unit = 'currency_dkk*gigawatt^-1*hour^-1'
+        spot_values = [-10 ** 7, 0, 1234567, 10 ** 8]
+        coefficient = Decimal('1.125')
+        constant = PhysicalQuantity(
+            Decimal('0.333'), 'currency_dkk*kilowatt^-1*hour^-1')
+        ceiling = PhysicalQuantity(
+            Decimal('0.5'), 'currency_dkk*kilowatt^-1*hour^-1')
+        self.assertEqual(
+            [
+                min(PhysicalQuantity(value, unit) * coefficient + constant,
+                    ceiling)
+                for value in spot_values
+            ],
+            tariff_values(spot_values, unit, coefficient, constant, ceiling))
+        self.assertEqual(
+            [
+                PhysicalQuantity(value, unit) * coefficient + constant
+                for value in spot_values
+            ],
+            tariff_values(spot_values, unit, coefficient, constant))
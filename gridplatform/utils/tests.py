@@ -68,6 +68,8 @@ from .unitconversion import IncompatibleUnitsError
 from .unitconversion import NotPhysicalQuantityError
 from .unitconversion import PhysicalQuantity
 from .unitconversion import UnitParseError
+from .unitconversion import dot_quantities
+from .unitconversion import sum_quantities
 from .units import preferred_unit_bases
 from .views import HomeViewBase
 from .views import CustomerViewBase
@@ -1126,6 +1128,55 @@ class UnitConversionTest(SimpleTestCase):
             3 * PhysicalQuantity(2, 'ampere'),
             PhysicalQuantity(6, 'ampere'))
 
+    def test_sum_quantities(self):
+        quantities = [
+            PhysicalQuantity(Fraction(n, 7 + n % 13), 'milliwatt*hour')
+            for n in range(100)]
+        self.assertEqual(
+            sum(quantities[1:], quantities[0]),
+            sum_quantities(quantities))
+        self.assertEqual(
+            sum(quantities, PhysicalQuantity(0, 'joule')),
+            sum_quantities(quantities, 'joule'))
+
+    def test_sum_quantities_empty(self):
+        self.assertIsNone(sum_quantities([]))
+        self.assertEqual(
+            PhysicalQuantity(0, 'joule'), sum_quantities([], 'joule'))
+
+    def test_sum_quantities_incompatible(self):
+        with self.assertRaises(IncompatibleUnitsError):
+            sum_quantities(
+                [PhysicalQuantity(1, 'joule'), PhysicalQuantity(1, 'meter')])
+        with self.assertRaises(IncompatibleUnitsError):
+            sum_quantities([PhysicalQuantity(1, 'joule')], 'meter')
+        with self.assertRaises(NotPhysicalQuantityError):
+            sum_quantities([PhysicalQuantity(1, 'joule'), 5])
+
+    def test_dot_quantities(self):
+        energy = [
+            PhysicalQuantity(Fraction(n, 3 + n % 11), 'kilowatt*hour')
+            for n in range(100)]
+        prices = [
+            PhysicalQuantity(
+                Fraction(n, 100), 'currency_dkk*kilowatt^-1*hour^-1')
+            for n in range(100)]
+        self.assertEqual(
+            sum((a * b for a, b in zip(energy, prices)),
+                PhysicalQuantity(0, 'currency_dkk')),
+            dot_quantities(energy, prices, 'currency_dkk'))
+
+    def test_dot_quantities_errors(self):
+        with self.assertRaises(ValueError):
+            dot_quantities([PhysicalQuantity(1, 'joule')], [])
+        with self.assertRaises(IncompatibleUnitsError):
+            dot_quantities(
+                [PhysicalQuantity(1, 'joule')],
+                [PhysicalQuantity(1, 'joule')], 'joule')
+        self.assertEqual(
+            PhysicalQuantity(0, 'currency_dkk'),
+            dot_quantities([], [], 'currency_dkk'))
+
     def test_div(self):
         self.assertEqual(
             PhysicalQuantity(2) / 1,
@@ -39,19 +39,59 @@ def fetch_import_day(date):
         #             to_timestamp=aware_to_timestamp,
         #             value=value)
         if online:
-            for line in online['data']:
-                from_timestamp = line[0]
-                to_timestamp = from_timestamp + datetime.timedelta(minutes=5)
-                value = line[16]
-                try:
-                    entry = binding.index.entry_set.get(
-                        from_timestamp=from_timestamp,
-                        to_timestamp=to_timestamp)
-                    if entry.value != value:
-                        entry.value = value
-                        entry.save()
-                except Entry.DoesNotExist:
-                    binding.index.entry_set.create(
-                        from_timestamp=from_timestamp,
-                        to_timestamp=to_timestamp,
-                        value=value)
+            store_entries(
+                binding.index,
+                [
+                    (
+                        line[0],
+                        line[0] + datetime.timedelta(minutes=5),
+                        line[16],
+                    )
+                    for line in online['data']
+                ])
+
+
+def store_entries(index, entries):
+    """
+    Store entries for an index, replacing the values of entries already
+    stored for the same intervals.
+
+    Existing entries are read with a single ranged query, new entries are
+    created with C{bulk_create()}, and only the values that changed are
+    updated.
+
+    @param index: The L{Index} to store entries for.
+
+    @param entries: A list of C{(from_timestamp, to_timestamp, value)}
+    tuples.
+
+    @return: The number of entries created and the number of entries
+    updated.
+    """
+    if not entries:
+        return 0, 0
+    existing = dict(
+        ((from_timestamp, to_timestamp), (entry_id, value))
+        for entry_id, from_timestamp, to_timestamp, value in
+        index.entry_set.filter(
+            from_timestamp__gte=min(entry[0] for entry in entries),
+            from_timestamp__lte=max(entry[0] for entry in entries),
+        ).values_list('id', 'from_timestamp', 'to_timestamp', 'value'))
+
+    new = []
+    changed = 0
+    for from_timestamp, to_timestamp, value in entries:
+        try:
+            entry_id, stored_value = existing[(from_timestamp, to_timestamp)]
+        except KeyError:
+            new.append(Entry(
+                index=index,
+                from_timestamp=from_timestamp,
+                to_timestamp=to_timestamp,
+                value=value))
+            continue
+        if stored_value != value:
+            Entry.objects.filter(id=entry_id).update(value=value)
+            changed += 1
+    Entry.objects.bulk_create(new)
+    return len(new), changed
@@ -2,9 +2,11 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from optparse import make_option
 import datetime
 
 from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
 from django.db.transaction import commit_on_success
 
 from legacy.energinet_co2.importer import fetch_import_day
@@ -17,11 +19,52 @@ class Command(BaseCommand):
     help = 'Import Energinet.dk CO2 data. ' + \
         'Date format YYYY-MM-DD; defaults to yesterday.'
 
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--from',
+            dest='from_date',
+            help='Backfill data from this date (YYYY-MM-DD)',
+            default=None,
+        ),
+        make_option(
+            '--to',
+            dest='to_date',
+            help='Backfill data to this date (YYYY-MM-DD); '
+                 'defaults to yesterday',
+            default=None,
+        ),
+    )
+
     def handle(self, *args, **options):
+        yesterday = (datetime.datetime.now() -
+                     datetime.timedelta(days=1)).date()
+        if options['from_date']:
+            if args:
+                raise CommandError('date given together with --from')
+            from_date = self._parse_date(options['from_date'])
+            if options['to_date']:
+                to_date = self._parse_date(options['to_date'])
+            else:
+                to_date = yesterday
+            if to_date < from_date:
+                raise CommandError('--to before --from')
+        elif options['to_date']:
+            raise CommandError('--to given without --from')
+        elif args:
+            from_date = to_date = self._parse_date(args[0])
+        else:
+            from_date = to_date = yesterday
+
+        date = from_date
+        while date <= to_date:
+            # one transaction per day, rather than holding locks for the
+            # entire backfill
+            with commit_on_success():
+                fetch_import_day(date)
+            date += datetime.timedelta(days=1)
+
+    def _parse_date(self, date):
         try:
-            date = datetime.datetime.strptime(args[0], DATE_FORMAT).date()
-        except IndexError:
-            date = (datetime.datetime.now() -
-                    datetime.timedelta(days=1)).date()
-        with commit_on_success():
-            fetch_import_day(date)
+            return datetime.datetime.strptime(date, DATE_FORMAT).date()
+        except ValueError:
+            raise CommandError('invalid date %s' % date)
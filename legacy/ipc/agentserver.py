@@ -2,10 +2,14 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
-import logging
 import json
+import logging
+import os
+import socket
+import threading
 
 import pika
+import pika.exceptions
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -24,19 +28,93 @@ def agent_routing_key(agent_mac):
     return 'agent.{:012x}'.format(int(agent_mac))
 
 
+class Publisher(object):
+    """
+    Publishes messages to the agent servers over a single AMQP connection,
+    kept open between calls and shared by all threads in the process.  The
+    connection is (re)opened on demand; on a connection error, the message
+    being published is retried once on a new connection.
+    """
+    exchange = 'agentservers'
+
+    def __init__(self, url=None):
+        self._url = url
+        self._lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+        self._pid = None
+        self.connects = 0
+
+    @property
+    def url(self):
+        return str(self._url or settings.BROKER_URL)
+
+    def _connect(self):
+        connection = pika.BlockingConnection(pika.URLParameters(self.url))
+        channel = connection.channel()
+        channel.exchange_declare(exchange=self.exchange, exchange_type='topic')
+        self._connection = connection
+        self._channel = channel
+        # a connection must not be shared with forked child processes
+        self._pid = os.getpid()
+        self.connects += 1
+
+    def _disconnect(self):
+        connection = self._connection
+        self._connection = None
+        self._channel = None
+        if connection is not None and self._pid == os.getpid():
+            try:
+                connection.close()
+            except Exception as e:
+                logger.debug('error closing connection: %s', e)
+
+    def _publish(self, routing_key, body):
+        if self._connection is None or self._pid != os.getpid():
+            self._disconnect()
+            self._connect()
+        self._channel.basic_publish(
+            exchange=self.exchange,
+            routing_key=routing_key,
+            properties=pika.BasicProperties(
+                content_type='application/json'),
+            body=body)
+
+    def publish(self, messages):
+        """
+        Publish `messages`, an iterable of `(routing_key, message)` pairs,
+        in order; each `message` is JSON-serialised.
+        """
+        with self._lock:
+            for routing_key, message in messages:
+                body = json.dumps(message)
+                try:
+                    self._publish(routing_key, body)
+                except (pika.exceptions.AMQPError, socket.error) as e:
+                    logger.warning('AMQP error: %s; reconnecting', e)
+                    self._disconnect()
+                    self._publish(routing_key, body)
+                logger.debug('sent; routing key: %s, message: %s',
+                             routing_key, message)
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+publisher = Publisher()
+
+
 def send_message(routing_key, message):
-    connection = pika.BlockingConnection(pika.URLParameters(
-        str(settings.BROKER_URL)))
-    channel = connection.channel()
-    channel.exchange_declare(exchange='agentservers', exchange_type='topic')
-    channel.basic_publish(
-        exchange='agentservers',
-        routing_key=routing_key,
-        properties=pika.BasicProperties(
-            content_type='application/json'),
-        body=json.dumps(message))
-    connection.close()
-    logger.debug('sent; routing key: %s, message: %s', routing_key, message)
+    publisher.publish([(routing_key, message)])
+
+
+def send_messages(messages):
+    """
+    Send `messages`, an iterable of `(routing_key, message)` pairs, in
+    order.
+    """
+    publisher.publish(messages)
 
 
 def control_mode(agent_mac, meters, control_manual):
@@ -79,7 +157,11 @@ def agent_swupdate(agent_mac, software_image):
     send_message(routing_key, message)
 
 
-def agent_rules(agent_mac, rulesets):
+def agent_rules_message(agent_mac, rulesets):
+    """
+    The `(routing_key, message)` pair sent by :func:`agent_rules`; for
+    sending rules to many agents with :func:`send_messages`.
+    """
     rulesets = [{'meters': [gridpoint_id(connection_type, nid)
                             for connection_type, nid in meters],
                  'rules': [{'start_time': start_time,
@@ -93,4 +175,21 @@ def agent_rules(agent_mac, rulesets):
         'agent': format_mac(agent_mac),
         'rulesets': rulesets,
     }
+    return routing_key, message
+
+
+def agent_rules(agent_mac, rulesets):
+    send_message(*agent_rules_message(agent_mac, rulesets))
+
+
+def inputs_changed(agent_mac):
+    """
+    Make the agent server forget cached meters and physical inputs for the
+    agent; e.g. after moving the agent to another customer.
+    """
+    routing_key = agent_routing_key(agent_mac)
+    message = {
+        'command': 'inputs_changed',
+        'agent': format_mac(agent_mac),
+    }
     send_message(routing_key, message)
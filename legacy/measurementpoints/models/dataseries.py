@@ -1155,6 +1155,14 @@ class DataSeries(DataSeriesBase, StoreSubclass):
         available.
         """
         assert self.is_rate()
+        subclass_instance = self.subclass_instance
+        if type(subclass_instance)._get_samples.im_func is \
+                DataSeries._get_samples.im_func and \
+                self.is_continuous() and \
+                self.get_underlying_function() != self.INTERVAL_FUNCTION:
+            return subclass_instance._latest_stored_sample(
+                from_timestamp, to_timestamp)
+
         raw_data = self.get_samples(from_timestamp, to_timestamp)
 
         for sample in reversed(list(raw_data)):
@@ -1163,6 +1171,35 @@ class DataSeries(DataSeriesBase, StoreSubclass):
 
         return None
 
+    def _latest_stored_sample(self, from_timestamp, to_timestamp):
+        """
+        L{latest_sample()} for continuous rates stored as C{StoredData}; the
+        same sample as found among those of L{_get_samples()}, using at most
+        two single row queries on the timestamp index rather than loading all
+        C{StoredData} in the interval.
+        """
+        data_before = self.stored_data.filter(
+            timestamp__lte=to_timestamp).order_by('timestamp').last()
+        if data_before is None:
+            return None
+        if data_before.timestamp == to_timestamp:
+            return self.create_point_sample(
+                data_before.timestamp,
+                PhysicalQuantity(data_before.value, self.unit))
+        data_after = self.stored_data.filter(
+            timestamp__gt=to_timestamp).order_by('timestamp').first()
+        if data_after is not None:
+            # interpolated sample at to_timestamp
+            return self._interpolate_extrapolate_sample(
+                to_timestamp, data_before=data_before, data_after=data_after)
+        elif data_before.timestamp >= from_timestamp:
+            # the sample at to_timestamp would be extrapolated
+            return self.create_point_sample(
+                data_before.timestamp,
+                PhysicalQuantity(data_before.value, self.unit))
+        else:
+            return None
+
     def aggregated_samples(self, from_timestamp, to_timestamp):
         """
         The average sample, minimum sample and maximum sample of the given time
@@ -750,6 +750,57 @@ class InterpolationCloudTest(TestCase):
         self.assertEqual(result, expected_result)
 
 
+class LatestSampleTest(TestCase):
+    """
+    Test L{DataSeries.latest_sample()} for continuous rates stored directly
+    as C{StoredData}.
+    """
+
+    def setUp(self):
+        Provider.objects.create()
+        self.customer = Customer()
+        self.customer.save()
+        self.data_series = DataSeries.objects.create(
+            customer=self.customer,
+            role=DataRoleField.POWER,
+            unit='milliwatt',
+            utility_type=utilitytypes.OPTIONAL_METER_CHOICES.electricity)
+        self.timestamp = datetime(2013, 1, 1, tzinfo=pytz.utc)
+
+    def assertLatestSample(self, from_timestamp, to_timestamp):
+        """
+        Assert that latest_sample() equals the latest cachable sample of
+        get_samples().
+        """
+        samples = [
+            sample for sample in self.data_series.get_samples(
+                from_timestamp, to_timestamp)
+            if sample.cachable]
+        if samples:
+            expected = samples[-1]
+        else:
+            expected = None
+        self.assertEqual(
+            expected,
+            self.data_series.latest_sample(from_timestamp, to_timestamp))
+
+    def test_no_data(self):
+        self.assertIsNone(self.data_series.latest_sample(
+            self.timestamp, self.timestamp + timedelta(hours=1)))
+
+    def test_against_get_samples(self):
+        for minutes, value in [(0, 10), (10, 20), (20, 15), (45, 40)]:
+            self.data_series.stored_data.create(
+                timestamp=self.timestamp + timedelta(minutes=minutes),
+                value=value)
+        for from_minutes, to_minutes in [
+                (-10, -5), (-10, 0), (0, 0), (0, 5), (5, 10), (5, 15),
+                (11, 19), (12, 30), (20, 45), (30, 50), (50, 60)]:
+            self.assertLatestSample(
+                self.timestamp + timedelta(minutes=from_minutes),
+                self.timestamp + timedelta(minutes=to_minutes))
+
+
 class SummationTest(TestCase):
     """
     Test the L{Summation} model.
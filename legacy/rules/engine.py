@@ -29,15 +29,49 @@ Get active rules for timestamp:
 starting at current date and rules starting at previous date when they span
 over midnigt...
 ... and, we take timezones into account...
+
+Rather than polling, the engine may be run driven by notifications of new raw
+data (see L{run_event_driven()}); then rules are only processed when new data
+has arrived for their inputs or when one of their periods starts or ends.
+
+The rules generated from each user rule are kept in a L{RuleSchedule} for the
+day, so that the hourly refresh needs not regenerate them all.  Changes to
+user rules are announced on L{RULES_CHANNEL}; the rules generated from the
+changed user rules are then regenerated, and the set of active rules is
+refreshed right away.
+
+The actions resulting from processing the rules are executed asynchronously by
+an L{ActionExecutor}, so that slow actions do not hold up the engine.
 """
 
 import datetime
-import time
+import logging
+import select
 
+from django.db import connection
 import pytz
 
+from gridplatform.datasources.models import RAW_DATA_CHANNEL
+from legacy.rules.models import RULES_CHANNEL
 from legacy.rules.models import UserRule, EngineRule
+from legacy.rules.models import MinimizeRule, TriggeredRule
 from legacy.devices.models import Meter
+from legacy.rules.executor import ActionExecutor
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds to wait for raw data notifications between checks for rules due to
+# be processed.
+LISTEN_TIMEOUT = 1.0
+
+# Rules with inputs not traceable to data sources are processed this often, as
+# with polling.
+POLL_INTERVAL = datetime.timedelta(seconds=10)
+
+# All rules are processed this often regardless; in case of notifications
+# missed, and for raw data written without notifications.
+FULL_PROCESS_INTERVAL = datetime.timedelta(minutes=5)
 
 
 def get_tainted_meter_ids():
@@ -89,36 +123,276 @@ def get_engine_rules(date):
     return engine_rules
 
 
-def refresh_rules(rules, hour):
+def _depends_on_index_data(user_rule):
+    """
+    Whether the rules generated from C{user_rule} depend on index data, which
+    may change or arrive later than the rules are generated; e.g. spot
+    prices.
+    """
+    rule = user_rule.content_object
+    return isinstance(rule, MinimizeRule) or (
+        isinstance(rule, TriggeredRule) and
+        rule.indexinvariant_set.exists())
+
+
+class RuleSchedule(object):
+    """
+    The rules generated from each enabled L{UserRule}, by user rule and date
+    in the timezone of the user rule, with the actions of the L{EngineRule}s
+    prefetched.  L{get_engine_rules()} on the schedule returns the same as
+    the module level L{get_engine_rules()}, generating rules only for user
+    rules and dates not seen before.
+
+    Rules depending on index data are generated every time, as before; see
+    L{_depends_on_index_data()}.
+
+    @ivar generated: Number of times rules have been generated from a user
+    rule.
+    """
+    def __init__(self):
+        # [(user_rule, tainted, depends_on_index_data), ...]
+        self._user_rules = None
+        # {(user_rule_id, date): [rule, ...]}
+        self._rules = {}
+        self.generated = 0
+
+    def invalidate(self, user_rule_ids=None):
+        """
+        Forget the rules of the given user rules, or of all user rules if
+        C{user_rule_ids} is C{None}.  The set of enabled user rules and
+        tainted meters is reloaded in either case.
+        """
+        self._user_rules = None
+        if user_rule_ids is None:
+            self._rules.clear()
+        else:
+            for key in self._rules.keys():
+                if key[0] in user_rule_ids:
+                    del self._rules[key]
+
+    def _load_user_rules(self):
+        rules = UserRule.objects.filter(enabled=True)
+        tainted_rule_ids = set(rules.filter(
+            relayaction__meter__in=get_tainted_meter_ids()).values_list(
+            'id', flat=True))
+        self._user_rules = [
+            (user_rule, user_rule.id in tainted_rule_ids,
+             _depends_on_index_data(user_rule))
+            for user_rule in rules]
+
+    def get_engine_rules(self, date):
+        """
+        @see: L{get_engine_rules()}
+        """
+        assert isinstance(date, datetime.datetime)
+        assert date.tzinfo is not None
+        if self._user_rules is None:
+            self._load_user_rules()
+
+        engine_rules = []
+        for user_rule, tainted, depends_on_index_data in self._user_rules:
+            tz = user_rule.timezone
+            key = (user_rule.id, tz.normalize(date.astimezone(tz)).date())
+            rules = self._rules.get(key)
+            if rules is None:
+                rules = user_rule.generate_rules(date)
+                self.generated += 1
+                for rule in rules:
+                    if isinstance(rule, EngineRule):
+                        rule.prefetch_actions()
+                if not depends_on_index_data:
+                    self._rules[key] = rules
+            # Both AgentRules and EngineRules that have RelayActions that work
+            # on the relays of tainted Meters must be processed by the
+            # Engine.  For all other rules, only the actual EngineRules should
+            # be handled by the engine.
+            if tainted:
+                engine_rules.extend(rules)
+            else:
+                engine_rules.extend(
+                    rule for rule in rules if isinstance(rule, EngineRule))
+
+        # forget rules for dates past
+        oldest = date.date() - datetime.timedelta(days=2)
+        for key in self._rules.keys():
+            if key[1] < oldest:
+                del self._rules[key]
+
+        return engine_rules
+
+
+def refresh_rules(rules, hour, schedule=None):
     """
     HACK: figure out what rules have become active/inactive, in order to
     construct a set of currently active rules --- but keep the objects from the
     old set where possible, to let the value of the process_again property
     survive...
+
+    @param schedule: An optional L{RuleSchedule} to take the rules from.
     """
-    hour_rules = set(get_engine_rules(hour))
+    if schedule is not None:
+        hour_rules = set(schedule.get_engine_rules(hour))
+    else:
+        hour_rules = set(get_engine_rules(hour))
     new_rules = hour_rules - rules
     removed_rules = rules - hour_rules
     return (rules - removed_rules) | new_rules
 
 
+def apply_rule_changes(rules, hour, schedule, user_rule_ids):
+    """
+    Regenerate the rules of the changed user rules in C{schedule} and
+    refresh the set of active C{rules}.  Rules that remain active keep their
+    state, but have their actions reloaded.
+
+    @param user_rule_ids: Ids of the changed user rules, or C{None} if all
+    may have changed.
+
+    @return: The refreshed set of active rules.
+    """
+    schedule.invalidate(user_rule_ids)
+    for rule in rules:
+        if isinstance(rule, EngineRule) and (
+                user_rule_ids is None or
+                rule.user_rule.id in user_rule_ids):
+            rule.prefetch_actions()
+    return refresh_rules(rules, hour, schedule)
+
+
+def process_rules(rules, now, executor, due=lambda rule: True):
+    """
+    Process the C{rules} due at C{now}, and submit the resulting actions to
+    C{executor} in one batch.
+    """
+    actions = []
+    for rule in rules:
+        if rule.process_again and due(rule):
+            actions.extend(rule.process(now))
+    if actions:
+        executor.submit(actions)
+
+
 def run():
     last_hour = None
+    last_date = None
     rules = set()
+    schedule = RuleSchedule()
+    executor = ActionExecutor()
+    executor.start()
+    listening = None
+    changed = {}
 
     while True:
+        if listening is None or connection.connection is not listening:
+            # (re)connected; notifications may have been missed
+            listening = listen([RULES_CHANNEL])
+            last_date = None
+
         now = datetime.datetime.now(pytz.utc).replace(microsecond=0)
         hour = now.replace(minute=0, second=0, microsecond=0)
 
         # NOTE: new rules are taken in on next iteration --- we need to handle
         # "obsoleted" rules before updating the rule set to ensure that their
         # final action is executed.
-        for rule in rules:
-            if rule.process_again:
-                map(lambda action: action.execute(), rule.process(now))
+        process_rules(rules, now, executor)
+
+        if now.date() != last_date:
+            # recompiled daily, regardless of notifications
+            rules = apply_rule_changes(rules, hour, schedule, None)
+            last_date = now.date()
+            last_hour = hour
+        elif RULES_CHANNEL in changed:
+            rules = apply_rule_changes(
+                rules, hour, schedule, changed[RULES_CHANNEL])
+            last_hour = hour
+        elif hour != last_hour:
+            rules = refresh_rules(rules, hour, schedule)
+            last_hour = hour
+            logger.info('action queue wait: %s', executor.stats())
+
+        changed = wait_for_notifications(listening, 10)
+
 
-        if hour != last_hour:
-            rules = refresh_rules(rules, hour)
+def listen(channels):
+    """
+    Start listening for notifications on the given channels on the database
+    connection.
+
+    @return: The underlying database connection listened on.
+    """
+    cursor = connection.cursor()
+    for channel in channels:
+        cursor.execute('LISTEN {}'.format(channel))
+    return connection.connection
+
+
+def wait_for_notifications(pg_connection, timeout):
+    """
+    Wait up to C{timeout} seconds for notifications on C{pg_connection}.
+
+    @return: A dictionary from channel to the set of integer ids received
+    as payload on that channel.
+    """
+    if not pg_connection.notifies:
+        select.select([pg_connection], [], [], timeout)
+    pg_connection.poll()
+    result = {}
+    for notify in pg_connection.notifies:
+        result.setdefault(notify.channel, set()).add(int(notify.payload))
+    del pg_connection.notifies[:]
+    return result
+
+
+def run_event_driven():
+    """
+    Like L{run()}, but only process rules when new raw data has arrived for
+    their inputs, or when they are otherwise due; see
+    L{EngineRule.is_due()}.
+    """
+    last_hour = None
+    last_date = None
+    rules = set()
+    schedule = RuleSchedule()
+    executor = ActionExecutor()
+    executor.start()
+    listening = None
+    last_full_process = None
+    changed = {}
+
+    while True:
+        if listening is None or connection.connection is not listening:
+            # (re)connected; notifications may have been missed
+            listening = listen([RAW_DATA_CHANNEL, RULES_CHANNEL])
+            last_full_process = None
+            last_date = None
+
+        now = datetime.datetime.now(pytz.utc).replace(microsecond=0)
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        full_process = last_full_process is None or \
+            now - last_full_process >= FULL_PROCESS_INTERVAL
+
+        changed_datasource_ids = changed.get(RAW_DATA_CHANNEL, set())
+        process_rules(
+            rules, now, executor,
+            lambda rule: full_process or rule.is_due(
+                now, changed_datasource_ids, POLL_INTERVAL))
+
+        if full_process:
+            last_full_process = now
+
+        if now.date() != last_date:
+            rules = apply_rule_changes(rules, hour, schedule, None)
+            last_date = now.date()
+            last_hour = hour
+        elif RULES_CHANNEL in changed:
+            rules = apply_rule_changes(
+                rules, hour, schedule, changed[RULES_CHANNEL])
+            last_hour = hour
+        elif hour != last_hour:
+            rules = refresh_rules(rules, hour, schedule)
             last_hour = hour
+            logger.info('action queue wait: %s', executor.stats())
 
-        time.sleep(10)
+        changed = wait_for_notifications(listening, LISTEN_TIMEOUT)
+        if changed:
+            logger.debug('notifications: %s', changed)
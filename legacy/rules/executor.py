@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous execution of rule actions for the rule engine.
+
+Actions resulting from one iteration of the rule engine (a tick) are handed
+to an L{ActionExecutor} in one batch, and executed by worker threads, so
+that a slow SMTP server or SMS gateway does not delay the processing of
+other rules or the switching of relays.
+
+  - Each kind of action has its own channel, with its own queue and
+    workers; see L{CHANNELS}.
+
+  - Relay actions for the same meter are always executed by the same worker,
+    in the order they were submitted.  Within one tick, only the last relay
+    action for each meter is executed; the others would be overridden
+    immediately anyway.
+
+  - Each channel may be rate limited to a minimum interval between the
+    start of its actions; see L{ChannelSpec.min_interval}.
+
+  - The time actions wait in the queues is recorded; see
+    L{ActionExecutor.stats()}.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import logging
+import Queue
+import threading
+import time
+
+from django.db import connection
+
+from .models import EmailAction
+from .models import PhoneAction
+from .models import RelayAction
+
+logger = logging.getLogger(__name__)
+
+
+ChannelSpec = namedtuple(
+    'ChannelSpec', ['action_class', 'workers', 'min_interval'])
+"""
+@ivar action_class: The L{Action} subclass handled by the channel.
+@ivar workers: The number of worker threads of the channel.
+@ivar min_interval: Minimum number of seconds between the start of actions
+on the channel, across its workers; 0 for no limit.
+"""
+
+CHANNELS = {
+    'relay': ChannelSpec(RelayAction, workers=4, min_interval=0),
+    'email': ChannelSpec(EmailAction, workers=2, min_interval=0),
+    'phone': ChannelSpec(PhoneAction, workers=1, min_interval=1.0),
+}
+
+# Maximum number of actions queued per worker before submit() blocks.
+QUEUE_SIZE = 1000
+
+
+class RateLimiter(object):
+    """
+    Spaces the start of calls to L{wait()} at least C{min_interval} seconds
+    apart, across threads.
+    """
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self):
+        if not self.min_interval:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class WaitStats(object):
+    """
+    Number of actions executed, and the total and maximum time they waited
+    to be executed.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, waited):
+        with self._lock:
+            self.count += 1
+            self.total += waited
+            self.max = max(self.max, waited)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+            }
+
+
+class ActionExecutor(object):
+    """
+    Executes rule actions on worker threads; see module documentation.
+
+    @ivar coalesced: Number of relay actions dropped in favour of a later
+    relay action for the same meter in the same tick.
+    """
+    def __init__(self, channels=CHANNELS):
+        self._classes = []
+        self._queues = {}
+        self._limiters = {}
+        self._stats = {}
+        self._threads = []
+        self.coalesced = 0
+        for name, spec in channels.items():
+            self._classes.append((spec.action_class, name))
+            self._queues[name] = [
+                Queue.Queue(QUEUE_SIZE) for n in range(spec.workers)]
+            self._limiters[name] = RateLimiter(spec.min_interval)
+            self._stats[name] = WaitStats()
+
+    def start(self):
+        for name, queues in self._queues.items():
+            for n, queue in enumerate(queues):
+                thread = threading.Thread(
+                    target=self._work, args=(name, queue),
+                    name='%s-%d' % (name, n))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the workers once the actions submitted have been executed.
+        """
+        for queues in self._queues.values():
+            for queue in queues:
+                queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def join(self):
+        """
+        Wait for the actions submitted to be executed.
+        """
+        for queues in self._queues.values():
+            for queue in queues:
+                queue.join()
+
+    def _channel(self, action):
+        for action_class, name in self._classes:
+            if isinstance(action, action_class):
+                return name
+        raise ValueError('no channel for action %r' % (action,))
+
+    def submit(self, actions):
+        """
+        Queue the actions resulting from one tick of the rule engine for
+        execution.
+        """
+        submitted = time.time()
+        relay_actions = {}
+        for action in actions:
+            if isinstance(action, RelayAction):
+                if action.meter_id in relay_actions:
+                    self.coalesced += 1
+                relay_actions[action.meter_id] = action
+        for action in actions:
+            name = self._channel(action)
+            if isinstance(action, RelayAction):
+                if relay_actions.get(action.meter_id) is not action:
+                    continue
+                del relay_actions[action.meter_id]
+                queues = self._queues[name]
+                queue = queues[action.meter_id % len(queues)]
+            else:
+                # shortest queue; no ordering guarantees
+                queue = min(self._queues[name], key=Queue.Queue.qsize)
+            queue.put((submitted, action))
+
+    def _work(self, name, queue):
+        limiter = self._limiters[name]
+        stats = self._stats[name]
+        try:
+            while True:
+                item = queue.get()
+                if item is None:
+                    queue.task_done()
+                    return
+                submitted, action = item
+                try:
+                    limiter.wait()
+                    stats.add(time.time() - submitted)
+                    action.execute()
+                except Exception:
+                    logger.exception('%s action failed: %s', name, action)
+                finally:
+                    queue.task_done()
+        finally:
+            connection.close()
+
+    def stats(self):
+        """
+        @return: A dictionary from channel name to a dictionary of the
+        C{'count'} of actions executed, the C{'mean'} and C{'max'} seconds
+        they waited, and the number of actions currently C{'queued'}.
+        """
+        result = {}
+        for name, stats in self._stats.items():
+            result[name] = stats.snapshot()
+            result[name]['queued'] = sum(
+                queue.qsize() for queue in self._queues[name])
+        return result
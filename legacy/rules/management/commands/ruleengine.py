@@ -2,6 +2,7 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from optparse import make_option
 import traceback
 
 from django.core.management.base import BaseCommand
@@ -15,16 +16,30 @@ class Command(BaseCommand):
     args = ""
     help = "Run the Grid Platform rule engine"
 
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--event-driven',
+            action='store_true',
+            dest='event_driven',
+            default=False,
+            help='Process rules on notification of new raw data '
+            'rather than every 10 seconds'),
+    )
+
     def handle(self, *args, **kwargs):
         """
         """
+        if kwargs['event_driven']:
+            run = engine.run_event_driven
+        else:
+            run = engine.run
         become_daemon(out_log='ruleengine.log', err_log='ruleengine.err')
         for i in range(10):
             # limited "retries", to avoid mail-flood in case of recurring
             # exception
             try:
                 try:
-                    engine.run()
+                    run()
                 except Exception as e:
                     mail.mail_admins(
                         'Rule engine error: %s' % (e.__class__,),
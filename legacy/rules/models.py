@@ -32,17 +32,23 @@ from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
 from django.core import mail
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.db import models
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
 from django.utils.translation import ugettext_lazy as _
 
 from timezones2.models import TimeZoneField
 
 from gridplatform.customers.models import Customer
+from gridplatform.datasources.models import is_clock_hour
+from legacy.datasequence_adapters.models import AccumulationAdapterBase
 from legacy.devices.models import Meter
 from gridplatform.encryption.fields import EncryptedCharField
 from gridplatform.encryption.models import EncryptedModel
 from legacy.ipc import agentserver
 from legacy.measurementpoints.fields import DataRoleField
+from legacy.measurementpoints.models import DataSeries
 from gridplatform.trackuser import get_customer
 from gridplatform.trackuser.managers import CustomerBoundManager
 from gridplatform.trackuser import get_timezone
@@ -802,6 +808,25 @@ class InputInvariant(Invariant):
         return result
 
 
+def _generic_development(data_series, from_timestamp, to_timestamp):
+    """
+    Whether C{data_series.calculate_development(from_timestamp,
+    to_timestamp)} is computed by the generic L{DataSeries} implementation,
+    i.e. from the samples at C{from_timestamp} and C{to_timestamp}.
+    """
+    implementation = type(data_series).calculate_development.im_func
+    if implementation is DataSeries.calculate_development.im_func:
+        return True
+    # Falls back to the generic implementation unless both are clock hours.
+    return implementation is \
+        AccumulationAdapterBase.calculate_development.im_func and \
+        not (is_clock_hour(from_timestamp) and is_clock_hour(to_timestamp))
+
+
+# How long EngineRule.is_due() relies on EngineRule.input_datasource_ids().
+INPUT_DATASOURCE_IDS_LIFETIME = datetime.timedelta(minutes=15)
+
+
 class EngineRule(object):
     """
     A C{EngineRule} is the execution of a rule by acting on
@@ -832,6 +857,15 @@ class EngineRule(object):
         self.current_period = None
         self.process_again = True
         self.engine_controls_relays = engine_controls_relays
+        self.processed_at = None
+        self._input_datasource_ids = None
+        self._input_datasource_ids_traced_at = None
+        # Incremental state of input invariant checks, by index into
+        # input_invariants: {index: (from_time, sample)}
+        self._latest_samples = {}
+        self._development_origins = {}
+        # {execution_time: [action, ...]}; see prefetch_actions()
+        self._actions = None
 
     def __cmp__(self, other):
         """
@@ -866,6 +900,8 @@ class EngineRule(object):
         """
         Construct a list of actions with the given C{execution_time}.
         """
+        if self._actions is not None:
+            return list(self._actions[execution_time])
         actions = list(self.user_rule.emailaction_set.filter(
             execution_time=execution_time).distinct())
         actions.extend(list(self.user_rule.phoneaction_set.filter(
@@ -875,6 +911,21 @@ class EngineRule(object):
                 execution_time=execution_time).distinct()))
         return actions
 
+    def prefetch_actions(self):
+        """
+        Load the actions of this rule now, rather than on each state
+        transition; call again to reload them after they have changed.
+        """
+        action_sets = [self.user_rule.emailaction_set,
+                       self.user_rule.phoneaction_set]
+        if self.engine_controls_relays:
+            action_sets.append(self.user_rule.relayaction_set)
+        actions = {Action.INITIAL: [], Action.FINAL: []}
+        for action_set in action_sets:
+            for action in action_set.all():
+                actions[action.execution_time].append(action)
+        self._actions = actions
+
     def __check_input_invariants(self, from_time, now):
         """
         Check that our input_invariants are met by all inputs.
@@ -882,24 +933,132 @@ class EngineRule(object):
         @return: C{False} if any input invariant is violated.
         C{True} otherwise.
         """
-        for input_invariant in self.input_invariants:
+        for index, input_invariant in enumerate(self.input_invariants):
             data_series = input_invariant.data_series.subclass_instance
-            from_time
             assert from_time <= now
             if data_series.is_rate():
-                measurement = data_series.latest_sample(
-                    from_timestamp=from_time,
-                    to_timestamp=now)
+                value = self.__latest_value(
+                    index, data_series, from_time, now)
             else:
                 assert data_series.is_accumulation()
-                measurement = data_series.calculate_development(
-                    from_timestamp=from_time,
-                    to_timestamp=now)
-            if not measurement or not input_invariant.compare_value(
-                    measurement.physical_quantity):
+                value = self.__development_value(
+                    index, data_series, from_time, now)
+            if value is None or not input_invariant.compare_value(value):
                 return False
         return True
 
+    def __latest_value(self, index, data_series, from_time, now):
+        """
+        The value of the latest sample of C{data_series} in the interval
+        M{[C{from_time}, C{now}]}.
+
+        The latest sample found for the same C{from_time} on a previous check
+        is remembered, and only the interval from that onwards is searched
+        for a later sample.
+        """
+        previous_from_time, previous = self._latest_samples.get(
+            index, (None, None))
+        if previous is not None and previous_from_time == from_time and \
+                previous.timestamp <= now:
+            sample = data_series.latest_sample(
+                from_timestamp=previous.timestamp,
+                to_timestamp=now) or previous
+        else:
+            sample = data_series.latest_sample(
+                from_timestamp=from_time,
+                to_timestamp=now)
+        if sample is None:
+            self._latest_samples.pop(index, None)
+            return None
+        self._latest_samples[index] = (from_time, sample)
+        return sample.physical_quantity
+
+    def __development_value(self, index, data_series, from_time, now):
+        """
+        The development of C{data_series} from C{from_time} to C{now}.
+
+        For data series using the generic
+        L{DataSeries.calculate_development()}, that is the difference of the
+        samples at C{from_time} and at C{now}; the former is remembered
+        between checks in the same execution period, unless extrapolated.
+        """
+        if not _generic_development(data_series, from_time, now):
+            measurement = data_series.calculate_development(
+                from_timestamp=from_time,
+                to_timestamp=now)
+            if measurement is None:
+                return None
+            return measurement.physical_quantity
+
+        origin_from_time, from_sample = self._development_origins.get(
+            index, (None, None))
+        if from_sample is None or origin_from_time != from_time:
+            from_sample = next(
+                iter(data_series.get_samples(from_time, from_time)), None)
+            if from_sample is None:
+                return None
+            if from_sample.cachable:
+                self._development_origins[index] = (from_time, from_sample)
+        to_sample = next(iter(data_series.get_samples(now, now)), None)
+        if to_sample is None:
+            return None
+        return to_sample.physical_quantity - from_sample.physical_quantity
+
+    def input_datasource_ids(self):
+        """
+        The ids of the data sources that the input invariants of this rule
+        read, through the data series of the invariants and the data series
+        they depend on.
+
+        @return: A set of data source ids, or C{None} if the inputs of some
+        invariant cannot be traced to data sources.
+        """
+        datasource_ids = set()
+        for input_invariant in self.input_invariants:
+            data_series = input_invariant.data_series.subclass_instance
+            traced = False
+            for series in [data_series] + list(data_series.depends_on()):
+                datasequence = getattr(series, 'datasequence', None)
+                if datasequence is None:
+                    continue
+                traced = True
+                for period in datasequence.period_set.all():
+                    period = getattr(period, 'subclass_instance', period)
+                    datasource_id = getattr(period, 'datasource_id', None)
+                    if datasource_id is not None:
+                        datasource_ids.add(datasource_id)
+            if not traced:
+                return None
+        return datasource_ids
+
+    def is_due(self, now, changed_datasource_ids, poll_interval):
+        """
+        Whether calling L{process()} at C{now} may have any effect, given
+        that new data has arrived for C{changed_datasource_ids} since the
+        previous check; i.e. if an execution period starts or ends after
+        the previous call to L{process()}, or if new data has arrived for
+        the input invariants.  Rules with inputs not traceable to data
+        sources are due every C{poll_interval}.
+        """
+        if self.processed_at is None:
+            return True
+        for from_time, to_time in self.execution_periods:
+            if self.processed_at < from_time <= now or \
+                    self.processed_at < to_time <= now:
+                return True
+        if not self.input_invariants:
+            return False
+        # Periods may be added to the inputs while the rule is active.
+        if self._input_datasource_ids_traced_at is None or \
+                now - self._input_datasource_ids_traced_at >= \
+                INPUT_DATASOURCE_IDS_LIFETIME:
+            self._input_datasource_ids = self.input_datasource_ids()
+            self._input_datasource_ids_traced_at = now
+        datasource_ids = self._input_datasource_ids
+        if datasource_ids is None:
+            return now - self.processed_at >= poll_interval
+        return not datasource_ids.isdisjoint(changed_datasource_ids)
+
     def process(self, now):
         """
         Process input invariants against recent measurement data.
@@ -912,6 +1071,7 @@ class EngineRule(object):
         """
 
         result = []
+        self.processed_at = now
         if self.current_period:
             from_time, to_time = self.current_period
             if now >= to_time or not self.__check_input_invariants(
@@ -996,6 +1156,14 @@ class AgentRule(object):
         return b"AgentRule(%r, %r)" % (self.activation_time,
                                        self.relay_action)
 
+    def is_due(self, now, changed_datasource_ids, poll_interval):
+        """
+        Whether calling L{process()} at C{now} may have any effect.
+
+        @see: L{EngineRule.is_due()}
+        """
+        return now >= self.activation_time
+
     def process(self, now):
         """
         Process the scheduled C{RelayAction} against current time.  If
@@ -1011,3 +1179,37 @@ class AgentRule(object):
             self.process_again = False
             return [self.relay_action]
         return []
+
+
+#: PostgreSQL NOTIFY channel on which the ids of changed L{UserRule}s are
+#: announced, for the rule engine to recompile their schedule.
+RULES_CHANNEL = 'rules_userrule'
+
+
+def notify_rule_changed(user_rule_id):
+    """
+    Announce that the L{UserRule} with the given id, or its actions,
+    invariants or date exceptions, changed.  Delivered when the current
+    transaction commits.
+    """
+    cursor = connection.cursor()
+    cursor.execute(
+        'SELECT pg_notify(%s, %s)', [RULES_CHANNEL, unicode(user_rule_id)])
+
+
+def _user_rule_changed(sender, instance, **kwargs):
+    notify_rule_changed(instance.id)
+
+
+def _user_rule_part_changed(sender, instance, **kwargs):
+    notify_rule_changed(instance.rule_id)
+
+
+for _model in [UserRule, MinimizeRule, TriggeredRule]:
+    post_save.connect(_user_rule_changed, sender=_model)
+    post_delete.connect(_user_rule_changed, sender=_model)
+
+for _model in [DateException, RelayAction, EmailAction, PhoneAction,
+               IndexInvariant, InputInvariant]:
+    post_save.connect(_user_rule_part_changed, sender=_model)
+    post_delete.connect(_user_rule_part_changed, sender=_model)
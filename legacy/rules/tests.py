@@ -20,6 +20,8 @@ import pytz
 
 from gridplatform import trackuser
 from gridplatform.customers.models import Customer
+from legacy.datasequence_adapters.models import \
+    ConsumptionAccumulationAdapter
 from legacy.devices.models import Agent, Meter
 from legacy.measurementpoints.fields import DataRoleField
 from gridplatform.utils import utilitytypes
@@ -37,10 +39,12 @@ from .models import (
     InputInvariant,
     IndexInvariant,
     AgentRule,
+    EngineRule,
     TURN_ON,
     TURN_OFF,
     agentserver)
 from . import engine
+from .executor import ActionExecutor
 
 
 class TestCase(DjangoTestCase):
@@ -137,6 +141,16 @@ class AgentRuleTest(TestCase):
         self.assertEqual(unit1, unit1)
         self.assertTrue(unit1 != unit2)
 
+    def test_is_due(self):
+        activation_time = datetime.datetime(2012, 10, 4, 12, tzinfo=pytz.utc)
+        unit = AgentRule(
+            activation_time,
+            RelayAction(meter=self.meter, relay_action=TURN_OFF))
+        interval = datetime.timedelta(seconds=10)
+        self.assertFalse(unit.is_due(
+            activation_time - datetime.timedelta(seconds=1), set(), interval))
+        self.assertTrue(unit.is_due(activation_time, set(), interval))
+
 
 class InvariantTest(TestCase):
     """
@@ -432,6 +446,202 @@ class TestEngine(TestCase):
             [(self.meter.connection_type, self.meter.manufactoring_id)],
             TURN_ON)
 
+    def test_engine_rule_is_due(self):
+        """
+        Test that an engine rule is due when first processed, at the end of
+        its execution period, and periodically when its inputs cannot be
+        traced to data sources.
+        """
+        ds = DataSeries.objects.create(
+            role=DataRoleField.ABSOLUTE_TEMPERATURE,
+            unit='millikelvin',
+            customer=self.customer,
+            utility_type=utilitytypes.OPTIONAL_METER_CHOICES.unknown)
+
+        rule = TriggeredRule.objects.create(
+            name_plain='test rule',
+            timezone='Europe/Copenhagen',
+            from_time=datetime.time(0),
+            to_time=datetime.time(23),
+            customer=self.customer)
+
+        rule.inputinvariant_set.create(
+            data_series=ds,
+            value=1,
+            operator=Invariant.LT,
+            unit='celsius')
+
+        engine_rule, = rule.generate_rules(
+            datetime.datetime(2013, 1, 1, 1, tzinfo=pytz.utc))
+        (from_time, to_time), = engine_rule.execution_periods
+        interval = datetime.timedelta(seconds=10)
+        now = from_time + datetime.timedelta(hours=1)
+
+        # stored data; not traceable to data sources
+        self.assertIsNone(engine_rule.input_datasource_ids())
+        self.assertTrue(engine_rule.is_due(now, set(), interval))
+
+        engine_rule.process(now)
+        self.assertFalse(engine_rule.is_due(
+            now + datetime.timedelta(seconds=5), set(), interval))
+        self.assertTrue(engine_rule.is_due(now + interval, set(), interval))
+        engine_rule.process(to_time - datetime.timedelta(seconds=1))
+        self.assertTrue(engine_rule.is_due(to_time, set(), interval))
+
+
+def _sample(timestamp, value, cachable=True):
+    return Mock(
+        timestamp=timestamp,
+        physical_quantity=PhysicalQuantity(value, 'milliwatt*hour'),
+        cachable=cachable)
+
+
+class EngineRuleInputInvariantTest(TestCase):
+    """
+    Test the incremental state kept by L{EngineRule} between checks of its
+    input invariants.
+    """
+
+    def setUp(self):
+        self.engine_rule = EngineRule([], [], Mock(), False)
+        self.from_time = datetime.datetime(2013, 1, 1, 1, tzinfo=pytz.utc)
+        self.data_series = DataSeries(
+            role=DataRoleField.CONSUMPTION, unit='milliwatt*hour')
+
+    def latest_value(self, from_time, now):
+        return self.engine_rule._EngineRule__latest_value(
+            0, self.data_series, from_time, now)
+
+    def development_value(self, from_time, now):
+        return self.engine_rule._EngineRule__development_value(
+            0, self.data_series, from_time, now)
+
+    def test_latest_value_remembered(self):
+        first = _sample(self.from_time + datetime.timedelta(minutes=1), 42)
+        now = self.from_time + datetime.timedelta(minutes=2)
+        later = now + datetime.timedelta(minutes=1)
+        with patch.object(self.data_series, 'latest_sample',
+                          side_effect=[first, None]) as latest_sample:
+            self.assertEqual(
+                self.latest_value(self.from_time, now),
+                PhysicalQuantity(42, 'milliwatt*hour'))
+            # nothing newer; the remembered sample is still the latest
+            self.assertEqual(
+                self.latest_value(self.from_time, later),
+                PhysicalQuantity(42, 'milliwatt*hour'))
+        self.assertEqual(
+            latest_sample.call_args_list[1][1],
+            {'from_timestamp': first.timestamp, 'to_timestamp': later})
+
+    def test_latest_value_reset_on_from_time(self):
+        first = _sample(self.from_time + datetime.timedelta(minutes=1), 42)
+        next_from_time = self.from_time + datetime.timedelta(hours=1)
+        now = next_from_time + datetime.timedelta(minutes=2)
+        with patch.object(self.data_series, 'latest_sample',
+                          side_effect=[first, None]) as latest_sample:
+            self.latest_value(self.from_time, now)
+            self.assertIsNone(self.latest_value(next_from_time, now))
+        self.assertEqual(
+            latest_sample.call_args_list[1][1],
+            {'from_timestamp': next_from_time, 'to_timestamp': now})
+        self.assertEqual(self.engine_rule._latest_samples, {})
+
+    def test_development_origin_remembered(self):
+        now = self.from_time + datetime.timedelta(minutes=5)
+        later = now + datetime.timedelta(minutes=5)
+        samples = {
+            self.from_time: _sample(self.from_time, 100),
+            now: _sample(now, 130),
+            later: _sample(later, 170),
+        }
+        with patch.object(
+                self.data_series, 'get_samples',
+                side_effect=lambda from_timestamp, to_timestamp:
+                [samples[from_timestamp]]) as get_samples:
+            self.assertEqual(
+                self.development_value(self.from_time, now),
+                PhysicalQuantity(30, 'milliwatt*hour'))
+            self.assertEqual(
+                self.development_value(self.from_time, later),
+                PhysicalQuantity(70, 'milliwatt*hour'))
+        # the origin is only read on the first check
+        self.assertEqual(
+            [args for args, kwargs in get_samples.call_args_list],
+            [(self.from_time, self.from_time), (now, now), (later, later)])
+
+    def test_development_origin_reset_on_from_time(self):
+        next_from_time = self.from_time + datetime.timedelta(hours=1)
+        now = next_from_time + datetime.timedelta(minutes=5)
+        samples = {
+            self.from_time: _sample(self.from_time, 100),
+            next_from_time: _sample(next_from_time, 150),
+            now: _sample(now, 160),
+        }
+        with patch.object(
+                self.data_series, 'get_samples',
+                side_effect=lambda from_timestamp, to_timestamp:
+                [samples[from_timestamp]]):
+            self.development_value(self.from_time, now)
+            self.assertEqual(
+                self.development_value(next_from_time, now),
+                PhysicalQuantity(10, 'milliwatt*hour'))
+        self.assertEqual(
+            self.engine_rule._development_origins[0],
+            (next_from_time, samples[next_from_time]))
+
+    def test_extrapolated_origin_not_remembered(self):
+        now = self.from_time + datetime.timedelta(minutes=5)
+        extrapolated = _sample(self.from_time, 100, cachable=False)
+        with patch.object(
+                self.data_series, 'get_samples',
+                side_effect=lambda from_timestamp, to_timestamp:
+                [extrapolated if from_timestamp == self.from_time
+                 else _sample(now, 130)]) as get_samples:
+            self.assertEqual(
+                self.development_value(self.from_time, now),
+                PhysicalQuantity(30, 'milliwatt*hour'))
+            self.development_value(self.from_time, now)
+        self.assertEqual(self.engine_rule._development_origins, {})
+        self.assertEqual(
+            [args for args, kwargs in get_samples.call_args_list],
+            [(self.from_time, self.from_time), (now, now)] * 2)
+
+    def test_development_accumulation_adapter_clock_hours(self):
+        self.data_series = ConsumptionAccumulationAdapter(
+            role=DataRoleField.CONSUMPTION, unit='milliwatt*hour')
+        now = self.from_time + datetime.timedelta(hours=2)
+        with patch.object(
+                self.data_series, 'calculate_development',
+                return_value=Mock(physical_quantity=PhysicalQuantity(
+                    7, 'milliwatt*hour'))) as calculate_development, \
+                patch.object(self.data_series, 'get_samples') as get_samples:
+            self.assertEqual(
+                self.development_value(self.from_time, now),
+                PhysicalQuantity(7, 'milliwatt*hour'))
+            calculate_development.return_value = None
+            self.assertIsNone(self.development_value(self.from_time, now))
+        calculate_development.assert_called_with(
+            from_timestamp=self.from_time, to_timestamp=now)
+        self.assertFalse(get_samples.called)
+        self.assertEqual(self.engine_rule._development_origins, {})
+
+    def test_development_accumulation_adapter_within_hour(self):
+        self.data_series = ConsumptionAccumulationAdapter(
+            role=DataRoleField.CONSUMPTION, unit='milliwatt*hour')
+        now = self.from_time + datetime.timedelta(minutes=5)
+        samples = {
+            self.from_time: _sample(self.from_time, 100),
+            now: _sample(now, 105),
+        }
+        with patch.object(
+                self.data_series, 'get_samples',
+                side_effect=lambda from_timestamp, to_timestamp:
+                [samples[from_timestamp]]):
+            self.assertEqual(
+                self.development_value(self.from_time, now),
+                PhysicalQuantity(5, 'milliwatt*hour'))
+        self.assertIn(0, self.engine_rule._development_origins)
+
 
 @override_settings(ENCRYPTION_TESTMODE=True)
 class TestEngineRefreshRules(TestCase):
@@ -529,3 +739,84 @@ class TestEngineRefreshRules(TestCase):
         self.assertNotEqual(
             self.rules,
             engine.refresh_rules(self.rules, self.hour))
+
+    def test_schedule_no_changes(self):
+        schedule = engine.RuleSchedule()
+        self.assertEqual(
+            self.rules,
+            engine.refresh_rules(self.rules, self.hour, schedule))
+        self.assertEqual(
+            self.rules,
+            engine.refresh_rules(
+                self.rules, self.hour + datetime.timedelta(hours=1),
+                schedule))
+        self.assertEqual(schedule.generated, 1)
+
+    def test_schedule_changed_input_invariant_value(self):
+        schedule = engine.RuleSchedule()
+        engine.refresh_rules(self.rules, self.hour, schedule)
+        self.input_invariant.value = 2
+        self.input_invariant.save()
+        self.assertEqual(
+            self.rules,
+            engine.refresh_rules(self.rules, self.hour, schedule))
+        schedule.invalidate([self.input_invariant.rule_id])
+        self.assertNotEqual(
+            self.rules,
+            engine.refresh_rules(self.rules, self.hour, schedule))
+        self.assertEqual(schedule.generated, 2)
+
+    def test_schedule_next_day(self):
+        schedule = engine.RuleSchedule()
+        engine.refresh_rules(self.rules, self.hour, schedule)
+        next_day = self.hour + datetime.timedelta(days=1)
+        self.assertEqual(
+            set(engine.get_engine_rules(next_day)),
+            engine.refresh_rules(self.rules, next_day, schedule))
+        self.assertEqual(schedule.generated, 2)
+
+
+class ActionExecutorTest(TestCase):
+    def setUp(self):
+        self.executed = []
+        self.executor = ActionExecutor()
+        self.executor.start()
+
+    def tearDown(self):
+        self.executor.stop()
+
+    def relay_action(self, meter_id, relay_action):
+        action = Mock(spec=RelayAction)
+        action.meter_id = meter_id
+        action.execute.side_effect = lambda: self.executed.append(
+            (meter_id, relay_action))
+        return action
+
+    def test_coalesce_relay_actions(self):
+        self.executor.submit([
+            self.relay_action(1, TURN_ON),
+            self.relay_action(2, TURN_ON),
+            self.relay_action(1, TURN_OFF),
+        ])
+        self.executor.join()
+        self.assertEqual(
+            sorted(self.executed), [(1, TURN_OFF), (2, TURN_ON)])
+        self.assertEqual(self.executor.coalesced, 1)
+        self.assertEqual(self.executor.stats()['relay']['count'], 2)
+
+    def test_relay_actions_ordered_per_meter(self):
+        for n in range(20):
+            self.executor.submit([
+                self.relay_action(meter_id, n) for meter_id in range(8)])
+        self.executor.join()
+        for meter_id in range(8):
+            self.assertEqual(
+                [n for m, n in self.executed if m == meter_id], range(20))
+
+    def test_failing_action(self):
+        email_action = Mock(spec=EmailAction)
+        email_action.execute.side_effect = Exception('SMTP down')
+        self.executor.submit([email_action, self.relay_action(1, TURN_ON)])
+        self.executor.join()
+        self.assertEqual(self.executed, [(1, TURN_ON)])
+        self.assertEqual(self.executor.stats()['email']['count'], 1)
@@ -78,6 +78,7 @@ def send_agent_rules(agent_rules):
     agent_rules = itertools.groupby(sorted(agent_rules, key=get_agent_id),
                                     get_agent)
 
+    messages = []
     for agent, rules in agent_rules:
         grouped = itertools.groupby(sorted(rules, key=get_meter_id), get_meter)
 
@@ -86,4 +87,5 @@ def send_agent_rules(agent_rules):
             for relay, rules in grouped}
         rulesets = [([(meter.connection_type, meter.manufactoring_id)], rules)
                     for meter, rules in relay_rules.iteritems()]
-        agentserver.agent_rules(agent.mac, rulesets)
+        messages.append(agentserver.agent_rules_message(agent.mac, rulesets))
+    agentserver.send_messages(messages)
@@ -103,6 +103,9 @@ def agent_update(request, pk=None):
                 meter.joined = False
                 meter.save()
         agent.save()
+        if instance is not None and agent.customer != original_customer \
+                and agent.online:
+            agentserver.inputs_changed(agent.mac)
         return {
             'success': True,
             'statusText': _('The agent has been saved'),